@@ -0,0 +1,82 @@
+# artifact_io.py - パイプライン成果物・設定JSONの共通シリアライザ
+import gzip
+import json
+import os
+import threading
+
+# global_config.json の "artifact_format" に指定できる値
+ARTIFACT_FORMATS = ("pretty", "compact", "compact_gzip")
+DEFAULT_ARTIFACT_FORMAT = "pretty"
+
+GLOBAL_CONFIG_PATH = os.path.join("config", "global_config.json")
+GZIP_MAGIC = b"\x1f\x8b"
+
+_format_cache = {"mtime_ns": None, "format": DEFAULT_ARTIFACT_FORMAT}
+_format_lock = threading.Lock()
+
+
+def get_artifact_format() -> str:
+    """グローバル設定の出力形式を取得（ファイル更新時のみ読み直す）"""
+    try:
+        mtime_ns = os.stat(GLOBAL_CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return DEFAULT_ARTIFACT_FORMAT
+
+    with _format_lock:
+        if _format_cache["mtime_ns"] != mtime_ns:
+            try:
+                artifact_format = load_json_artifact(GLOBAL_CONFIG_PATH).get("artifact_format", DEFAULT_ARTIFACT_FORMAT)
+            except Exception as e:
+                print(f"出力形式の読み込みエラー: {str(e)}")
+                artifact_format = DEFAULT_ARTIFACT_FORMAT
+            if artifact_format not in ARTIFACT_FORMATS:
+                print(f"不明な出力形式のためデフォルトを使用: {artifact_format}")
+                artifact_format = DEFAULT_ARTIFACT_FORMAT
+            _format_cache["mtime_ns"] = mtime_ns
+            _format_cache["format"] = artifact_format
+        return _format_cache["format"]
+
+
+def dump_json_artifact(data, path, artifact_format=None, allow_gzip=True):
+    """設定された形式でJSONを書き出す
+
+    pretty: indent=2 / compact: 区切りの空白なし / compact_gzip: compact + gzip圧縮
+    allow_gzip=False の場合（手で編集する設定ファイルなど）はgzipをcompactに落とす。
+    ファイル名は形式によらず同じで、読み込み側は load_json_artifact が自動判別する。
+    一時ファイルに書き込んでから os.replace で置き換える。
+    """
+    artifact_format = artifact_format or get_artifact_format()
+    if artifact_format == "compact_gzip" and not allow_gzip:
+        artifact_format = "compact"
+
+    if artifact_format == "pretty":
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+    # 一時ファイルに書いてから置き換え、途中で落ちても書きかけのファイルを残さない
+    # （同じパスへ複数のスレッド・プロセスが書き込んでも一時ファイルが重ならないよう名前に含める）
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        if artifact_format == "compact_gzip":
+            with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+                f.write(text.encode('utf-8'))
+        else:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_json_artifact(path):
+    """JSONを読み込む（gzip圧縮かどうかは先頭バイトで自動判別）"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:2] == GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    return json.loads(raw.decode('utf-8-sig'))
@@ -7,6 +7,145 @@ import uuid
 import threading
 import websocket
 import time
+import copy
+from artifact_io import dump_json_artifact, load_json_artifact
+
+
+class SpecialUserRegistry:
+    """SpecialUser/配下のユーザー設定をプロセス内で共有するキャッシュ
+
+    ディレクトリ一覧と各 config.json の内容を保持し、SpecialUser/ または config.json の
+    更新時刻が変わったとき（確認は CHECK_INTERVAL 秒ごと）か invalidate() が呼ばれたときだけ読み直す。
+    Step02・GUI・NCVCommentServer は HierarchicalConfigManager 経由でこのインスタンスを共有する。
+    """
+    _global_instance = None
+    _global_lock = threading.Lock()
+
+    CHECK_INTERVAL = 2.0  # 更新時刻を確認する間隔（秒）
+
+    def __init__(self, root: Path = Path("SpecialUser")):
+        self.root = root
+        self.lock = threading.RLock()
+        self.directories = []  # get_all_user_directories() と同じ形式（ディレクトリ順）
+        self.configs = {}      # directory_name → {"mtime_ns": ..., "config": ...}
+        self.root_mtime_ns = None
+        self.last_checked = 0.0
+        self.dirty = True
+
+    @classmethod
+    def get_instance(cls):
+        """プロセス共通のインスタンスを取得"""
+        with cls._global_lock:
+            if cls._global_instance is None:
+                cls._global_instance = cls()
+            return cls._global_instance
+
+    def invalidate(self, user_id: str = None):
+        """キャッシュを無効化（user_id指定時はそのユーザーの設定のみ読み直す）"""
+        with self.lock:
+            if user_id is None:
+                self.dirty = True
+                self.configs.clear()
+            else:
+                for user_dir in self.directories:
+                    if user_dir["user_id"] == user_id:
+                        self.configs.pop(user_dir["directory_name"], None)
+                # ディレクトリ名（表示名）が変わっている可能性があるので一覧も確認
+                self.dirty = True
+
+    def get_directories(self) -> list:
+        """ユーザーディレクトリ一覧を取得"""
+        with self.lock:
+            self._refresh()
+            return [dict(user_dir) for user_dir in self.directories]
+
+    def find_directory(self, user_id: str):
+        """user_idの（最初に見つかった）ユーザーディレクトリを取得"""
+        with self.lock:
+            self._refresh()
+            for user_dir in self.directories:
+                if user_dir["user_id"] == user_id:
+                    return dict(user_dir)
+        return None
+
+    def get_config(self, directory_name: str, default_factory):
+        """ディレクトリのconfig.jsonを取得（呼び出し側で変更できるようコピーを返す）"""
+        with self.lock:
+            self._refresh()
+            entry = self.configs.get(directory_name)
+            if entry is None:
+                entry = self._load_config(directory_name, default_factory)
+            return copy.deepcopy(entry["config"])
+
+    def _refresh(self):
+        """ディレクトリ一覧・config.jsonの更新時刻を確認し、変わっていれば読み直す"""
+        now = time.monotonic()
+        if not self.dirty and now - self.last_checked < self.CHECK_INTERVAL:
+            return
+        self.last_checked = now
+
+        try:
+            root_mtime_ns = self.root.stat().st_mtime_ns
+        except OSError:
+            root_mtime_ns = None
+
+        if self.dirty or root_mtime_ns != self.root_mtime_ns:
+            self.directories = self._scan_directories()
+            names = {user_dir["directory_name"] for user_dir in self.directories}
+            for directory_name in list(self.configs):
+                if directory_name not in names:
+                    del self.configs[directory_name]
+            self.root_mtime_ns = root_mtime_ns
+            self.dirty = False
+
+        # 外部（別プロセス・手動編集）で更新されたconfig.jsonは破棄して次回読み直す
+        for directory_name, entry in list(self.configs.items()):
+            if self._config_mtime_ns(directory_name) != entry["mtime_ns"]:
+                del self.configs[directory_name]
+
+    def _scan_directories(self) -> list:
+        if not self.root.exists():
+            return []
+
+        user_dirs = []
+        for item in self.root.iterdir():
+            if item.is_dir() and "_" in item.name:
+                try:
+                    user_id_part = item.name.split("_")[0]
+                    display_name_part = "_".join(item.name.split("_")[1:])
+                    user_dirs.append({
+                        "user_id": user_id_part,
+                        "display_name": display_name_part,
+                        "directory_name": item.name,
+                        "path": item
+                    })
+                except:
+                    continue
+        return user_dirs
+
+    def _config_mtime_ns(self, directory_name: str):
+        try:
+            return (self.root / directory_name / "config.json").stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_config(self, directory_name: str, default_factory) -> dict:
+        config_path = self.root / directory_name / "config.json"
+        mtime_ns = self._config_mtime_ns(directory_name)
+        config = None
+        if mtime_ns is not None:
+            try:
+                config = load_json_artifact(config_path)
+            except Exception as e:
+                print(f"ユーザー設定読み込みエラー ({config_path}): {str(e)}")
+        if config is None:
+            # デフォルト設定はキャッシュしない（config.json作成時に読み直すため）
+            return {"mtime_ns": mtime_ns, "config": default_factory()}
+
+        entry = {"mtime_ns": mtime_ns, "config": config}
+        self.configs[directory_name] = entry
+        return entry
+
 
 class HierarchicalConfigManager:
     def __init__(self):
@@ -18,11 +157,13 @@ class HierarchicalConfigManager:
         # 設定ディレクトリ作成
         self.config_root.mkdir(exist_ok=True)
 
+        # ユーザー設定のプロセス共通キャッシュ
+        self.user_registry = SpecialUserRegistry.get_instance()
+
     def load_global_config(self) -> dict:
         """グローバル設定を読み込み"""
         if self.global_config_path.exists():
-            with open(self.global_config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_artifact(self.global_config_path)
 
         # デフォルトグローバル設定
         default_config = {
@@ -30,6 +171,15 @@ class HierarchicalConfigManager:
             "monitor_enabled": True,
             "check_interval_minutes": 5,
             "retry_count": 3,
+            "artifact_format": "pretty",  # pretty / compact / compact_gzip
+            # Step01で comments.json と同じ場所に comments.bin（XMLが変わらなければ再解析しない）を書き出す
+            "comment_cache_settings": {"enabled": True},
+            # AI分析プロンプトログ（logs/ai_prompts、ファイルごと・合計の上限MB）
+            "prompt_log_settings": {"enabled": True, "max_file_mb": 5, "max_total_mb": 200},
+            # 一覧ページ（list.html）のコメント表を「コメントを表示」時に comments/{lv}.js から読み込む
+            "list_page_settings": {"lazy_comment_tables": True},
+            # Step03でユーザーごとのHTML・JSONを並列に生成するスレッド数（0はCPU数、1は逐次）
+            "html_generation_settings": {"max_workers": 0},
             "api_settings": {
                 "summary_ai_model": "openai-gpt4o",
                 "openai_api_key": "",
@@ -39,7 +189,21 @@ class HierarchicalConfigManager:
                 "response_api_key": "",
                 "response_default_prompt": "以下のコメントに対して、{{display_name}}として自然で親しみやすい返答をしてください。コメント: {{comment_content}}",
                 "response_max_characters": 100,
-                "response_split_delay_seconds": 1
+                "response_split_delay_seconds": 1,
+                # AI分析リクエストの上限（全パイプライン共通、0は無制限）
+                "ai_rate_limits": {
+                    "openai": {"max_concurrency": 4, "requests_per_minute": 60, "tokens_per_minute": 60000},
+                    "gemini": {"max_concurrency": 4, "requests_per_minute": 60, "tokens_per_minute": 120000},
+                    "max_retries": 4,
+                    "backoff_base_seconds": 2.0,
+                    "backoff_max_seconds": 60.0
+                },
+                # AI分析プロンプトのトークン予算（超える場合はコメントを抽出、0は無制限）
+                "prompt_token_budget": 6000,
+                # コメントの少ないユーザーを1リクエストでまとめて分析（デフォルトプロンプトのユーザーのみ）
+                "batch_analysis": {"enabled": False, "max_comments_per_user": 5, "max_users_per_batch": 8},
+                # AI分析結果のキャッシュ（data/ai_analysis_cache.db）
+                "ai_cache": {"enabled": True, "max_entries": 5000, "max_age_days": 90}
             },
             "special_users_config": {
                 "users": {}
@@ -89,8 +253,7 @@ class HierarchicalConfigManager:
             # ステップ3: 完全な設定を保存
             print(f"[DEBUG] Saving global config...")
             current_config["last_updated"] = datetime.now().isoformat()
-            with open(self.global_config_path, 'w', encoding='utf-8') as f:
-                json.dump(current_config, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(current_config, self.global_config_path, allow_gzip=False)
             print(f"[DEBUG] Global config save completed successfully")
             return True
         except Exception as e:
@@ -110,8 +273,7 @@ class HierarchicalConfigManager:
             # フォールバック: 直接保存
             print(f"[WARNING] Using fallback global config save")
             config["last_updated"] = datetime.now().isoformat()
-            with open(self.global_config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(config, self.global_config_path, allow_gzip=False)
 
     # 既存互換性のため
     def load_config(self):
@@ -189,26 +351,25 @@ class HierarchicalConfigManager:
         """特定のユーザー設定を取得（新しい形式を優先）"""
         # まず新しい場所から読み込みを試行
         try:
-            user_dirs = self.get_all_user_directories()
-            for user_dir in user_dirs:
-                if user_dir["user_id"] == user_id:
-                    display_name = user_dir["display_name"]
-                    new_config = self.load_user_config_from_directory(user_id, display_name)
-
-                    # 旧形式との互換性のために変換（enabledフラグも含める）
-                    return {
-                        "user_id": user_id,
-                        "display_name": display_name,
-                        "enabled": new_config.get("user_info", {}).get("enabled", True),
-                        "description": new_config.get("user_info", {}).get("description", ""),
-                        "tags": new_config.get("user_info", {}).get("tags", []),
-                        "ai_analysis": new_config.get("ai_analysis", {}),
-                        "default_response": new_config.get("default_response", {}),
-                        "broadcasters": new_config.get("broadcasters", {}),
-                        "special_triggers": new_config.get("special_triggers", []),
-                        "special_triggers_enabled": new_config.get("special_triggers_enabled", False),
-                        "metadata": new_config.get("metadata", {})
-                    }
+            user_dir = self.user_registry.find_directory(user_id)
+            if user_dir:
+                display_name = user_dir["display_name"]
+                new_config = self.load_user_config_from_directory(user_id, display_name)
+
+                # 旧形式との互換性のために変換（enabledフラグも含める）
+                return {
+                    "user_id": user_id,
+                    "display_name": display_name,
+                    "enabled": new_config.get("user_info", {}).get("enabled", True),
+                    "description": new_config.get("user_info", {}).get("description", ""),
+                    "tags": new_config.get("user_info", {}).get("tags", []),
+                    "ai_analysis": new_config.get("ai_analysis", {}),
+                    "default_response": new_config.get("default_response", {}),
+                    "broadcasters": new_config.get("broadcasters", {}),
+                    "special_triggers": new_config.get("special_triggers", []),
+                    "special_triggers_enabled": new_config.get("special_triggers_enabled", False),
+                    "metadata": new_config.get("metadata", {})
+                }
         except Exception as e:
             print(f"新しい形式での読み込みエラー ({user_id}): {str(e)}")
 
@@ -293,6 +454,7 @@ class HierarchicalConfigManager:
                     import shutil
                     if user_dir_path.exists():
                         shutil.rmtree(user_dir_path)
+                        self.user_registry.invalidate()
                         print(f"ユーザー設定ディレクトリを削除: {user_dir_path}")
                     return
 
@@ -608,8 +770,7 @@ class HierarchicalConfigManager:
         """処理済みXMLリストを読み込み"""
         try:
             if self.processed_xmls_file.exists():
-                with open(self.processed_xmls_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = load_json_artifact(self.processed_xmls_file)
                 return data.get("processed_xmls", [])
         except Exception as e:
             print(f"処理済みXML読み込みエラー: {str(e)}")
@@ -622,8 +783,7 @@ class HierarchicalConfigManager:
                 "processed_xmls": processed_list,
                 "last_updated": datetime.now().isoformat()
             }
-            with open(self.processed_xmls_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(data, self.processed_xmls_file, allow_gzip=False)
         except Exception as e:
             print(f"処理済みXML保存エラー: {str(e)}")
 
@@ -664,15 +824,11 @@ class HierarchicalConfigManager:
         """スペシャルユーザーディレクトリから設定を読み込み"""
         config_path = self.get_user_config_path(user_id, display_name)
 
-        if config_path.exists():
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"ユーザー設定読み込みエラー ({config_path}): {str(e)}")
-
-        # デフォルト設定を返す
-        return self.create_default_user_config_structure(user_id, display_name)
+        # 共有キャッシュから取得（ファイルがない・読めない場合はデフォルト設定）
+        return self.user_registry.get_config(
+            config_path.parent.name,
+            lambda: self.create_default_user_config_structure(user_id, display_name)
+        )
 
     def save_user_config_to_directory(self, user_id: str, display_name: str, user_config: dict):
         """スペシャルユーザーディレクトリに設定を保存"""
@@ -695,8 +851,8 @@ class HierarchicalConfigManager:
         }
 
         try:
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(user_config, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(user_config, config_path, allow_gzip=False)
+            self.user_registry.invalidate(user_id)
             print(f"ユーザー設定保存: {config_path}")
             print(f"[DEBUG] 保存完了: {config_path}")
         except Exception as e:
@@ -777,27 +933,8 @@ class HierarchicalConfigManager:
         return new_config
 
     def get_all_user_directories(self) -> list:
-        """すべてのスペシャルユーザーディレクトリを取得"""
-        special_user_root = Path("SpecialUser")
-        if not special_user_root.exists():
-            return []
-
-        user_dirs = []
-        for item in special_user_root.iterdir():
-            if item.is_dir() and "_" in item.name:
-                try:
-                    user_id_part = item.name.split("_")[0]
-                    display_name_part = "_".join(item.name.split("_")[1:])
-                    user_dirs.append({
-                        "user_id": user_id_part,
-                        "display_name": display_name_part,
-                        "directory_name": item.name,
-                        "path": item
-                    })
-                except:
-                    continue
-
-        return user_dirs
+        """すべてのスペシャルユーザーディレクトリを取得（共有キャッシュから）"""
+        return self.user_registry.get_directories()
 
     # === トリガーシリーズ管理機能 ===
 
@@ -805,8 +942,7 @@ class HierarchicalConfigManager:
         """トリガーシリーズ設定を読み込み"""
         if self.trigger_series_path.exists():
             try:
-                with open(self.trigger_series_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_artifact(self.trigger_series_path)
             except Exception as e:
                 print(f"トリガーシリーズ読み込みエラー: {str(e)}")
                 return self._get_default_trigger_series()
@@ -817,8 +953,7 @@ class HierarchicalConfigManager:
         """トリガーシリーズ設定を保存"""
         try:
             series_config["last_updated"] = datetime.now().isoformat()
-            with open(self.trigger_series_path, 'w', encoding='utf-8') as f:
-                json.dump(series_config, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(series_config, self.trigger_series_path, allow_gzip=False)
         except Exception as e:
             print(f"トリガーシリーズ保存エラー: {str(e)}")
 
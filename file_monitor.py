@@ -5,6 +5,7 @@ import threading
 from datetime import datetime
 from pathlib import Path
 from gui.utils import log_to_gui
+from processors.xml_tail_reader import IncrementalNCVReader
 
 class NCVFolderMonitor:
     def __init__(self, config_manager, logger, broadcast_detector):
@@ -60,7 +61,8 @@ class NCVFolderMonitor:
                                 'lv_value': lv_value,
                                 'subfolder_name': subfolder,
                                 'start_time': datetime.now(),
-                                'status': 'monitoring'
+                                'status': 'monitoring',
+                                'tail_reader': IncrementalNCVReader(xml_path)
                             }
                             
                             self.logger.info(f"[DEBUG] 既存XML検出・監視開始: {lv_value}")
@@ -167,7 +169,8 @@ class NCVFolderMonitor:
                 'lv_value': lv_value,
                 'subfolder_name': subfolder_name,
                 'start_time': datetime.now(),
-                'status': 'monitoring'
+                'status': 'monitoring',
+                'tail_reader': IncrementalNCVReader(xml_path)
             }
             
             self.logger.info(f"新規XML検出・監視開始: {lv_value} ({subfolder_name})")
@@ -193,10 +196,23 @@ class NCVFolderMonitor:
                 del self.monitored_xmls[xml_path]
                 continue
             
+            # 追記されたコメントだけを逐次解析しておく
+            try:
+                new_count = monitor_info['tail_reader'].read_new()
+                if new_count:
+                    self.logger.debug(f"[DEBUG] 逐次解析: {monitor_info['lv_value']} +{new_count}件")
+            except Exception as e:
+                self.logger.error(f"逐次解析エラー: {xml_path} - {str(e)}")
+
             elapsed_hours = (datetime.now() - monitor_info['start_time']).total_seconds() / 3600
             if elapsed_hours > 24:
                 self.logger.warning(f"長時間監視中のXMLファイル: {xml_path}")
     
+    def get_tail_reader(self, xml_path):
+        """監視中XMLの逐次解析リーダーを取得（未監視ならNone）"""
+        monitor_info = self.monitored_xmls.get(xml_path)
+        return monitor_info.get('tail_reader') if monitor_info else None
+
     def xml_processing_completed(self, xml_path):
         """XMLの処理完了通知"""
         if xml_path in self.monitored_xmls:
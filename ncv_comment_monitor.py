@@ -410,9 +410,10 @@ class NCVCommentServer:
         try:
             self.logger.info("Loading special users configuration...")
 
-            # 既存のキャッシュをクリア
+            # 既存のキャッシュをクリア（共有のユーザー設定キャッシュも読み直す）
             self.special_users_cache.clear()
             self.monitored_user_ids.clear()
+            self.config_manager.user_registry.invalidate()
 
             # ディレクトリベースの設定を読み込み
             user_dirs = self.config_manager.get_all_user_directories()
@@ -455,6 +456,9 @@ class NCVCommentServer:
     def reload_user_config(self, user_id: str):
         """特定ユーザーの設定を再読み込み"""
         try:
+            # 変更通知を受けたユーザーの設定はファイルから読み直す
+            self.config_manager.user_registry.invalidate(user_id)
+
             if user_id in self.special_users_cache:
                 display_name = self.special_users_cache[user_id]['display_name']
                 user_config = self.config_manager.load_user_config_from_directory(user_id, display_name)
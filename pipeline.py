@@ -29,6 +29,10 @@ class PipelineExecutor:
                 'start_time': datetime.now(),
                 'results': {}
             }
+
+            # 監視中に逐次解析していればStep01はその結果を引き継ぐ
+            if self.file_monitor:
+                pipeline_data['tail_reader'] = self.file_monitor.get_tail_reader(xml_path)
             
             # ステップ定義（Step00とStep04を追加）
             steps = [
@@ -38,6 +42,13 @@ class PipelineExecutor:
                 'step03_html_generator',
                 'step04_database_storage'
             ]
+
+            # Step02でAI分析が完了したユーザーから、後続ステップの process_user を逐次実行
+            streaming_steps = steps[steps.index('step02_special_user_filter') + 1:]
+            pipeline_data['streamed_users'] = {step_name: {} for step_name in streaming_steps}
+            pipeline_data['on_user_analyzed'] = lambda user_data: self._process_analyzed_user(
+                pipeline_data, streaming_steps, user_data
+            )
             
             # 各ステップを順次実行
             for step_name in steps:
@@ -91,9 +102,11 @@ class PipelineExecutor:
             summary = self._generate_pipeline_summary(pipeline_data['results'])
             self.logger.info(f"パイプライン結果: {summary}")
             
-            # ファイルモニターに完了通知
+            # ファイルモニターに完了通知（Step01で統合した同一lvのXMLも監視終了）
             if self.file_monitor:
-                self.file_monitor.xml_processing_completed(xml_path)
+                step01 = pipeline_data['results'].get('step01_xml_parser') or {}
+                for path in step01.get('xml_paths') or [xml_path]:
+                    self.file_monitor.xml_processing_completed(path)
             
             return pipeline_data['results']
             
@@ -101,6 +114,21 @@ class PipelineExecutor:
             self.logger.error(f"パイプライン実行エラー: {lv_value} - {str(e)}")
             raise
     
+    def _process_analyzed_user(self, pipeline_data, step_names, user_data):
+        """AI分析が完了した1ユーザー分を後続ステップで処理（失敗したステップは通常処理で再実行）"""
+        user_id = user_data['user_id']
+        for step_name in step_names:
+            try:
+                module = importlib.import_module(f"processors.{step_name}")
+                if not hasattr(module, 'process_user'):
+                    continue
+                result = module.process_user(pipeline_data, user_data)
+                pipeline_data['streamed_users'][step_name][user_id] = result
+            except Exception as e:
+                self.logger.error(f"ユーザー逐次処理エラー: {step_name} ({user_id}) - {str(e)}")
+                # 前のステップが失敗した場合、後続も通常処理に任せる
+                break
+
     def _generate_pipeline_summary(self, results):
         """パイプライン実行結果のサマリーを生成"""
         summary_parts = []
@@ -120,6 +148,8 @@ class PipelineExecutor:
         if 'step01_xml_parser' in results:
             step01 = results['step01_xml_parser']
             summary_parts.append(f"コメント解析={step01.get('comments_count', 0)}件")
+            if step01.get('error_rows'):
+                summary_parts.append(f"解析エラー={step01['error_rows']}行")
         
         # Step02結果  
         if 'step02_special_user_filter' in results:
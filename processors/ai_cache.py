@@ -0,0 +1,147 @@
+# processors/ai_cache.py
+"""
+AI分析結果のキャッシュ
+
+(モデル, システムプロンプト, 最終プロンプト) のSHA-256をキーに分析結果をSQLiteへ保存し、
+同じ放送の再処理（クラッシュ後の再実行や reprocess）でAPIを呼ばずに結果を返す。
+data/ncv_monitor.db と同じフォルダの data/ai_analysis_cache.db を使う。
+
+古いエントリ（max_age_days 超）と件数超過分（最終利用が古い順に max_entries まで）は
+起動時と一定件数の保存ごとに削除する。設定は api_settings.ai_cache で変更できる。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_SETTINGS = {"enabled": True, "max_entries": 5000, "max_age_days": 90}
+
+# この件数を保存するごとに期限切れ・件数超過分を削除
+EVICT_EVERY_PUTS = 100
+
+
+def make_cache_key(model, system_prompt, prompt) -> str:
+    """(モデル, システムプロンプト, 最終プロンプト) のSHA-256"""
+    payload = json.dumps([model, system_prompt or "", prompt or ""], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIAnalysisCache:
+    """AI分析結果の永続キャッシュ（スレッド間で共有可、接続は操作ごと）"""
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path="data/ai_analysis_cache.db", max_entries=5000, max_age_days=90):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.lock = threading.Lock()
+        self.puts_since_evict = 0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.init_database()
+        self.evict()
+
+    @classmethod
+    def get_instance(cls, db_path="data/ai_analysis_cache.db"):
+        """db_pathごとに共有のインスタンスを取得"""
+        with cls._instances_lock:
+            if db_path not in cls._instances:
+                cls._instances[db_path] = cls(db_path)
+            return cls._instances[db_path]
+
+    @contextlib.contextmanager
+    def connect(self):
+        """操作ごとの接続（ブロックを抜けるとコミットまたはロールバックして閉じる）"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def init_database(self):
+        """テーブルを初期化"""
+        with self.connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS ai_analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    analysis_result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_analysis_cache(last_used_at);
+            ''')
+
+    def configure(self, settings):
+        """api_settings.ai_cache の上限を反映"""
+        self.max_entries = int(settings.get("max_entries", self.max_entries) or 0)
+        self.max_age_days = float(settings.get("max_age_days", self.max_age_days) or 0)
+
+    def get(self, cache_key):
+        """キャッシュ済みの分析結果（なければNone）"""
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT analysis_result, created_at FROM ai_analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age_days and now - row[1] > self.max_age_days * 86400:
+                conn.execute("DELETE FROM ai_analysis_cache WHERE cache_key = ?", (cache_key,))
+                return None
+            conn.execute(
+                "UPDATE ai_analysis_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            return row[0]
+
+    def put(self, cache_key, model, analysis_result):
+        """分析結果を保存"""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO ai_analysis_cache
+                (cache_key, model, analysis_result, created_at, last_used_at, hit_count)
+                VALUES (?, ?, ?, ?, ?, 0)
+            ''', (cache_key, model, analysis_result, now, now))
+
+        with self.lock:
+            self.puts_since_evict += 1
+            if self.puts_since_evict < EVICT_EVERY_PUTS:
+                return
+            self.puts_since_evict = 0
+        self.evict()
+
+    def evict(self):
+        """期限切れと件数超過分を削除し、削除件数を返す"""
+        deleted = 0
+        with self.connect() as conn:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                deleted += conn.execute("DELETE FROM ai_analysis_cache WHERE created_at < ?", (cutoff,)).rowcount
+            if self.max_entries:
+                deleted += conn.execute('''
+                    DELETE FROM ai_analysis_cache WHERE cache_key IN (
+                        SELECT cache_key FROM ai_analysis_cache
+                        ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,)).rowcount
+        if deleted:
+            print(f"[DEBUG] AI分析キャッシュ: {deleted}件を削除")
+        return deleted
+
+
+def get_ai_cache(api_settings=None):
+    """共有キャッシュを取得（api_settings.ai_cache.enabled が False ならNone）"""
+    settings = {**DEFAULT_CACHE_SETTINGS, **((api_settings or {}).get("ai_cache") or {})}
+    if not settings.get("enabled", True):
+        return None
+    cache = AIAnalysisCache.get_instance()
+    cache.configure(settings)
+    return cache
@@ -0,0 +1,55 @@
+# processors/ai_response_normalizer.py
+"""
+AI応答の後処理（Markdown → HTML）
+
+以前の clean_ai_response は呼び出しごとに文字列のパターンで re.sub を7回、
+str.replace を2回かけていた。ここでは事前にコンパイルしたパターンで
+
+1. コードブロック記法の除去とインラインコード記法の除去を1回の置換で
+2. **太字** → <strong> を1回の置換で
+3. 行頭の # / ## / ### → <h1>〜<h3> を1回の置換で（# を含む場合のみ）
+4. 改行 → <br> を1回の置換で
+
+行う。置換はすべてテンプレート（C実装）で行い、Python側の処理は見出し行だけにする。
+（1回の走査でトークンごとにPythonで分岐する方式も試したが、トークン数が多い長い応答では
+re.sub を重ねるより遅かった）
+"""
+import re
+
+# ```html, ```css, ``` など（除去） / `code` → code
+_CODE_PATTERN = re.compile(r"```\w*\n?|`([^`]+)`")
+# **太字** → <strong>太字</strong>
+_BOLD_PATTERN = re.compile(r"\*\*([^*]+)\*\*")
+# 行頭の見出し記法（# の数で見出しレベルを決める）
+_HEADING_PATTERN = re.compile(r"^(#{1,3}) (.+)$", re.MULTILINE)
+_HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+_LEADING_FENCE_PATTERN = re.compile(r'^```[\w\s]*\n')
+_TRAILING_FENCE_PATTERN = re.compile(r'\n```$')
+
+
+def _replace_heading(match):
+    level = len(match.group(1))
+    return f"<h{level}>{match.group(2)}</h{level}>"
+
+
+def normalize_ai_response(ai_response):
+    """AI分析結果からコードブロック記法を除去し、Markdown記法をHTMLに変換"""
+    if not ai_response:
+        return ""
+
+    ai_response = _CODE_PATTERN.sub(r"\1", ai_response)
+    ai_response = _BOLD_PATTERN.sub(r"<strong>\1</strong>", ai_response)
+    if "#" in ai_response:
+        ai_response = _HEADING_PATTERN.sub(_replace_heading, ai_response)
+    return ai_response.replace("\n", "<br>").strip()
+
+
+def strip_html_tags(text):
+    """HTMLタグを除去"""
+    return _HTML_TAG_PATTERN.sub('', text).strip()
+
+
+def strip_code_fences(text):
+    """応答全体を囲む ``` / ```html などの記法を除去"""
+    cleaned = _LEADING_FENCE_PATTERN.sub('', text.strip())
+    return _TRAILING_FENCE_PATTERN.sub('', cleaned).strip()
@@ -0,0 +1,328 @@
+# processors/ai_scheduler.py
+"""
+AI分析リクエストの共有スケジューラ
+
+全パイプラインのOpenAI / Gemini呼び出しをプロセス内で1つのasyncioループに集約し、
+プロバイダごとに同時実行数・リクエスト数/分・トークン数/分の上限を守って実行する。
+429や5xxなど一時的なエラーはジッター付き指数バックオフで再試行し、429を受けたプロバイダは
+待ち時間が明けるまで新しいリクエストを送らない。
+
+SDK呼び出し自体はブロッキングなので、ループ内で順番と予算を管理し、実行はスレッドプールで行う。
+スレッドプールの大きさは各プロバイダの max_concurrency の合計に合わせる（設定で増やせばプールも広げる）。
+上限は global_config.json の api_settings.ai_rate_limits で変更できる。
+"""
+import asyncio
+import concurrent.futures
+import random
+import threading
+import time
+from collections import deque
+
+# プロバイダごとの既定の上限（0は無制限）
+DEFAULT_RATE_LIMITS = {
+    "openai": {"max_concurrency": 4, "requests_per_minute": 60, "tokens_per_minute": 60000},
+    "gemini": {"max_concurrency": 4, "requests_per_minute": 60, "tokens_per_minute": 120000},
+}
+DEFAULT_RETRY_SETTINGS = {"max_retries": 4, "backoff_base_seconds": 2.0, "backoff_max_seconds": 60.0}
+
+# 再試行するHTTPステータス
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_MESSAGES = ("rate limit", "resource has been exhausted", "overloaded", "timed out", "timeout",
+                      "temporarily unavailable", "connection")
+
+WINDOW_SECONDS = 60.0
+LATENCY_SAMPLES = 200
+
+
+def estimate_tokens(*texts) -> int:
+    """おおよそのトークン数（日本語は1文字≒1トークン、英数字は4文字≒1トークン → UTF-8バイト数/3）"""
+    return sum(len(text.encode('utf-8')) for text in texts if text) // 3
+
+
+def get_status_code(error):
+    """SDKの例外からHTTPステータスを取得（取れなければNone）"""
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def get_retry_after(error):
+    """Retry-Afterヘッダー（秒）があれば取得"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error) -> bool:
+    """一時的なエラー（429・5xx・タイムアウト・接続エラー）か"""
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    message = str(error).lower()
+    return "429" in message or any(text in message for text in RETRYABLE_MESSAGES)
+
+
+def get_token_usage(response):
+    """レスポンスから実際の使用トークン数を取得（OpenAI / Gemini）"""
+    usage = getattr(response, "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    if isinstance(total, int):
+        return total
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+
+class ProviderLimiter:
+    """1プロバイダ分の同時実行数・分間リクエスト数・分間トークン数の管理（ループスレッド専用）"""
+
+    def __init__(self, name, limits):
+        self.name = name
+        self.max_concurrency = 0
+        self.semaphore = None
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.request_times = deque()
+        self.token_events = deque()  # [時刻, トークン数]
+        self.blocked_until = 0.0     # 429を受けたときの送信停止期限
+        self.configure(limits)
+
+    def configure(self, limits):
+        max_concurrency = max(1, int(limits.get("max_concurrency", 4)))
+        if max_concurrency != self.max_concurrency:
+            # 実行中のリクエストは取得済みのセマフォを解放するので差し替えて問題ない
+            self.max_concurrency = max_concurrency
+            self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests_per_minute = int(limits.get("requests_per_minute", 0) or 0)
+        self.tokens_per_minute = int(limits.get("tokens_per_minute", 0) or 0)
+
+    def _prune(self, now):
+        while self.request_times and now - self.request_times[0] >= WINDOW_SECONDS:
+            self.request_times.popleft()
+        while self.token_events and now - self.token_events[0][0] >= WINDOW_SECONDS:
+            self.token_events.popleft()
+
+    async def reserve(self, tokens):
+        """予算が空くまで待ってから1リクエスト分を記録し、トークン記録を返す"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._prune(now)
+            wait = self.blocked_until - now
+
+            if self.requests_per_minute and len(self.request_times) >= self.requests_per_minute:
+                wait = max(wait, self.request_times[0] + WINDOW_SECONDS - now)
+
+            if self.tokens_per_minute and self.token_events:
+                used = sum(event[1] for event in self.token_events)
+                if used + tokens > self.tokens_per_minute:
+                    wait = max(wait, self.token_events[0][0] + WINDOW_SECONDS - now)
+
+            if wait <= 0:
+                self.request_times.append(now)
+                event = [now, tokens]
+                self.token_events.append(event)
+                return event
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds):
+        """429を受けたプロバイダへの送信を一定時間止める"""
+        loop = asyncio.get_running_loop()
+        self.blocked_until = max(self.blocked_until, loop.time() + seconds)
+
+
+class AIAnalysisScheduler:
+    """全パイプライン共通のAIリクエストスケジューラ（バックグラウンドスレッドのasyncioループ）"""
+    _global_instance = None
+    _global_lock = threading.Lock()
+
+    def __init__(self):
+        self.rate_limits = {name: dict(limits) for name, limits in DEFAULT_RATE_LIMITS.items()}
+        self.retry_settings = dict(DEFAULT_RETRY_SETTINGS)
+        self.limiters = {}
+        self.metrics_lock = threading.Lock()
+        self.metrics = {}
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = None
+        self.executor_workers = 0
+        self._ensure_executor_capacity()
+        self.thread = threading.Thread(target=self._run_loop, name="AIAnalysisScheduler", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get_instance(cls):
+        """プロセス共通のインスタンスを取得（初回呼び出し時にループを起動）"""
+        with cls._global_lock:
+            if cls._global_instance is None:
+                cls._global_instance = cls()
+            return cls._global_instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def configure(self, api_settings):
+        """api_settings.ai_rate_limits の内容で上限を更新"""
+        settings = (api_settings or {}).get("ai_rate_limits", {}) if isinstance(api_settings, dict) else {}
+        with self.metrics_lock:
+            for name, defaults in DEFAULT_RATE_LIMITS.items():
+                self.rate_limits[name] = {**defaults, **settings.get(name, {})}
+            for key, default in DEFAULT_RETRY_SETTINGS.items():
+                self.retry_settings[key] = settings.get(key, default)
+            self._ensure_executor_capacity()
+
+    def _ensure_executor_capacity(self):
+        """同時実行数の上限の合計より少なければ、実行用スレッドプールを作り直す（metrics_lock内で呼ぶ）"""
+        workers = sum(max(1, int(limits.get("max_concurrency", 4))) for limits in self.rate_limits.values())
+        if workers <= self.executor_workers:
+            return
+        previous = self.executor
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-request")
+        self.executor_workers = workers
+        if previous is not None:
+            # 実行中のリクエストはそのまま完了させ、新しいリクエストから新しいプールを使う
+            previous.shutdown(wait=False)
+
+    def submit(self, provider, request_func, estimated_tokens=0):
+        """ブロッキングのSDK呼び出し request_func() を予約し、concurrent.futures.Future を返す"""
+        self._metric(provider, "submitted")
+        return asyncio.run_coroutine_threadsafe(
+            self._run_request(provider, request_func, estimated_tokens), self.loop
+        )
+
+    def run(self, provider, request_func, estimated_tokens=0):
+        """submit して結果を待つ（再試行しても失敗した場合は最後の例外を送出）"""
+        return self.submit(provider, request_func, estimated_tokens).result()
+
+    def _get_limiter(self, provider):
+        with self.metrics_lock:
+            limits = dict(self.rate_limits.get(provider) or DEFAULT_RATE_LIMITS["openai"])
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            limiter = self.limiters[provider] = ProviderLimiter(provider, limits)
+        else:
+            limiter.configure(limits)
+        return limiter
+
+    async def _run_request(self, provider, request_func, estimated_tokens):
+        limiter = self._get_limiter(provider)
+        with self.metrics_lock:
+            max_retries = int(self.retry_settings["max_retries"])
+            backoff_base = float(self.retry_settings["backoff_base_seconds"])
+            backoff_max = float(self.retry_settings["backoff_max_seconds"])
+
+        queued_at = time.perf_counter()
+        self._metric(provider, "queued", 1)
+        waiting = True
+        attempt = 0
+        try:
+            while True:
+                async with limiter.semaphore:
+                    token_event = await limiter.reserve(estimated_tokens)
+                    if waiting:
+                        waiting = False
+                        self._metric(provider, "queued", -1)
+                        self._record_wait(provider, time.perf_counter() - queued_at)
+                    self._metric(provider, "in_flight", 1)
+                    started = time.perf_counter()
+                    try:
+                        response = await self.loop.run_in_executor(self.executor, request_func)
+                    except Exception as e:
+                        error = e
+                    else:
+                        # 実際の使用量がわかれば分間トークン数の記録を置き換える
+                        usage = get_token_usage(response)
+                        if usage is not None:
+                            token_event[1] = usage
+                        self._record_latency(provider, time.perf_counter() - started)
+                        self._metric(provider, "completed")
+                        return response
+                    finally:
+                        self._metric(provider, "in_flight", -1)
+
+                if attempt >= max_retries or not is_retryable_error(error):
+                    self._metric(provider, "failed")
+                    raise error
+
+                attempt += 1
+                delay = min(backoff_max, backoff_base * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+                retry_after = get_retry_after(error)
+                if retry_after:
+                    delay = max(delay, retry_after)
+                if get_status_code(error) == 429 or "429" in str(error):
+                    self._metric(provider, "rate_limited")
+                    limiter.block_for(delay)
+                self._metric(provider, "retries")
+                print(f"[DEBUG] AIリクエスト再試行 ({provider}) {attempt}/{max_retries}: {delay:.1f}秒後 - {error}")
+                await asyncio.sleep(delay)
+        finally:
+            if waiting:
+                self._metric(provider, "queued", -1)
+
+    # === メトリクス ===
+
+    def _provider_metrics(self, provider):
+        metrics = self.metrics.get(provider)
+        if metrics is None:
+            metrics = self.metrics[provider] = {
+                "submitted": 0, "queued": 0, "in_flight": 0, "completed": 0, "failed": 0,
+                "retries": 0, "rate_limited": 0,
+                "latencies": deque(maxlen=LATENCY_SAMPLES), "waits": deque(maxlen=LATENCY_SAMPLES)
+            }
+        return metrics
+
+    def _metric(self, provider, name, delta=1):
+        with self.metrics_lock:
+            self._provider_metrics(provider)[name] += delta
+
+    def _record_latency(self, provider, seconds):
+        with self.metrics_lock:
+            self._provider_metrics(provider)["latencies"].append(seconds)
+
+    def _record_wait(self, provider, seconds):
+        with self.metrics_lock:
+            self._provider_metrics(provider)["waits"].append(seconds)
+
+    def get_metrics(self):
+        """プロバイダごとのキュー長・実行中件数・完了/失敗/再試行数・レイテンシ（平均/95%）を返す"""
+        result = {}
+        with self.metrics_lock:
+            for provider, metrics in self.metrics.items():
+                summary = {key: value for key, value in metrics.items() if not isinstance(value, deque)}
+                for key in ("latencies", "waits"):
+                    samples = sorted(metrics[key])
+                    name = "latency" if key == "latencies" else "wait"
+                    summary[f"{name}_avg"] = sum(samples) / len(samples) if samples else 0.0
+                    summary[f"{name}_p95"] = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+                result[provider] = summary
+        return result
+
+    def format_metrics(self):
+        """ログ出力用の1行サマリー"""
+        parts = []
+        for provider, metrics in self.get_metrics().items():
+            parts.append(
+                f"{provider}: 待機{metrics['queued']} 実行中{metrics['in_flight']} 完了{metrics['completed']} "
+                f"失敗{metrics['failed']} 再試行{metrics['retries']} (429: {metrics['rate_limited']}) "
+                f"レイテンシ平均{metrics['latency_avg']:.2f}s/p95 {metrics['latency_p95']:.2f}s "
+                f"待ち平均{metrics['wait_avg']:.2f}s"
+            )
+        return " | ".join(parts) if parts else "リクエストなし"
+
+
+def get_ai_scheduler(api_settings=None):
+    """共有スケジューラを取得（api_settingsを渡すと上限設定を反映）"""
+    scheduler = AIAnalysisScheduler.get_instance()
+    if api_settings is not None:
+        scheduler.configure(api_settings)
+    return scheduler
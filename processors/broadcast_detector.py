@@ -59,8 +59,8 @@ class BroadcastEndDetector:
             self.logger.debug(f"[DEBUG] 初回バックグラウンドチェック開始: {lv_value}")
             if self._check_broadcast_end(lv_value):
                 self.logger.info(f"放送終了を即時検出: {lv_value}")
-                self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
-                self.config_manager.add_processed_xml(xml_path)
+                results = self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
+                self._mark_processed(xml_path, results)
                 del self.active_detections[lv_value]
                 return
 
@@ -77,8 +77,8 @@ class BroadcastEndDetector:
                     
                     if result:
                         self.logger.info(f"放送終了を検出: {lv_value}")
-                        self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
-                        self.config_manager.add_processed_xml(xml_path)
+                        results = self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
+                        self._mark_processed(xml_path, results)
                         break
                     else:
                         self.logger.debug(f"放送継続中: {lv_value}")
@@ -89,8 +89,8 @@ class BroadcastEndDetector:
                     if detection_info['retry_count'] >= max_retries:
                         # ★ エラー時は終了扱いにしてパイプライン実行
                         self.logger.info(f"エラーによる強制終了判定: {lv_value}")
-                        self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
-                        self.config_manager.add_processed_xml(xml_path)
+                        results = self.pipeline_executor.execute_pipeline(xml_path, lv_value, subfolder_name)
+                        self._mark_processed(xml_path, results)
                         break
 
                 self.logger.debug(f"[DEBUG] 次回チェックまで待機 {check_interval}秒: {lv_value}")
@@ -100,7 +100,13 @@ class BroadcastEndDetector:
                 del self.active_detections[lv_value]
             self.logger.info(f"放送終了検出終了: {lv_value}")
 
-        
+
+    def _mark_processed(self, xml_path, results):
+        """処理済みに登録（Step01で統合した同一lvのXMLもまとめて登録）"""
+        step01 = (results or {}).get('step01_xml_parser') or {}
+        for path in step01.get('xml_paths') or [xml_path]:
+            self.config_manager.add_processed_xml(path)
+
     def _check_broadcast_end(self, lv_value):
         """放送が終了しているかチェック（強化デバッグ版）"""
         try:
@@ -0,0 +1,140 @@
+# processors/broadcast_index.py
+"""
+ユーザーごとの放送アイテム索引（SpecialUser/{user_id}_{user_name}/broadcast_index.jsonl）
+
+一覧ページ（list.html）に並べる放送アイテムを1放送1行のJSONで追記していく。
+既存の list.html を読み込んで正規表現でアイテムを切り出す必要がなくなり、1放送分の更新は
+索引への1行の追記で済む。新しい放送は list.html の末尾にも差し込むだけで、list.html 全体を
+索引から描画し直すのは差し替えや初回など（update_broadcast_index が appended=False を返す場合）に限る。
+
+- 同じ lv_value の行が複数ある場合は最後の行が有効（再処理したら差し替わる、並び順は最初の位置）
+- 索引がなく旧形式の list.html だけがある場合は、初回に1回だけ list.html からアイテムを取り込む
+- 差し替えで無効になった行が有効な行より多くなったら索引を書き直す
+"""
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+INDEX_FILENAME = "broadcast_index.jsonl"
+LEGACY_LIST_FILENAME = "list.html"
+
+# 旧形式の list.html から放送アイテムを切り出すパターン（索引の初回作成時のみ使用）
+_LEGACY_ITEM_PATTERN = re.compile(
+    r'<div class="link-item">.*?</div>(?=\s*<div class="link-item">|\s*</div>\s*<canvas|\s*$)', re.DOTALL
+)
+_LEGACY_LV_PATTERN = re.compile(r'chat-data-(lv\d+)-|_(lv\d+)_detail\.html|watch/(lv\d+)')
+
+# 索引ファイルのパス → (読み込み済みのファイルサイズ, {lv_value: エントリ}, 行数)
+_index_cache = {}
+# 索引ファイルのパス → ロック（別ユーザーの索引は並列に更新できる）
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+def load_legacy_list_items(list_file_path):
+    """旧形式の list.html から放送アイテムのHTMLを抽出"""
+    try:
+        with open(list_file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return _LEGACY_ITEM_PATTERN.findall(content)
+    except Exception as e:
+        print(f"既存アイテム読み込みエラー: {str(e)}")
+        return []
+
+
+def _get_index_lock(index_path):
+    with _index_locks_lock:
+        lock = _index_locks.get(index_path)
+        if lock is None:
+            lock = _index_locks[index_path] = threading.Lock()
+        return lock
+
+
+def _read_index(index_path):
+    entries = {}
+    line_count = 0
+    with open(index_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で終了した行は読み飛ばす
+                continue
+            line_count += 1
+            entries[entry['lv_value']] = entry
+    return entries, line_count
+
+
+def _write_index(index_path, entries):
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in entries.values():
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(temp_path, index_path)
+
+
+def _bootstrap_from_legacy_list(user_dir, index_path):
+    """索引がなければ旧形式の list.html から作成（list.html もなければ空）"""
+    entries = {}
+    list_file_path = os.path.join(user_dir, LEGACY_LIST_FILENAME)
+    if os.path.exists(list_file_path):
+        for position, item_html in enumerate(load_legacy_list_items(list_file_path)):
+            match = _LEGACY_LV_PATTERN.search(item_html)
+            lv_value = next((group for group in match.groups() if group), None) if match else None
+            lv_value = lv_value or f"legacy-{position}"
+            entries[lv_value] = {"lv_value": lv_value, "item_html": item_html, "imported_from": LEGACY_LIST_FILENAME}
+        print(f"[DEBUG] 放送索引を既存の一覧ページから作成: {user_dir} ({len(entries)}件)")
+    _write_index(index_path, entries)
+    return entries
+
+
+def _load_entries(user_dir, index_path):
+    """キャッシュ済みの索引を返す（他で書き換えられていれば読み直す）"""
+    cached = _index_cache.get(index_path)
+    if not os.path.exists(index_path):
+        entries = _bootstrap_from_legacy_list(user_dir, index_path)
+        line_count = len(entries)
+    elif cached is not None and cached[0] == os.path.getsize(index_path):
+        return cached[1], cached[2]
+    else:
+        entries, line_count = _read_index(index_path)
+    _index_cache[index_path] = (os.path.getsize(index_path), entries, line_count)
+    return entries, line_count
+
+
+def update_broadcast_index(user_dir, entry):
+    """放送アイテムを索引に追記し、(一覧ページに並べるエントリ（古い順）, 末尾に追加されたか) を返す
+
+    既にある lv_value の差し替えは並び順が変わらないため、末尾への追加にはならない。
+    """
+    index_path = os.path.join(user_dir, INDEX_FILENAME)
+    entry = {**entry, "updated_at": datetime.now().isoformat()}
+
+    with _get_index_lock(index_path):
+        entries, line_count = _load_entries(user_dir, index_path)
+        appended = entry['lv_value'] not in entries
+
+        with open(index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        entries[entry['lv_value']] = entry
+        line_count += 1
+
+        # 差し替えで無効になった行が増えたら書き直す
+        if line_count > 2 * len(entries):
+            _write_index(index_path, entries)
+            line_count = len(entries)
+        _index_cache[index_path] = (os.path.getsize(index_path), entries, line_count)
+        return list(entries.values()), appended
+
+
+def load_broadcast_index(user_dir):
+    """一覧ページに並べるエントリ（古い順）を返す"""
+    index_path = os.path.join(user_dir, INDEX_FILENAME)
+    with _get_index_lock(index_path):
+        entries, _ = _load_entries(user_dir, index_path)
+        return list(entries.values())
@@ -0,0 +1,313 @@
+# processors/comment_batch.py
+"""
+放送1回分のコメントを列ごとに保持するコンテナ
+
+Step01で解析した全コメントをコメント毎の辞書ではなく列（数値はarray、文字列はlist）で持ち、
+Step02〜04はこの列を直接走査する。1行分を辞書風に参照したい場合は CommentRow を使う。
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# 1コメント分のフィールド（comments.jsonのキー順）
+COMMENT_FIELDS = ("no", "user_id", "user_name", "text", "date", "premium", "anonymity", "thread")
+
+# バイナリキャッシュの識別子とバイト列として書き出す列
+BINARY_MAGIC = b"NCVCMT2\0"
+BINARY_NUMERIC_COLUMNS = ("no", "date", "premium", "anonymity", "user_codes", "name_codes", "thread_codes")
+
+
+class CommentRow:
+    """CommentBatchの1行を参照する軽量ビュー（辞書と同じ get / [] で読める）"""
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, key):
+        if key not in COMMENT_FIELDS:
+            raise KeyError(key)
+        return self.batch.value(key, self.index)
+
+    def get(self, key, default=None):
+        if key not in COMMENT_FIELDS:
+            return default
+        return self.batch.value(key, self.index)
+
+    def keys(self):
+        return COMMENT_FIELDS
+
+    def to_dict(self):
+        return {key: self.batch.value(key, self.index) for key in COMMENT_FIELDS}
+
+    def __repr__(self):
+        return f"CommentRow({self.to_dict()!r})"
+
+
+class CommentBatch:
+    """コメント列のコンテナ
+
+    user_id / user_name / thread は放送内で同じ値が大量に繰り返されるため、列には整数コードだけを持ち、
+    文字列本体は1回だけ記号表（user_table / name_table / thread_table）に格納する。
+    """
+    __slots__ = ("no", "user_codes", "name_codes", "text", "date", "premium", "anonymity", "thread_codes",
+                 "user_table", "user_lookup", "name_table", "name_lookup", "thread_table", "thread_lookup")
+
+    # 行ごとの値を持つ列（並べ替えの対象）
+    COLUMNS = ("no", "user_codes", "name_codes", "text", "date", "premium", "anonymity", "thread_codes")
+
+    def __init__(self):
+        self.no = array('q')
+        self.user_codes = array('i')
+        self.name_codes = array('i')
+        self.text = []
+        self.date = array('q')
+        self.premium = array('i')
+        self.anonymity = array('b')
+        self.thread_codes = array('i')
+        # 記号表: コード → 文字列 / 文字列 → コード
+        self.user_table = []
+        self.user_lookup = {}
+        self.name_table = []
+        self.name_lookup = {}
+        self.thread_table = []
+        self.thread_lookup = {}
+
+    @classmethod
+    def from_comments(cls, comments):
+        """コメント辞書のリスト（またはCommentBatch）からバッチを作成"""
+        if isinstance(comments, cls):
+            return comments
+        batch = cls()
+        for comment in comments:
+            batch.append(
+                comment.get('no', 0),
+                comment.get('user_id', ''),
+                comment.get('user_name', ''),
+                comment.get('text', ''),
+                comment.get('date', 0),
+                comment.get('premium', 0),
+                comment.get('anonymity', False),
+                comment.get('thread', '')
+            )
+        return batch
+
+    def append(self, no, user_id, user_name, text, date, premium, anonymity, thread=''):
+        """1コメント分を末尾に追加（user_id / user_name / threadは記号表に登録してコード化）"""
+        user_code = self.user_lookup.get(user_id)
+        if user_code is None:
+            user_code = self.user_lookup[user_id] = len(self.user_table)
+            self.user_table.append(user_id)
+
+        name_code = self.name_lookup.get(user_name)
+        if name_code is None:
+            name_code = self.name_lookup[user_name] = len(self.name_table)
+            self.name_table.append(user_name)
+
+        thread_code = self.thread_lookup.get(thread)
+        if thread_code is None:
+            thread_code = self.thread_lookup[thread] = len(self.thread_table)
+            self.thread_table.append(thread)
+
+        self.no.append(no)
+        self.user_codes.append(user_code)
+        self.name_codes.append(name_code)
+        self.text.append(text)
+        self.date.append(date)
+        self.premium.append(premium)
+        self.anonymity.append(1 if anonymity else 0)
+        self.thread_codes.append(thread_code)
+
+    def comment_keys(self):
+        """重複判定用の (thread, no) の集合（noが0の行は番号がないため含めない）"""
+        thread_table = self.thread_table
+        return {(thread_table[thread_code], no)
+                for no, thread_code in zip(self.no, self.thread_codes) if no}
+
+    def merge(self, other):
+        """他のバッチから、このバッチにない (thread, no) の行だけを追加し、追加件数を返す
+
+        重複判定はマージ前からこのバッチにある行に対してだけ行う。noが0（番号なし）の行は常に追加する。
+        """
+        seen = self.comment_keys()
+        added = 0
+        for row in other.rows():
+            if row[0] and (row[7], row[0]) in seen:
+                continue
+            self.append(*row)
+            added += 1
+        return added
+
+    def user_code(self, user_id):
+        """user_idのコードを取得（このバッチに出現しなければNone）"""
+        return self.user_lookup.get(user_id)
+
+    def user_codes_for(self, user_ids):
+        """user_idの集合をこのバッチ内のコード集合に変換"""
+        lookup = self.user_lookup
+        return {lookup[user_id] for user_id in user_ids if user_id in lookup}
+
+    @property
+    def user_id(self):
+        """user_id列（文字列）"""
+        table = self.user_table
+        return [table[code] for code in self.user_codes]
+
+    @property
+    def thread(self):
+        """thread列（文字列）"""
+        table = self.thread_table
+        return [table[code] for code in self.thread_codes]
+
+    @property
+    def user_name(self):
+        """user_name列（文字列）"""
+        table = self.name_table
+        return [table[code] for code in self.name_codes]
+
+    def value(self, field, index):
+        """指定行・指定フィールドの値を取得"""
+        if field == "user_id":
+            return self.user_table[self.user_codes[index]]
+        if field == "user_name":
+            return self.name_table[self.name_codes[index]]
+        if field == "thread":
+            return self.thread_table[self.thread_codes[index]]
+        if field == "anonymity":
+            return bool(self.anonymity[index])
+        return getattr(self, field)[index]
+
+    def __len__(self):
+        return len(self.date)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CommentRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield CommentRow(self, index)
+
+    def rows(self):
+        """列をまとめてタプルで走査（COMMENT_FIELDSの順）"""
+        return zip(self.no,
+                   map(self.user_table.__getitem__, self.user_codes),
+                   map(self.name_table.__getitem__, self.name_codes),
+                   self.text, self.date, self.premium, map(bool, self.anonymity),
+                   map(self.thread_table.__getitem__, self.thread_codes))
+
+    def sort_by_date(self):
+        """日時順に並べ替え（同時刻は元の順序を維持）"""
+        order = sorted(range(len(self)), key=self.date.__getitem__)
+        if all(index == position for position, index in enumerate(order)):
+            return self
+        for field in self.COLUMNS:
+            column = getattr(self, field)
+            reordered = [column[index] for index in order]
+            if isinstance(column, array):
+                reordered = array(column.typecode, reordered)
+            setattr(self, field, reordered)
+        return self
+
+    def to_dicts(self):
+        """comments.json互換の辞書リストに変換"""
+        return [dict(zip(COMMENT_FIELDS, row)) for row in self.rows()]
+
+    # === バイナリキャッシュ（comments.bin） ===
+    #
+    # レイアウト: MAGIC | メタ情報長(uint32) | メタ情報JSON | 数値列 | 文字列ヒープ
+    # 数値列は array の生バイト（リトルエンディアン）、文字列ヒープは NUL 区切りの UTF-8。
+    # NUL は XML 1.0 の文書内に現れないため区切り文字として安全に使える。
+
+    def save_binary(self, path, meta=None):
+        """列をそのままバイナリファイルに書き出す（metaは任意のJSON互換辞書）"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for part in self._binary_parts(meta):
+                f.write(part)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_binary(cls, path):
+        """save_binaryで書いたファイルをメモリマップで読み込み、(バッチ, メタ情報) を返す"""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return cls._from_binary(mm, path)
+
+    def to_bytes(self, meta=None):
+        """comments.binと同じ形式のバイト列（プロセス間の受け渡し用、文字列ごとのpickleを避ける）"""
+        return b''.join(self._binary_parts(meta))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """to_bytesのバイト列から (バッチ, メタ情報) を復元"""
+        return cls._from_binary(data, "<bytes>")
+
+    def _binary_parts(self, meta):
+        heaps = [
+            '\x00'.join(self.user_table).encode('utf-8'),
+            '\x00'.join(self.name_table).encode('utf-8'),
+            '\x00'.join(self.text).encode('utf-8'),
+            '\x00'.join(self.thread_table).encode('utf-8'),
+        ]
+        header = dict(meta or {})
+        header["count"] = len(self)
+        header["table_sizes"] = [len(self.user_table), len(self.name_table), len(self.thread_table)]
+        header["heap_sizes"] = [len(heap) for heap in heaps]
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+        parts = [BINARY_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+        for field in BINARY_NUMERIC_COLUMNS:
+            column = getattr(self, field)
+            if sys.byteorder != 'little':
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        parts.extend(heaps)
+        return parts
+
+    @classmethod
+    def _from_binary(cls, buffer, source):
+        if buffer[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f"コメントキャッシュの形式が不正です: {source}")
+        position = len(BINARY_MAGIC)
+        header_length, = struct.unpack_from('<I', buffer, position)
+        position += 4
+        meta = json.loads(buffer[position:position + header_length].decode('utf-8'))
+        position += header_length
+
+        count = meta["count"]
+        batch = cls()
+        for field in BINARY_NUMERIC_COLUMNS:
+            column = array(getattr(batch, field).typecode)
+            size = column.itemsize * count
+            column.frombytes(buffer[position:position + size])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            setattr(batch, field, column)
+            position += size
+
+        heaps = []
+        for heap_size in meta["heap_sizes"]:
+            heaps.append(buffer[position:position + heap_size].decode('utf-8'))
+            position += heap_size
+
+        user_count, name_count, thread_count = meta["table_sizes"]
+        batch.user_table = heaps[0].split('\x00') if user_count else []
+        batch.name_table = heaps[1].split('\x00') if name_count else []
+        batch.text = heaps[2].split('\x00') if count else []
+        batch.thread_table = heaps[3].split('\x00') if thread_count else []
+        batch.user_lookup = {user_id: code for code, user_id in enumerate(batch.user_table)}
+        batch.name_lookup = {name: code for code, name in enumerate(batch.name_table)}
+        batch.thread_lookup = {thread: code for code, thread in enumerate(batch.thread_table)}
+
+        if (len(batch.text) != count or len(batch.user_table) != user_count
+                or len(batch.name_table) != name_count or len(batch.thread_table) != thread_count):
+            raise ValueError(f"コメントキャッシュが破損しています: {source}")
+        return batch, meta
@@ -0,0 +1,168 @@
+# processors/prompt_budget.py
+"""
+AI分析プロンプトのトークン予算
+
+1放送で数千件コメントするユーザーでもプロンプトが一定の大きさに収まるよう、
+{comment_content} に入れるコメント行を予算内に絞り込む。
+
+1. そのまま予算内ならすべて使う（通常のユーザーはプロンプトが変わらない）
+2. 同じ内容のコメントを1行にまとめ「(×N)」を付ける
+3. それでも超える場合は放送時間を等分した時間帯ごとに、件数に比例した行数を等間隔で抽出する
+   （乱数を使わないので同じ入力からは同じプロンプトになり、AI分析キャッシュが効く）
+
+予算は api_settings.prompt_token_budget（プロンプト全体のトークン数、0で無制限）。
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from processors.ai_scheduler import estimate_tokens
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+# テンプレートが長くてもコメント用に最低限残すトークン数
+MIN_COMMENT_TOKENS = 500
+# 時間帯の分割数
+TIME_BUCKETS = 20
+# 抽出したことを示す末尾の注記のトークン数（概算）
+NOTE_TOKENS = 60
+
+
+def get_prompt_token_budget(config) -> int:
+    """設定からプロンプト全体のトークン予算を取得"""
+    api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
+    return int(api_settings.get("prompt_token_budget", DEFAULT_PROMPT_TOKEN_BUDGET) or 0)
+
+
+def collapse_duplicates(comments):
+    """同じ内容のコメントを初出の位置にまとめる → [(date, text, 件数)]"""
+    entries = []
+    positions = {}
+    for comment in comments:
+        text = (comment.get('text') or '').strip()
+        if not text:
+            continue
+        position = positions.get(text)
+        if position is None:
+            positions[text] = len(entries)
+            entries.append([comment.get('date') or 0, text, 1])
+        else:
+            entries[position][2] += 1
+    return [tuple(entry) for entry in entries]
+
+
+def format_entry(text, count):
+    return f"{text} (×{count})" if count > 1 else text
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def split_time_buckets(entries, bucket_count=TIME_BUCKETS):
+    """放送時間を等分した時間帯ごとにエントリの番号を振り分ける"""
+    dates = [to_int(entry[0]) for entry in entries]
+    first, last = min(dates), max(dates)
+    span = max(last - first, 1)
+    buckets = [[] for _ in range(bucket_count)]
+    for index, date in enumerate(dates):
+        buckets[min(bucket_count - 1, (date - first) * bucket_count // span)].append(index)
+    return [bucket for bucket in buckets if bucket]
+
+
+def allocate_quotas(buckets, keep_count):
+    """時間帯ごとの件数に比例して抽出数を割り当て（最大剰余法、各時間帯に最低1件）"""
+    total = sum(len(bucket) for bucket in buckets)
+    if keep_count >= total:
+        return [len(bucket) for bucket in buckets]
+
+    floor = 1 if keep_count >= len(buckets) else 0
+    remaining = keep_count - floor * len(buckets)
+    shares = [remaining * (len(bucket) - floor) / max(total - floor * len(buckets), 1) for bucket in buckets]
+    quotas = [floor + int(share) for share in shares]
+    order = sorted(range(len(buckets)), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+    for i in order[:keep_count - sum(quotas)]:
+        quotas[i] += 1
+    return [min(quota, len(bucket)) for quota, bucket in zip(quotas, buckets)]
+
+
+def stratified_sample(entries, line_tokens, budget_tokens):
+    """時間帯ごとに等間隔で抽出し、予算内に収まるエントリの番号（元の順）を返す"""
+    buckets = split_time_buckets(entries)
+    total_tokens = sum(line_tokens)
+    keep_count = min(len(entries), max(1, len(entries) * budget_tokens // max(total_tokens, 1)))
+
+    while keep_count > 0:
+        selected = []
+        for bucket, quota in zip(buckets, allocate_quotas(buckets, keep_count)):
+            selected.extend(bucket[int((i + 0.5) * len(bucket) / quota)] for i in range(quota))
+        selected.sort()
+        used_tokens = sum(line_tokens[index] for index in selected)
+        if used_tokens <= budget_tokens:
+            return selected
+        keep_count = min(keep_count - 1, keep_count * budget_tokens // used_tokens)
+    return []
+
+
+def build_budgeted_comment_text(comments, budget_tokens):
+    """予算内の {comment_content} 文字列と、省略内容の記録を返す"""
+    report = {
+        'budget_tokens': budget_tokens,
+        'original_comments': len(comments),
+        'original_tokens': 0,
+        'duplicates_collapsed': 0,
+        'sampled_out': 0,
+        'dropped_comments': 0,
+        'used_lines': 0,
+        'used_tokens': 0,
+        'applied': False
+    }
+
+    lines = [f"{i} {c.get('text', '')}" for i, c in enumerate(comments, 1)]
+    text = "\n".join(lines)
+    report['original_tokens'] = report['used_tokens'] = estimate_tokens(text)
+    report['used_lines'] = len(lines)
+    if not budget_tokens or report['original_tokens'] <= budget_tokens:
+        return text, report
+
+    # 重複をまとめる
+    report['applied'] = True
+    entries = collapse_duplicates(comments)
+    report['duplicates_collapsed'] = sum(entry[2] - 1 for entry in entries)
+    line_texts = [format_entry(entry[1], entry[2]) for entry in entries]
+    line_tokens = [estimate_tokens(f"{i} {line}\n") for i, line in enumerate(line_texts, 1)]
+
+    # 時間帯ごとに抽出（末尾の注記の分を空けておく）
+    selected = list(range(len(entries)))
+    if sum(line_tokens) > budget_tokens:
+        selected = stratified_sample(entries, line_tokens, max(1, budget_tokens - NOTE_TOKENS))
+    kept_comments = sum(entries[index][2] for index in selected)
+    report['sampled_out'] = len(entries) - len(selected)
+    report['dropped_comments'] = len(comments) - kept_comments
+
+    lines = [f"{i} {line_texts[index]}" for i, index in enumerate(selected, 1)]
+    if kept_comments < len(comments):
+        lines.append(f"※コメント総数{len(comments)}件のうち、重複をまとめ時間帯ごとに抽出した"
+                     f"{len(selected)}行（{kept_comments}件分）を掲載")
+    text = "\n".join(lines)
+    report['used_lines'] = len(selected)
+    report['used_tokens'] = estimate_tokens(text)
+    return text, report
+
+
+def build_comment_content(user_data, config, prompt_template: str) -> str:
+    """user_data のコメントを予算内の {comment_content} にし、省略内容を user_data['prompt_budget'] に記録"""
+    budget = get_prompt_token_budget(config)
+    if budget:
+        budget = max(MIN_COMMENT_TOKENS, budget - estimate_tokens(prompt_template))
+
+    text, report = build_budgeted_comment_text(user_data.get('comments', []), budget)
+    user_data['prompt_budget'] = report
+    if report['applied']:
+        print(f"[DEBUG] プロンプト予算適用: {user_data.get('user_id')} "
+              f"{report['original_comments']}件/{report['original_tokens']}トークン → "
+              f"{report['used_lines']}行/{report['used_tokens']}トークン "
+              f"(重複{report['duplicates_collapsed']}件, 抽出で除外{report['dropped_comments']}件)")
+    return text
@@ -0,0 +1,327 @@
+# processors/prompt_log_writer.py
+"""
+AI分析プロンプトログの非同期書き込み
+
+分析スレッドはログをキューに積むだけにし、バックグラウンドスレッドが
+logs/ai_prompts/prompts-YYYYmmdd-HHMMSS-ffffff-{PID}.jsonl に1行1件で追記する。
+ファイルが max_file_mb を超えたら gzip 圧縮（.jsonl.gz）して次のファイルに切り替え、
+合計が max_total_mb を超えたら古いファイルから削除する。
+
+logs/ai_prompts/index.jsonl に user_id / lv_value ごとの格納先（ファイル名と行番号）を記録するので、
+read_prompt_logs() で特定ユーザー・放送のログだけを取り出せる。
+設定は global_config.json の prompt_log_settings。
+
+同じディレクトリに複数のプロセス（監視アプリと reprocess.py など）が書き込むため、
+書き込み中のファイルは隣の .lock ファイルをOSのロックで保持する。起動時に圧縮するのは、
+ロックを取得できた（書き込んだプロセスが終了している）圧縮前のファイルだけ。
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_PROMPT_LOG_SETTINGS = {"enabled": True, "max_file_mb": 5, "max_total_mb": 200}
+
+LOG_DIR = os.path.join("logs", "ai_prompts")
+INDEX_FILENAME = "index.jsonl"
+SEGMENT_PREFIX = "prompts-"
+LOCK_SUFFIX = ".lock"
+
+# .lockのない（ロック導入前の）圧縮前ファイルは、この秒数更新がなければ異常終了の残りとみなす
+STALE_SEGMENT_SECONDS = 3600
+
+# キューの上限（書き込みが追いつかない場合は分析を止めずにログを捨てる）
+MAX_QUEUED_RECORDS = 10000
+
+_STOP = None
+
+
+class PromptLogWriter:
+    """プロンプトログの書き込みスレッド（プロセス共通）"""
+    _global_instance = None
+    _global_lock = threading.Lock()
+
+    def __init__(self, log_dir=LOG_DIR, settings=None):
+        self.log_dir = log_dir
+        self.settings = {**DEFAULT_PROMPT_LOG_SETTINGS, **(settings or {})}
+        self.queue = queue.Queue(maxsize=MAX_QUEUED_RECORDS)
+        self.dropped = 0
+        self.segment_name = None
+        self.segment_file = None
+        self.segment_lock = None
+        self.segment_lines = 0
+        self.segment_bytes = 0
+        self.thread = threading.Thread(target=self._run, name="PromptLogWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def get_instance(cls):
+        """プロセス共通のインスタンスを取得（初回呼び出し時に書き込みスレッドを起動）"""
+        with cls._global_lock:
+            if cls._global_instance is None:
+                cls._global_instance = cls()
+            return cls._global_instance
+
+    def configure(self, settings):
+        """prompt_log_settings を反映"""
+        self.settings = {**DEFAULT_PROMPT_LOG_SETTINGS, **(settings or {})}
+
+    def write(self, record):
+        """ログ1件をキューに積む（ブロックしない）"""
+        if not self.settings.get("enabled", True):
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"プロンプトログの書き込みが追いつかないため破棄: 累計{self.dropped}件")
+
+    def flush(self):
+        """キューに積まれたログがすべて書き込まれるまで待つ"""
+        self.queue.join()
+
+    def close(self):
+        """残りのログを書き込んでスレッドを終了"""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout=10)
+
+    # === 書き込みスレッド ===
+
+    def _run(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._compress_leftovers()
+        while True:
+            record = self.queue.get()
+            stop = record is _STOP
+            index_entries = []
+            try:
+                if not stop:
+                    index_entries.append(self._append(record))
+                # 溜まっている分はまとめて書き込み、flushは1回だけ
+                while not stop:
+                    if self.segment_bytes >= self.settings["max_file_mb"] * 1024 * 1024:
+                        self._append_index(index_entries)
+                        index_entries = []
+                        self._rotate()
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.queue.task_done()
+                    if record is _STOP:
+                        stop = True
+                        break
+                    index_entries.append(self._append(record))
+                if self.segment_file:
+                    self.segment_file.flush()
+                self._append_index(index_entries)
+                if self.segment_file and self.segment_bytes >= self.settings["max_file_mb"] * 1024 * 1024:
+                    self._rotate()
+            except Exception as e:
+                print(f"プロンプトログ書き込みエラー: {str(e)}")
+            finally:
+                self.queue.task_done()
+            if stop:
+                if self.segment_file:
+                    self._rotate()
+                break
+
+    def _compress_leftovers(self):
+        """異常終了したプロセスが圧縮せずに残したファイルを圧縮（他のプロセスが書き込み中のものは触らない）"""
+        for name in sorted(os.listdir(self.log_dir)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(".jsonl")):
+                continue
+            segment = name[:-len(".jsonl")]
+            try:
+                lock_file = self._claim_abandoned_segment(segment)
+                if lock_file is False:
+                    continue
+                try:
+                    self._compress_segment(segment)
+                finally:
+                    if lock_file is not None:
+                        _release_lock_file(lock_file)
+            except Exception as e:
+                print(f"プロンプトログ圧縮エラー: {name} - {str(e)}")
+
+    def _claim_abandoned_segment(self, segment):
+        """書き込んだプロセスが終了していればそのロック（.lockがなければNone）を、書き込み中ならFalseを返す"""
+        lock_path = os.path.join(self.log_dir, segment + LOCK_SUFFIX)
+        if not os.path.exists(lock_path):
+            plain_path = os.path.join(self.log_dir, segment + ".jsonl")
+            if time.time() - os.path.getmtime(plain_path) < STALE_SEGMENT_SECONDS:
+                return False
+            return None
+        lock_file = _acquire_lock_file(lock_path)
+        if lock_file is None:
+            return False
+        if not os.path.exists(os.path.join(self.log_dir, segment + ".jsonl")):
+            # ロックを取得する間に書き込んだプロセスが圧縮を終えていた
+            _release_lock_file(lock_file)
+            return False
+        return lock_file
+
+    def _compress_segment(self, segment):
+        plain_path = os.path.join(self.log_dir, segment + ".jsonl")
+        with open(plain_path, 'rb') as src, gzip.open(plain_path + ".gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(plain_path)
+
+    def _append(self, record):
+        if self.segment_file is None:
+            # プロセスIDを含めて別プロセスのファイル名と重ならないようにし、閉じるまでロックを保持
+            self.segment_name = f"{SEGMENT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}"
+            self.segment_lock = _acquire_lock_file(os.path.join(self.log_dir, self.segment_name + LOCK_SUFFIX))
+            self.segment_file = open(os.path.join(self.log_dir, self.segment_name + ".jsonl"), 'a', encoding='utf-8')
+            self.segment_lines = 0
+            self.segment_bytes = 0
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.segment_file.write(line)
+        self.segment_lines += 1
+        self.segment_bytes += len(line.encode('utf-8'))
+        return {
+            "user_id": record.get("user_id", ""),
+            "lv_value": record.get("lv_value", ""),
+            "ai_model": record.get("ai_model", ""),
+            "timestamp": record.get("timestamp", ""),
+            "segment": self.segment_name,
+            "line": self.segment_lines - 1
+        }
+
+    def _append_index(self, entries):
+        if not entries:
+            return
+        with open(os.path.join(self.log_dir, INDEX_FILENAME), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+
+    def _rotate(self):
+        """現在のファイルをgzip圧縮して閉じ、上限を超えた古いファイルを削除"""
+        self.segment_file.close()
+        self.segment_file = None
+        self._compress_segment(self.segment_name)
+        if self.segment_lock is not None:
+            _release_lock_file(self.segment_lock)
+            self.segment_lock = None
+        self._enforce_disk_limit()
+
+    def _enforce_disk_limit(self):
+        max_bytes = self.settings["max_total_mb"] * 1024 * 1024
+        if not max_bytes:
+            return
+        segments = sorted(name for name in os.listdir(self.log_dir)
+                          if name.startswith(SEGMENT_PREFIX) and name.endswith(".jsonl.gz"))
+        sizes = {name: os.path.getsize(os.path.join(self.log_dir, name)) for name in segments}
+        total = sum(sizes.values())
+        removed = set()
+        for name in segments[:-1]:  # 直近のファイルは残す
+            if total <= max_bytes:
+                break
+            os.remove(os.path.join(self.log_dir, name))
+            total -= sizes[name]
+            removed.add(name[:-len(".jsonl.gz")])
+        if removed:
+            self._prune_index(removed)
+            print(f"[DEBUG] プロンプトログ: 古いファイル{len(removed)}件を削除")
+
+    def _prune_index(self, removed_segments):
+        index_path = os.path.join(self.log_dir, INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if json.loads(line).get("segment") not in removed_segments]
+        temp_path = index_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(temp_path, index_path)
+
+
+def _acquire_lock_file(lock_path):
+    """ロックファイルを開いて排他ロックを取得（他のプロセスが保持中ならNone）
+
+    ロックはプロセスの終了時にOSが解放するので、異常終了したプロセスのファイルはロックを取得できる。
+    """
+    lock_file = open(lock_path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _release_lock_file(lock_file):
+    """ロックを解放してロックファイルを削除"""
+    lock_path = lock_file.name
+    try:
+        if fcntl is None:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        lock_file.close()
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+
+def _open_segment(log_dir, segment):
+    plain_path = os.path.join(log_dir, segment + ".jsonl")
+    if os.path.exists(plain_path + ".gz"):
+        return gzip.open(plain_path + ".gz", 'rt', encoding='utf-8')
+    if os.path.exists(plain_path):
+        return open(plain_path, 'r', encoding='utf-8')
+    return None
+
+
+def read_prompt_logs(user_id=None, lv_value=None, log_dir=LOG_DIR):
+    """index.jsonl を使って user_id / lv_value に一致するログを古い順に返す"""
+    index_path = os.path.join(log_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return []
+
+    wanted = {}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if user_id is not None and entry.get("user_id") != user_id:
+                continue
+            if lv_value is not None and entry.get("lv_value") != lv_value:
+                continue
+            wanted.setdefault(entry["segment"], set()).add(entry["line"])
+
+    records = []
+    for segment in sorted(wanted):
+        f = _open_segment(log_dir, segment)
+        if f is None:
+            continue
+        with f:
+            for line_no, line in enumerate(f):
+                if line_no in wanted[segment]:
+                    records.append(json.loads(line))
+    return records
+
+
+def get_prompt_log_writer(settings=None):
+    """共有の書き込みスレッドを取得（settingsを渡すと prompt_log_settings を反映）"""
+    writer = PromptLogWriter.get_instance()
+    if settings is not None:
+        writer.configure(settings)
+    return writer
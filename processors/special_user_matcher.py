@@ -0,0 +1,72 @@
+# processors/special_user_matcher.py
+"""
+スペシャルユーザーのコメント照合
+
+CommentBatch の user_codes 列（整数コード）と監視対象IDの集合から、
+ユーザーごとのコメント行番号をまとめて返す。行ごとのprintや辞書の作成はしない。
+
+NumPyがあれば user_codes をコピーせずに np.frombuffer で参照し、
+「コード → 監視対象か」の表引きと安定ソートで一括して分類する。
+NumPyがない環境では itertools.compress を使った純Python実装で同じ結果を返す。
+"""
+from itertools import compress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def match_special_users(batch, special_user_ids, use_numpy=None):
+    """{user_id: [行番号, ...]} を返す（ユーザーは最初にコメントした順、行番号は昇順）"""
+    special_codes = batch.user_codes_for(special_user_ids)
+    if not special_codes or not len(batch):
+        return {}
+
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        groups = _group_rows_numpy(batch.user_codes, special_codes, len(batch.user_table))
+    else:
+        groups = _group_rows_python(batch.user_codes, special_codes, len(batch.user_table))
+
+    user_table = batch.user_table
+    return {user_table[code]: rows for code, rows in groups}
+
+
+def _group_rows_numpy(user_codes, special_codes, table_size):
+    codes = np.frombuffer(user_codes, dtype=np.intc)
+    is_special = np.zeros(table_size, dtype=bool)
+    is_special[list(special_codes)] = True
+
+    rows = np.flatnonzero(is_special[codes])
+    if not rows.size:
+        return []
+
+    # コードごとにまとめる（安定ソートなので各グループ内の行番号は昇順のまま）
+    matched_codes = codes[rows]
+    order = np.argsort(matched_codes, kind='stable')
+    sorted_codes = matched_codes[order]
+    sorted_rows = rows[order]
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], boundaries))
+    row_groups = np.split(sorted_rows, boundaries)
+
+    # 最初のコメントの行番号順に並べる
+    group_codes = sorted_codes[starts].tolist()
+    return [(group_codes[k], row_groups[k].tolist()) for k in np.argsort(sorted_rows[starts]).tolist()]
+
+
+def _group_rows_python(user_codes, special_codes, table_size):
+    is_special = bytearray(table_size)
+    for code in special_codes:
+        is_special[code] = 1
+
+    groups = {}
+    for row in compress(range(len(user_codes)), map(is_special.__getitem__, user_codes)):
+        code = user_codes[row]
+        group = groups.get(code)
+        if group is None:
+            group = groups[code] = []
+        group.append(row)
+    return list(groups.items())
@@ -0,0 +1,147 @@
+# processors/static_assets.py
+"""
+Step03の静的ファイル（templates/ の css, js, assets）の配置
+
+以前はパイプライン実行ごとに全ユーザーのディレクトリへ shutil.copytree でコピーしていた。
+ここでは
+
+1. テンプレートの各ファイルを内容のSHA-256で SpecialUser/AssetStore/ に1つだけ保存し
+2. ユーザーディレクトリの css/ js/ assets/ にはそのファイルへのハードリンクを置く
+   （ハードリンクを作れないファイルシステムではコピー）
+3. ユーザーディレクトリの .static_manifest.json に配置済みのハッシュを記録し、
+   テンプレートが変わっていないファイルは何もしない
+
+ページからの相対リンク（css/main.css など）は以前と同じ。
+ハードリンクは実体を共有するため、ユーザーディレクトリ側のファイルを直接編集しないこと
+（テンプレート側を編集すれば、次回の実行で変更されたファイルだけ差し替わる）。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from artifact_io import dump_json_artifact, load_json_artifact
+
+STATIC_DIRS = ("css", "js", "assets")
+# SpecialUser直下だがユーザーディレクトリ（{user_id}_{user_name}）と区別できるよう "_" を含めない
+ASSET_STORE_DIR = os.path.join("SpecialUser", "AssetStore")
+MANIFEST_FILENAME = ".static_manifest.json"
+
+# テンプレートのファイル → (サイズ, 更新時刻, ハッシュ)
+_digest_cache = {}
+# このプロセスで配置済みのユーザーディレクトリ → 配置したテンプレート一式のハッシュ
+_synced_dirs = {}
+# ハッシュのキャッシュと共有ディレクトリへの保存用
+_lock = threading.Lock()
+# ユーザーディレクトリ → 配置用のロック（別ユーザーへの配置は並列に行える）
+_dir_locks = {}
+
+
+def file_digest(path):
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cached_digest(path):
+    stat = os.stat(path)
+    cached = _digest_cache.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = file_digest(path)
+    _digest_cache[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def build_source_manifest(template_dir):
+    """テンプレートの静的ファイル一覧 {相対パス: ハッシュ}（相対パスの区切りは "/"）"""
+    manifest = {}
+    for static_dir in STATIC_DIRS:
+        root = os.path.join(template_dir, static_dir)
+        if not os.path.isdir(root):
+            continue
+        for current_dir, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(current_dir, filename)
+                relative_path = os.path.relpath(path, template_dir).replace(os.sep, '/')
+                manifest[relative_path] = _cached_digest(path)
+    return manifest
+
+
+def _store_file(source_path, digest, store_dir):
+    """内容ハッシュ名で共有ディレクトリに保存したファイルのパス（なければ作成）"""
+    store_path = os.path.join(store_dir, digest + os.path.splitext(source_path)[1])
+    if not os.path.exists(store_path):
+        os.makedirs(store_dir, exist_ok=True)
+        temp_path = store_path + ".tmp"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, store_path)
+    return store_path
+
+
+def _place_file(store_path, output_path):
+    """共有ファイルへのハードリンクを置く（できなければコピー）。リンクならTrue"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(store_path, output_path)
+        return True
+    except OSError:
+        shutil.copyfile(store_path, output_path)
+        return False
+
+
+def _get_dir_lock(output_dir):
+    with _lock:
+        lock = _dir_locks.get(output_dir)
+        if lock is None:
+            lock = _dir_locks[output_dir] = threading.Lock()
+        return lock
+
+
+def _load_manifest(path):
+    try:
+        return load_json_artifact(path)
+    except (OSError, ValueError):
+        return {}
+
+
+def sync_static_files(template_dir, output_dir, store_dir=ASSET_STORE_DIR):
+    """テンプレートの静的ファイルを output_dir に配置し、{"linked", "copied", "skipped"} の件数を返す"""
+    stats = {"linked": 0, "copied": 0, "skipped": 0}
+    with _lock:
+        source_manifest = build_source_manifest(template_dir)
+    source_digest = hashlib.sha256(json.dumps(source_manifest, sort_keys=True).encode('utf-8')).hexdigest()
+
+    with _get_dir_lock(output_dir):
+        if _synced_dirs.get(output_dir) == source_digest:
+            stats["skipped"] = len(source_manifest)
+            return stats
+
+        manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        placed = _load_manifest(manifest_path)
+        changed = False
+        for relative_path, digest in source_manifest.items():
+            output_path = os.path.join(output_dir, *relative_path.split('/'))
+            if placed.get(relative_path) == digest and os.path.exists(output_path):
+                stats["skipped"] += 1
+                continue
+            source_path = os.path.join(template_dir, *relative_path.split('/'))
+            with _lock:
+                store_path = _store_file(source_path, digest, store_dir)
+            stats["linked" if _place_file(store_path, output_path) else "copied"] += 1
+            placed[relative_path] = digest
+            changed = True
+
+        if changed:
+            os.makedirs(output_dir, exist_ok=True)
+            temp_path = manifest_path + ".tmp"
+            dump_json_artifact(placed, temp_path, allow_gzip=False)
+            os.replace(temp_path, manifest_path)
+        _synced_dirs[output_dir] = source_digest
+    return stats
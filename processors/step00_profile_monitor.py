@@ -10,6 +10,7 @@ import hashlib
 import logging
 from datetime import datetime
 from typing import Optional, Dict, Any
+import sys
 import requests
 from bs4 import BeautifulSoup
 from selenium import webdriver
@@ -18,6 +19,9 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact_io import dump_json_artifact, load_json_artifact
+
 # Seleniumのログを無効化
 logging.getLogger('selenium').setLevel(logging.CRITICAL)
 logging.getLogger('urllib3').setLevel(logging.CRITICAL)
@@ -151,8 +155,7 @@ class UserProfileMonitor:
         """config.jsonを読み込み"""
         try:
             if os.path.exists(self.config_path):
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_artifact(self.config_path)
             else:
                 # 新しい設定ファイルのテンプレート
                 return {
@@ -183,8 +186,11 @@ class UserProfileMonitor:
         try:
             config["metadata"]["updated_at"] = datetime.now().isoformat()
 
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            dump_json_artifact(config, self.config_path, allow_gzip=False)
+
+            # 共有のユーザー設定キャッシュに反映
+            from config_manager import SpecialUserRegistry
+            SpecialUserRegistry.get_instance().invalidate(self.user_id)
             return True
 
         except Exception as e:
@@ -335,8 +341,7 @@ def save_user_description_to_data_json(user_id: str, user_name: str, lv_value: s
         # 既存のdata.jsonを読み込み（存在しない場合は空の辞書）
         data = {}
         if os.path.exists(data_json_path):
-            with open(data_json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = load_json_artifact(data_json_path)
 
         # ユーザー説明文を追加
         if 'user_profile' not in data:
@@ -346,8 +351,7 @@ def save_user_description_to_data_json(user_id: str, user_name: str, lv_value: s
         data['user_profile']['last_updated'] = datetime.now().isoformat()
 
         # data.jsonに保存
-        with open(data_json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        dump_json_artifact(data, data_json_path)
 
     except Exception as e:
         print(f"data.json保存エラー: {e}")
\ No newline at end of file
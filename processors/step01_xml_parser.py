@@ -1,7 +1,12 @@
 import xml.etree.ElementTree as ET
 import os
+import re
+import sys
 import json
 from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from processors.comment_batch import COMMENT_FIELDS, CommentBatch
+from artifact_io import dump_json_artifact
 
 def strip_namespace(elem):
     """XMLの全要素から名前空間を剥がす"""
@@ -24,32 +29,62 @@ def process(pipeline_data):
         if not os.path.exists(xml_path):
             raise FileNotFoundError(f"XMLファイルが見つかりません: {xml_path}")
 
-        # コメント解析
-        print("[DEBUG] コメントデータ解析開始")
-        comments_data = parse_ncv_xml(xml_path)
-        print(f"[DEBUG] コメントデータ解析完了: {len(comments_data)}件")
+        broadcast_dir = get_broadcast_dir(lv_value, subfolder_name)
+        cache_enabled = is_comment_cache_enabled(pipeline_data.get('config'))
+        tail_reader = pipeline_data.get('tail_reader')
+
+        # 再接続で同じlvのログが複数に分かれている場合はまとめて扱う
+        xml_paths = [xml_path]
+        if is_xml_merge_enabled(pipeline_data.get('config')):
+            xml_paths += find_sibling_xmls(xml_path, lv_value)
+            if len(xml_paths) > 1:
+                print(f"[DEBUG] 同一放送のXMLを統合: {xml_paths}")
 
-        # 放送情報解析
-        print("[DEBUG] 放送情報抽出開始")
-        broadcast_info = extract_broadcast_info(xml_path)
+        # 変換できずに捨てた<chat>の件数（キャッシュから読んだ場合は解析しないので0）
+        parse_stats = {"rows": 0, "error_rows": 0}
+
+        cached = load_comment_cache(broadcast_dir, xml_paths) if cache_enabled else None
+        if cached is not None:
+            # 同じXMLから作成済みのバイナリキャッシュを使用（XML/JSONの解析を省略）
+            print("[DEBUG] コメントキャッシュから取得")
+            comments_data, broadcast_info = cached
+        elif tail_reader is not None:
+            # 監視中に逐次解析済みのバッファを使用（追記分だけ読み込む）
+            print("[DEBUG] 逐次解析バッファから取得")
+            comments_data, broadcast_info = tail_reader.finish()
+            parse_stats["error_rows"] += tail_reader.error_count
+            if not broadcast_info.get('live_title') and not broadcast_info.get('start_time'):
+                broadcast_info = extract_broadcast_info(xml_path)
+        else:
+            # コメント解析 + 放送情報抽出（1パス）
+            print("[DEBUG] コメントデータ・放送情報解析開始")
+            comments_data, broadcast_info = parse_ncv_log(xml_path, stats=parse_stats)
+        if cached is None and len(xml_paths) > 1:
+            merge_ncv_logs(comments_data, broadcast_info, xml_paths[1:], stats=parse_stats)
+        print(f"[DEBUG] コメントデータ解析完了: {len(comments_data)}件")
         print(f"[DEBUG] 放送情報抽出完了: {broadcast_info}")
 
         # 統合データ作成
         print("[DEBUG] 統合JSON作成開始")
         integrated_data = create_integrated_json(lv_value, subfolder_name, broadcast_info, comments_data)
 
-        # 保存
+        # 保存（キャッシュから読んだ場合comments.jsonは変わらないので書き直さない）
         print("[DEBUG] JSONファイル保存開始")
-        save_json_files(lv_value, subfolder_name, integrated_data, comments_data)
+        save_json_files(lv_value, subfolder_name, integrated_data, comments_data,
+                        write_comments=cached is None)
+        if cache_enabled and cached is None:
+            save_comment_cache(broadcast_dir, xml_paths, comments_data, broadcast_info)
 
         print(f"Step01 完了: コメント数 {len(comments_data)}")
 
         return {
             "comments_count": len(comments_data),
+            "error_rows": parse_stats["error_rows"],
             "comments_data": comments_data,
             "broadcast_info": broadcast_info,
             "integrated_data": integrated_data,
-            "xml_path": xml_path
+            "xml_path": xml_path,
+            "xml_paths": xml_paths
         }
 
     except Exception as e:
@@ -58,44 +93,176 @@ def process(pipeline_data):
         traceback.print_exc()
         raise
 
-def parse_ncv_xml(xml_path):
-    """NCVのXMLファイルからコメントデータを解析"""
-    tree = ET.parse(xml_path)
-    root = strip_namespace(tree.getroot())
+def local_name(tag):
+    """名前空間付きタグ名からローカル名を取得"""
+    if isinstance(tag, str) and '}' in tag:
+        return tag.split('}', 1)[1]
+    return tag
+
+# ルート直下で保持するヘッダー要素（放送情報の抽出用）
+HEADER_TAGS = ('LiveInfo', 'PlayerStatus')
+
+def iter_chat_elements(xml_path, header=None):
+    """NCVのXMLファイルから<chat>要素を1件ずつ読み出すジェネレータ（iterparseによるストリーミング）
 
-    comments = []
-    chat_elements = root.findall('.//chat')
-    print(f"XMLから{len(chat_elements)}個のコメントを検出")
+    読み終わった要素は都度解放するため、巨大なログでもメモリ使用量は一定に保たれる。
+    headerに辞書を渡すと、ルート直下のLiveInfo/PlayerStatus要素（名前空間剥がし済み）を
+    同じパスの中で格納する。
+    """
+    # 開いている要素のスタック（親要素から処理済みの子を切り離すため）
+    stack = []
+
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        tag = local_name(elem.tag)
+
+        if tag != 'chat':
+            if header is not None and tag in HEADER_TAGS and len(stack) == 1 and tag not in header:
+                header[tag] = strip_namespace(elem)
+            continue
 
-    for chat in chat_elements:
         try:
-            comment_date = int(chat.get('date', 0))
-            if comment_date == 0:
-                continue
-            comments.append({
-                "no": int(chat.get('no', 0)),
-                "user_id": chat.get('user_id', ''),
-                "user_name": chat.get('name', ''),
-                "text": chat.text or '',
-                "date": comment_date,
-                "premium": int(chat.get('premium', 0)),
-                "anonymity": 'anonymity' in chat.attrib
-            })
+            yield elem
+        finally:
+            # 読み終わった<chat>を親ごと解放
+            elem.clear()
+            if stack:
+                del stack[-1][:]
+
+def iter_ncv_chats(xml_path, header=None):
+    """<chat>をコメント辞書として1件ずつ返すジェネレータ
+
+    dateが0のコメントはスキップし、ファイル内の出現順で返す（ソートはしない）。
+    """
+    for chat in iter_chat_elements(xml_path, header=header):
+        try:
+            row = chat_element_to_row(chat)
         except (ValueError, TypeError) as e:
             print(f"コメント解析エラー: {e}")
             continue
+        if row is not None:
+            yield dict(zip(COMMENT_FIELDS, row))
+
+def chat_element_to_row(chat):
+    """<chat>要素をCOMMENT_FIELDS順のタプルに変換（dateが0のものはNone）
+
+    数値属性は int() でそのまま変換する（isdecimal() で事前に検査する高速パスはこれより遅い。
+    utils/benchmark_pipeline.py の step01-fastpath で比較できる）。
+    """
+    comment_date = int(chat.get('date', 0))
+    if comment_date == 0:
+        return None
+    return (
+        int(chat.get('no', 0)),
+        chat.get('user_id', ''),
+        chat.get('name', ''),
+        chat.text or '',
+        comment_date,
+        int(chat.get('premium', 0)),
+        'anonymity' in chat.attrib,
+        chat.get('thread', '')
+    )
+
+def chat_element_to_comment(chat):
+    """<chat>要素をコメント辞書に変換（dateが0のものはNone）"""
+    row = chat_element_to_row(chat)
+    return dict(zip(COMMENT_FIELDS, row)) if row is not None else None
+
+def parse_ncv_xml(xml_path):
+    """NCVのXMLファイルからコメントデータを解析（辞書のリストを返す互換API）"""
+    comments = list(iter_ncv_chats(xml_path))
+    print(f"XMLから{len(comments)}個のコメントを検出")
 
     comments.sort(key=lambda x: x['date'])
     print(f"有効なコメント: {len(comments)}個")
     return comments
 
+def parse_ncv_log(xml_path, stats=None):
+    """コメントデータ（CommentBatch）と放送情報を1回のストリーミング解析でまとめて取得
+
+    statsに辞書を渡すと、解析した<chat>の件数（rows）と変換できずに捨てた件数（error_rows）を加算する。
+    """
+    header = {}
+    comments = CommentBatch()
+    append = comments.append
+    rows = error_rows = 0
+
+    for chat in iter_chat_elements(xml_path, header=header):
+        rows += 1
+        try:
+            row = chat_element_to_row(chat)
+        except (ValueError, TypeError) as e:
+            error_rows += 1
+            print(f"コメント解析エラー: {e}")
+            continue
+        if row is not None:
+            append(*row)
+    print(f"XMLから{len(comments)}個のコメントを検出")
+    if error_rows:
+        print(f"[DEBUG] 解析できなかった<chat>: {error_rows}件 / {rows}件")
+
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + rows
+        stats["error_rows"] = stats.get("error_rows", 0) + error_rows
+
+    comments.sort_by_date()
+    broadcast_info = build_broadcast_info(header.get('LiveInfo'), header.get('PlayerStatus'))
+    return comments, broadcast_info
+
+# === 同一放送の複数XMLの統合 ===
+
+def is_xml_merge_enabled(config):
+    """設定で同一lvのXML統合が有効か（未設定時は有効）"""
+    if not isinstance(config, dict):
+        return True
+    return config.get('xml_merge_settings', {}).get('enabled', True)
+
+def find_sibling_xmls(xml_path, lv_value):
+    """同じフォルダにある同一lvの別XML（ncvLog_{lv}*.xml）を名前順に列挙"""
+    directory = os.path.dirname(xml_path)
+    # lv123 が lv1234 に一致しないよう、lvの直後が数字でないものだけ
+    pattern = re.compile(rf'^ncvLog_{re.escape(lv_value)}(?!\d).*\.xml$')
+    own_path = os.path.normcase(os.path.abspath(xml_path))
+
+    siblings = []
+    for filename in sorted(os.listdir(directory or '.')):
+        path = os.path.join(directory, filename)
+        if pattern.match(filename) and os.path.normcase(os.path.abspath(path)) != own_path:
+            siblings.append(path)
+    return siblings
+
+def merge_ncv_logs(comments_data, broadcast_info, xml_paths, stats=None):
+    """別XMLのコメントをスレッドとコメント番号（thread, no）で重複排除して統合（comments_data / broadcast_infoを更新）"""
+    for path in xml_paths:
+        try:
+            other_comments, other_info = parse_ncv_log(path, stats=stats)
+        except Exception as e:
+            print(f"統合対象XMLの解析エラー: {path} - {e}")
+            continue
+        added = comments_data.merge(other_comments)
+        print(f"[DEBUG] XML統合: {os.path.basename(path)} から{added}件追加（重複{len(other_comments) - added}件）")
+
+        # 先頭のXMLで空だった放送情報を補完
+        for key, value in other_info.items():
+            if value and not broadcast_info.get(key):
+                broadcast_info[key] = value
+
+    comments_data.sort_by_date()
+    return comments_data, broadcast_info
+
 def extract_broadcast_info(xml_path):
     """XMLから放送情報を抽出（名前空間剥がし後）"""
-    tree = ET.parse(xml_path)
-    root = strip_namespace(tree.getroot())
+    header = {}
+    for _ in iter_chat_elements(xml_path, header=header):
+        pass
+    return build_broadcast_info(header.get('LiveInfo'), header.get('PlayerStatus'))
 
-    live_info = root.find('LiveInfo')
-    player_status = root.find('PlayerStatus')
+def build_broadcast_info(live_info, player_status):
+    """LiveInfo/PlayerStatus要素から放送情報の辞書を作成"""
     stream = player_status.find('Stream') if player_status is not None else None
 
     broadcast_info = {
@@ -137,15 +304,62 @@ def create_integrated_json(lv_value, subfolder_name, broadcast_info, comments_da
         "special_user_analysis": {}
     }
 
-def save_json_files(lv_value, subfolder_name, integrated_data, comments_data):
+def get_broadcast_dir(lv_value, subfolder_name):
+    """放送データの保存ディレクトリ"""
+    return os.path.join("SpecialUser", "BroadCastData", subfolder_name, lv_value)
+
+def save_json_files(lv_value, subfolder_name, integrated_data, comments_data, write_comments=True):
     """JSONファイルを保存"""
-    broadcast_dir = os.path.join("SpecialUser", "BroadCastData", subfolder_name, lv_value)
+    broadcast_dir = get_broadcast_dir(lv_value, subfolder_name)
     os.makedirs(broadcast_dir, exist_ok=True)
 
-    with open(os.path.join(broadcast_dir, "data.json"), 'w', encoding='utf-8') as f:
-        json.dump(integrated_data, f, ensure_ascii=False, indent=2)
+    dump_json_artifact(integrated_data, os.path.join(broadcast_dir, "data.json"))
 
-    with open(os.path.join(broadcast_dir, "comments.json"), 'w', encoding='utf-8') as f:
-        json.dump(comments_data, f, ensure_ascii=False, indent=2)
+    if write_comments:
+        dump_json_artifact(comments_data.to_dicts(), os.path.join(broadcast_dir, "comments.json"))
 
     print(f"JSONファイル保存完了: {broadcast_dir}")
+
+# === バイナリコメントキャッシュ（comments.bin） ===
+
+COMMENT_CACHE_FILENAME = "comments.bin"
+
+def is_comment_cache_enabled(config):
+    """設定でコメントキャッシュが有効か（未設定時は有効）"""
+    if not isinstance(config, dict):
+        return True
+    return config.get('comment_cache_settings', {}).get('enabled', True)
+
+def get_source_signature(xml_path):
+    """キャッシュの鮮度判定に使うXMLのサイズと更新時刻"""
+    stat = os.stat(xml_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def save_comment_cache(broadcast_dir, xml_paths, comments_data, broadcast_info):
+    """comments.jsonと同じ場所にバイナリキャッシュを書き出す（統合した全XMLを記録）"""
+    cache_path = os.path.join(broadcast_dir, COMMENT_CACHE_FILENAME)
+    try:
+        comments_data.save_binary(cache_path, meta={
+            "xml_paths": [os.path.abspath(path) for path in xml_paths],
+            "sources": [get_source_signature(path) for path in xml_paths],
+            "broadcast_info": broadcast_info
+        })
+        print(f"コメントキャッシュ保存: {cache_path}")
+    except Exception as e:
+        print(f"コメントキャッシュ保存エラー: {e}")
+
+def load_comment_cache(broadcast_dir, xml_paths):
+    """どのXMLも更新・追加されていなければキャッシュから (CommentBatch, 放送情報) を返す（無効ならNone）"""
+    cache_path = os.path.join(broadcast_dir, COMMENT_CACHE_FILENAME)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        comments_data, meta = CommentBatch.load_binary(cache_path)
+        if (meta.get("xml_paths") != [os.path.abspath(path) for path in xml_paths]
+                or meta.get("sources") != [get_source_signature(path) for path in xml_paths]):
+            print("[DEBUG] XMLが更新されているためコメントキャッシュを使用しません")
+            return None
+        return comments_data, meta.get("broadcast_info", {})
+    except Exception as e:
+        print(f"コメントキャッシュ読み込みエラー: {e}")
+        return None
@@ -1,10 +1,27 @@
 import concurrent.futures
 from datetime import datetime
-import re
+import json
 import sys
 import os
+import threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from gui.utils import log_to_gui
+from processors.comment_batch import CommentBatch
+from processors.special_user_matcher import match_special_users
+from processors.ai_scheduler import estimate_tokens, get_ai_scheduler
+from processors.ai_cache import get_ai_cache, make_cache_key
+from processors.prompt_budget import build_comment_content
+from processors.prompt_log_writer import get_prompt_log_writer
+from processors.ai_response_normalizer import normalize_ai_response
+
+# 分析待ちユーザーを抱えるスレッド数の上限（実際のAPI同時実行数はAIスケジューラが制御）
+MAX_ANALYSIS_THREADS = 32
+
+# プロバイダクライアントのプロセス共通プール（ユーザー・パイプライン間でHTTP接続を再利用）
+_client_pool_lock = threading.Lock()
+_openai_clients = {}          # (api_key, base_url) → openai.OpenAI
+_gemini_models = {}           # (api_key, model_name) → genai.GenerativeModel
+_gemini_configured_key = None
 
 def process(pipeline_data):
     """Step02: スペシャルユーザー検索 + AI分析"""
@@ -36,8 +53,13 @@ def process(pipeline_data):
                 "found_users": []
             }
         
-        # AI分析を並列実行
-        analyzed_users = perform_ai_analysis_parallel(found_users_data, config)
+        for user_data in found_users_data:
+            user_data['lv_value'] = lv_value
+
+        # AI分析を並列実行（完了したユーザーから後続ステップへ渡す）
+        analyzed_users = perform_ai_analysis_parallel(
+            found_users_data, config, pipeline_data.get('on_user_analyzed')
+        )
         
         print(f"Step02 完了: 検出スペシャルユーザー数 {len(analyzed_users)}")
         
@@ -63,74 +85,171 @@ def get_special_users_from_config(config):
 
 def find_special_users_in_comments(comments_data, special_users):
     """コメントからスペシャルユーザーを検索"""
-    found_users = {}
+    comments_data = CommentBatch.from_comments(comments_data)
+    found_users = []
     
     print(f"検索対象コメント数: {len(comments_data)}")
     
-    for comment in comments_data:
-        user_id = comment.get('user_id', '')
-        user_name = comment.get('user_name', '')
-        
-        if user_id in special_users:
-            if user_id not in found_users:
-                found_users[user_id] = {
-                    'user_id': user_id,
-                    'user_name': user_name or f"ユーザー{user_id}",
-                    'comments': []
-                }
-            
-            # コメント情報を追加
-            comment_data = {
-                'no': comment.get('no', ''),
-                'date': comment.get('date', ''),
-                'text': comment.get('text', ''),
-                'premium': comment.get('premium', ''),
-                'name': comment.get('user_name', '')
-            }
-            found_users[user_id]['comments'].append(comment_data)
-            print(f"スペシャルユーザーコメント検出: {user_id} - {comment_data['text'][:50]}")
+    # user_codes列を監視対象IDのコードと一括照合し、ユーザーごとの行番号を取得
+    matched_rows = match_special_users(comments_data, special_users)
+    name_table = comments_data.name_table
+    name_codes = comments_data.name_codes
+    
+    for user_id, rows in matched_rows.items():
+        user_name = name_table[name_codes[rows[0]]]
+        comments = [{
+            'no': comments_data.no[index],
+            'date': comments_data.date[index],
+            'text': comments_data.text[index],
+            'premium': comments_data.premium[index],
+            'name': name_table[name_codes[index]]
+        } for index in rows]
+        found_users.append({
+            'user_id': user_id,
+            'user_name': user_name or f"ユーザー{user_id}",
+            'comments': comments
+        })
+        print(f"スペシャルユーザーコメント検出: {user_id} - {len(comments)}件")
     
-    print(f"スペシャルユーザー検出: {list(found_users.keys())}")
-    return list(found_users.values())
+    print(f"スペシャルユーザー検出: {list(matched_rows.keys())}")
+    return found_users
 
-def perform_ai_analysis_parallel(found_users_data, config):
-    """AI分析を並列実行"""
+def perform_ai_analysis_parallel(found_users_data, config, on_user_analyzed=None):
+    """AI分析を並列実行（on_user_analyzed があれば完了したユーザーごとに呼ぶ）"""
     analyzed_users = []
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # 各ユーザーのAI分析を並列実行
-        future_to_user = {
-            executor.submit(analyze_single_user, user_data, config): user_data
-            for user_data in found_users_data
-        }
+    scheduler = get_ai_scheduler(config.get("api_settings", {}) if isinstance(config, dict) else {})
+    get_prompt_log_writer(config.get("prompt_log_settings", {}) if isinstance(config, dict) else {})
+    max_workers = max(1, min(MAX_ANALYSIS_THREADS, len(found_users_data)))
+
+    # コメントの少ないユーザーはまとめて1リクエストで分析（batch_analysis有効時）
+    batches, single_users = split_analysis_batches(found_users_data, config)
+
+    def finish_user(user_data, analysis_data=None, error=None):
+        if error is None:
+            user_data['ai_analysis'] = analysis_data['analysis_result']
+            user_data['ai_model_used'] = analysis_data['model_used']  # ★ 追加
+            user_data['ai_prompt_used'] = analysis_data['prompt_used']  # ★ 追加
+            print(f"AI分析完了: {user_data['user_id']} (モデル: {analysis_data['model_used']})")
+            log_to_gui(f"ユーザー {user_data.get('user_name', user_data['user_id'])} のAI分析が完了しました")
+        else:
+            print(f"AI分析エラー: {user_data['user_id']} - {str(error)}")
+            # エラー時は基本分析で継続
+            user_data['ai_analysis'] = generate_basic_analysis(user_data['comments'])
+            user_data['ai_model_used'] = 'basic_fallback'  # ★ 追加
+            user_data['ai_prompt_used'] = 'error_fallback'  # ★ 追加
+        analyzed_users.append(user_data)
+
+        # 残りのユーザーの分析を待たずにHTML・DB保存を進める
+        if on_user_analyzed:
+            on_user_analyzed(user_data)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 各ユーザー（まとめて分析するユーザーはバッチ単位）のAI分析を並列実行
+        pending = {}
+        for ai_model, batch_users, settings in batches:
+            future = executor.submit(analyze_user_batch, batch_users, config, ai_model, settings)
+            pending[future] = ('batch', batch_users)
+        for user_data in single_users:
+            pending[executor.submit(analyze_single_user, user_data, config)] = ('user', user_data)
 
         log_to_gui(f"{len(found_users_data)}人のスペシャルユーザーをAI分析中...")
         
-        for future in concurrent.futures.as_completed(future_to_user):
-            user_data = future_to_user[future]
-            try:
-                analysis_data = future.result()  # ★ 辞書で受け取る
-                user_data['ai_analysis'] = analysis_data['analysis_result']
-                user_data['ai_model_used'] = analysis_data['model_used']  # ★ 追加
-                user_data['ai_prompt_used'] = analysis_data['prompt_used']  # ★ 追加
-                analyzed_users.append(user_data)
-                print(f"AI分析完了: {user_data['user_id']} (モデル: {analysis_data['model_used']})")
-                log_to_gui(f"ユーザー {user_data.get('user_name', user_data['user_id'])} のAI分析が完了しました")
-            except Exception as e:
-                print(f"AI分析エラー: {user_data['user_id']} - {str(e)}")
-                # エラー時は基本分析で継続
-                user_data['ai_analysis'] = generate_basic_analysis(user_data['comments'])
-                user_data['ai_model_used'] = 'basic_fallback'  # ★ 追加
-                user_data['ai_prompt_used'] = 'error_fallback'  # ★ 追加
-                analyzed_users.append(user_data)
-    
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind, target = pending.pop(future)
+                if kind == 'user':
+                    try:
+                        finish_user(target, future.result())  # ★ 辞書で受け取る
+                    except Exception as e:
+                        finish_user(target, error=e)
+                    continue
+
+                batch_users = target
+                try:
+                    batch_results = future.result()
+                except Exception as e:
+                    print(f"まとめて分析エラー: {len(batch_users)}人 - {str(e)}")
+                    batch_results = {}
+
+                for user_data in batch_users:
+                    if user_data['user_id'] in batch_results:
+                        finish_user(user_data, batch_results[user_data['user_id']])
+                    else:
+                        # 結果が欠けたユーザーは個別に分析し直す
+                        pending[executor.submit(analyze_single_user, user_data, config)] = ('user', user_data)
+
+    print(f"[DEBUG] AIスケジューラ: {scheduler.format_metrics()}")
     return analyzed_users
 
+def get_openai_client(api_key, base_url=None):
+    """APIキーごとに共有のOpenAIクライアントを取得（内部の接続プールでkeep-aliveを再利用）"""
+    with _client_pool_lock:
+        client = _openai_clients.get((api_key, base_url))
+        if client is None:
+            import openai
+            # 再試行はAIスケジューラ側で行う（SDK内の再試行は無効化）
+            client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+            _openai_clients[(api_key, base_url)] = client
+        return client
+
+
+def get_gemini_model(api_key, model_name):
+    """APIキー・モデルごとに共有のGenerativeModelを取得"""
+    global _gemini_configured_key
+    with _client_pool_lock:
+        model = _gemini_models.get((api_key, model_name))
+        if model is None:
+            import google.generativeai as genai
+            if _gemini_configured_key != api_key:
+                # genai.configure はプロセス全体の設定なので、キーが変わったときだけ呼んで作り直す
+                genai.configure(api_key=api_key)
+                _gemini_configured_key = api_key
+                _gemini_models.clear()
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[(api_key, model_name)] = model
+        return model
+
+
+DEFAULT_SYSTEM_PROMPT = "あなたは配信コメントの分析専門家です。ユーザーの行動パターンや特徴を詳しく分析してください。"
+
+
+def resolve_user_analysis_settings(user_id):
+    """個別設定（SpecialUser/ユーザーID_表示名/config.json）とグローバル設定からAI分析設定を決定"""
+    from config_manager import HierarchicalConfigManager
+
+    # ★ HierarchicalConfigManagerを使用（ユーザー設定は共有キャッシュから取得）
+    config_manager = HierarchicalConfigManager()
+    user_config = config_manager.get_user_config(user_id)
+    ai_analysis_config = user_config.get("ai_analysis", {})
+
+    # グローバル設定からデフォルト値を取得
+    ai_settings = config_manager.load_global_config().get("api_settings", {})
+
+    use_default = ai_analysis_config.get("use_default_prompt", True)
+    if use_default:
+        prompt_template = ai_settings.get("default_analysis_prompt", "")
+    else:
+        prompt_template = ai_analysis_config.get("custom_prompt", "")
+
+    return {
+        'user_config': user_config,
+        'ai_analysis_config': ai_analysis_config,
+        'enabled': ai_analysis_config.get("enabled", True),
+        'model': (
+            ai_analysis_config.get("model")
+            or ai_settings.get("summary_ai_model")
+            or "openai-gpt4o"
+        ),
+        'use_default_prompt': use_default,
+        'prompt_template': prompt_template,
+        'system_prompt': ai_settings.get("analysis_system_prompt", DEFAULT_SYSTEM_PROMPT)
+    }
+
+
 # === 置換: analyze_single_user（個別設定優先） ===
 def analyze_single_user(user_data, config):
     """個別設定（SpecialUser/ユーザーID_表示名/config.json）を優先してAI分析を実行"""
-    from config_manager import HierarchicalConfigManager
-
     user_id = user_data['user_id']
     user_name = user_data.get('user_name', '')
     comments = user_data.get('comments', [])
@@ -142,43 +261,22 @@ def analyze_single_user(user_data, config):
             'prompt_used': ''
         }
 
-    # ★ HierarchicalConfigManagerを使用
-    config_manager = HierarchicalConfigManager()
-    
-    # ユーザー設定を取得（SpecialUser/ユーザーID_表示名/config.jsonから）
-    user_config = config_manager.get_user_config(user_id)
+    settings = resolve_user_analysis_settings(user_id)
     
     print(f"[DEBUG] 設定読み込み: {user_id}_{user_name}")
     print(f"[DEBUG] 設定パス: SpecialUser/{user_id}_{user_name}/config.json")
-    print(f"[DEBUG] 設定内容: {list(user_config.keys())}")
+    print(f"[DEBUG] 設定内容: {list(settings['user_config'].keys())}")
 
-    # AI設定を取得
-    ai_analysis_config = user_config.get("ai_analysis", {})
-
-    # 有効・モデル決定
-    analysis_enabled = ai_analysis_config.get("enabled", True)
-    
-    # グローバル設定からデフォルト値を取得
-    global_config = config_manager.load_global_config()
-    ai_settings = global_config.get("api_settings", {})
-    
-    ai_model = (
-        ai_analysis_config.get("model")
-        or ai_settings.get("summary_ai_model")
-        or "openai-gpt4o"
-    )
+    analysis_enabled = settings['enabled']
+    ai_model = settings['model']
+    prompt_template = settings['prompt_template']
 
     # プロンプト決定
-    print(f"[DEBUG] ai_analysis_config: {ai_analysis_config}")
-    use_default = ai_analysis_config.get("use_default_prompt", True)
-    print(f"[DEBUG] use_default_prompt: {use_default}")
-    if use_default:
-        # デフォルトプロンプトを使用
-        prompt_template = ai_settings.get("default_analysis_prompt", "")
+    print(f"[DEBUG] ai_analysis_config: {settings['ai_analysis_config']}")
+    print(f"[DEBUG] use_default_prompt: {settings['use_default_prompt']}")
+    if settings['use_default_prompt']:
         print(f"[DEBUG] Using DEFAULT prompt: {prompt_template[:100]}...")
     else:
-        # カスタムプロンプトを使用
-        prompt_template = ai_analysis_config.get("custom_prompt", "")
         print(f"[DEBUG] Using CUSTOM prompt: {prompt_template}")
 
     # 変数注入込みの最終プロンプトを構築
@@ -198,7 +296,7 @@ def analyze_single_user(user_data, config):
     try:
         if ai_model == "openai-gpt4o":
             # グローバル設定からシステムプロンプトを取得
-            system_prompt = ai_settings.get("analysis_system_prompt", "あなたは配信コメントの分析専門家です。ユーザーの行動パターンや特徴を詳しく分析してください。")
+            system_prompt = settings['system_prompt']
             print(f"[DEBUG] Using system prompt: {system_prompt}")
 
             analysis_result, used_prompt = generate_openai_analysis_with_prompt(
@@ -243,7 +341,6 @@ def analyze_single_user(user_data, config):
 def generate_openai_analysis_with_prompt(user_data, config, full_prompt: str, system_prompt: str, model_name: str = "gpt-4o"):
     """OpenAIをプロンプト直指定で実行し、クリーン済みHTMLを返す"""
     try:
-        import openai
         api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
         openai_api_key = api_settings.get("openai_api_key", "")
 
@@ -251,18 +348,32 @@ def generate_openai_analysis_with_prompt(user_data, config, full_prompt: str, sy
             print("OpenAI APIキーが設定されていません")
             return generate_basic_analysis(user_data.get('comments', [])), "no_api_key"
 
-        client = openai.OpenAI(api_key=openai_api_key)
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": full_prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
+        # 同じモデル・プロンプトの分析済み結果があればAPIを呼ばない
+        cache = get_ai_cache(api_settings)
+        cache_key = make_cache_key(f"openai:{model_name}", system_prompt, full_prompt)
+        cached_result = cache.get(cache_key) if cache else None
+        if cached_result is not None:
+            print(f"[DEBUG] AI分析キャッシュヒット: {user_data.get('user_id')} ({model_name})")
+            return cached_result, full_prompt
+
+        client = get_openai_client(openai_api_key)
+        response = get_ai_scheduler(api_settings).run(
+            "openai",
+            lambda: client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": full_prompt}
+                ],
+                max_tokens=1500,
+                temperature=0.7
+            ),
+            estimated_tokens=estimate_tokens(system_prompt, full_prompt) + 1500
         )
         ai_result = response.choices[0].message.content.strip()
         ai_result = clean_ai_response(ai_result)
+        if cache:
+            cache.put(cache_key, f"openai:{model_name}", ai_result)
 
         # ログ保存
         save_prompt_to_file("openai", user_data, system_prompt, full_prompt, ai_result)
@@ -277,7 +388,6 @@ def generate_openai_analysis_with_prompt(user_data, config, full_prompt: str, sy
 def generate_gemini_analysis_with_prompt(user_data, config, full_prompt: str, model_name: str = "gemini-2.5-flash"):
     """Geminiをプロンプト直指定で実行し、クリーン済みHTMLを返す"""
     try:
-        import google.generativeai as genai
         api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
         google_api_key = api_settings.get("google_api_key", "")
 
@@ -285,11 +395,23 @@ def generate_gemini_analysis_with_prompt(user_data, config, full_prompt: str, mo
             print("Google APIキーが設定されていません")
             return generate_basic_analysis(user_data.get('comments', [])), "no_api_key"
 
-        genai.configure(api_key=google_api_key)
-        model = genai.GenerativeModel(model_name)
+        cache = get_ai_cache(api_settings)
+        cache_key = make_cache_key(f"gemini:{model_name}", "", full_prompt)
+        cached_result = cache.get(cache_key) if cache else None
+        if cached_result is not None:
+            print(f"[DEBUG] AI分析キャッシュヒット: {user_data.get('user_id')} ({model_name})")
+            return cached_result, full_prompt
+
+        model = get_gemini_model(google_api_key, model_name)
 
-        response = model.generate_content(full_prompt)
+        response = get_ai_scheduler(api_settings).run(
+            "gemini",
+            lambda: model.generate_content(full_prompt),
+            estimated_tokens=estimate_tokens(full_prompt) + 1500
+        )
         ai_result = clean_ai_response(response.text)
+        if cache:
+            cache.put(cache_key, f"gemini:{model_name}", ai_result)
 
         # ログ保存（system_promptはないので空で保存）
         save_prompt_to_file("gemini", user_data, "", full_prompt, ai_result)
@@ -303,323 +425,251 @@ def generate_gemini_analysis_with_prompt(user_data, config, full_prompt: str, mo
 
 
 
+# === 追加: コメントの少ないユーザーのまとめて分析 ===
+DEFAULT_BATCH_SETTINGS = {"enabled": False, "max_comments_per_user": 5, "max_users_per_batch": 8}
+
+# まとめて分析に対応するモデル → (プロバイダ, APIのモデル名)
+BATCH_MODELS = {
+    "openai-gpt4o": ("openai", "gpt-4o"),
+    "google-gemini-2.5-flash": ("gemini", "gemini-2.5-flash"),
+}
+
+# まとめて分析の出力トークン（1ユーザーあたり / 1リクエストの上限）
+# 1リクエストの人数はこの上限に収まる数までに抑える（応答のJSONが途中で切れないように）
+BATCH_OUTPUT_TOKENS_PER_USER = 600
+BATCH_MAX_OUTPUT_TOKENS = 16000
+
+BATCH_INSTRUCTION = (
+    "以下の分析指示を、後に続く{count}人のユーザー（「=== user_id: ... ===」の欄）それぞれに対して"
+    "個別に適用し、ユーザーごとに独立した分析を行ってください。\n"
+    "出力は次の形式のJSONのみとし、analysis には各ユーザーの分析結果をそのまま入れてください:\n"
+    '{{"results": [{{"user_id": "ユーザーID", "analysis": "分析結果"}}]}}'
+)
+
+# 共通の分析指示に埋め込むユーザーごとの変数（実際の値は各ユーザーの欄に書く）
+BATCH_USER_VARIABLES = {
+    "user": "（各ユーザーの表示名）",
+    "user_name": "（各ユーザーの表示名）",
+    "user_id": "（各ユーザーのID）",
+    "comment_content": "（各ユーザーの欄のコメント）",
+    "comment_count": "（各ユーザーの欄のコメント数）",
+}
+
+
+def get_batch_settings(config):
+    """api_settings.batch_analysis の設定を取得"""
+    api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
+    return {**DEFAULT_BATCH_SETTINGS, **(api_settings.get("batch_analysis") or {})}
+
+
+def split_analysis_batches(found_users_data, config):
+    """まとめて分析するユーザー [(モデル, ユーザー一覧, 分析設定)] と個別に分析するユーザーに分ける"""
+    batch_settings = get_batch_settings(config)
+    if not batch_settings.get("enabled"):
+        return [], list(found_users_data)
+
+    max_comments = int(batch_settings.get("max_comments_per_user", 5))
+    batch_size = max(2, min(int(batch_settings.get("max_users_per_batch", 8)),
+                            BATCH_MAX_OUTPUT_TOKENS // BATCH_OUTPUT_TOKENS_PER_USER))
+
+    # デフォルトプロンプトを使う軽量ユーザーだけをモデルごとにまとめる
+    groups = {}
+    single_users = []
+    for user_data in found_users_data:
+        comments = user_data.get('comments', [])
+        if not comments or len(comments) > max_comments:
+            single_users.append(user_data)
+            continue
+        settings = resolve_user_analysis_settings(user_data['user_id'])
+        if not settings['enabled'] or not settings['use_default_prompt'] or settings['model'] not in BATCH_MODELS:
+            single_users.append(user_data)
+            continue
+        groups.setdefault(settings['model'], ([], settings))[0].append(user_data)
+
+    batches = []
+    for ai_model, (users, settings) in groups.items():
+        for start in range(0, len(users), batch_size):
+            chunk = users[start:start + batch_size]
+            if len(chunk) == 1:
+                single_users.extend(chunk)
+            else:
+                batches.append((ai_model, chunk, settings))
+
+    if batches:
+        print(f"[DEBUG] まとめて分析: {sum(len(batch[1]) for batch in batches)}人 → {len(batches)}リクエスト, "
+              f"個別分析: {len(single_users)}人")
+    return batches, single_users
+
+
+def analyze_user_batch(users, config, ai_model, settings):
+    """複数ユーザーを1リクエストで分析し、user_id → 分析結果（analyze_single_userと同じ形式）を返す
+
+    応答に含まれなかったユーザーは結果に入らない（呼び出し側で個別に分析し直す）。
+    """
+    provider, model_name = BATCH_MODELS[ai_model]
+    api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
+
+    # 分析指示（テンプレート）はリクエストに1回だけ入れ、ユーザーごとにはIDとコメントだけを並べる
+    prompt_template = settings['prompt_template']
+    shared_prompt = fill_prompt_template(prompt_template, config, **BATCH_USER_VARIABLES)
+    sections = {}
+    for user_data in users:
+        user_name = user_data.get('user_name') or f"ユーザー{user_data['user_id']}"
+        sections[user_data['user_id']] = (
+            f"=== user_id: {user_data['user_id']} ===\n"
+            f"表示名: {user_name}\n"
+            f"コメント数: {len(user_data.get('comments', []))}\n"
+            f"{build_comment_content(user_data, config, prompt_template or '')}"
+        )
+    batch_prompt = (BATCH_INSTRUCTION.format(count=len(users)) + "\n\n" + shared_prompt
+                    + "\n\n" + "\n\n".join(sections.values()))
+    # 結果に記録するプロンプトは、共通の分析指示とそのユーザーの欄
+    prompts = {user_id: shared_prompt + "\n\n" + section for user_id, section in sections.items()}
+
+    # Geminiはシステムプロンプトを使わない（個別分析と同じ）
+    system_prompt = settings['system_prompt'] if provider == "openai" else ""
+    log_to_gui(f"{len(users)}人のユーザーをまとめてAI分析中...")
+    raw_result = request_json_completion(
+        provider, model_name, api_settings, system_prompt, batch_prompt,
+        max_tokens=min(BATCH_MAX_OUTPUT_TOKENS, BATCH_OUTPUT_TOKENS_PER_USER * len(users))
+    )
+
+    data = json.loads(raw_result)
+    items = data.get("results", []) if isinstance(data, dict) else data
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        user_id = str(item.get("user_id", ""))
+        analysis = item.get("analysis")
+        if user_id in prompts and isinstance(analysis, str) and analysis.strip():
+            results[user_id] = {
+                'analysis_result': clean_ai_response(analysis),
+                'model_used': ai_model,
+                'prompt_used': prompts[user_id]
+            }
+
+    for user_data in users:
+        if user_data['user_id'] in results:
+            save_prompt_to_file(provider, user_data, system_prompt, prompts[user_data['user_id']],
+                                results[user_data['user_id']]['analysis_result'])
+    print(f"[DEBUG] まとめて分析完了: {len(results)}/{len(users)}人 ({ai_model})")
+    return results
+
+
+def request_json_completion(provider, model_name, api_settings, system_prompt, prompt, max_tokens):
+    """JSON形式の応答を要求して本文を返す（失敗時は例外を送出）"""
+    cache = get_ai_cache(api_settings)
+    cache_key = make_cache_key(f"{provider}:{model_name}:json", system_prompt, prompt)
+    cached_result = cache.get(cache_key) if cache else None
+    if cached_result is not None:
+        print(f"[DEBUG] AI分析キャッシュヒット: まとめて分析 ({model_name})")
+        return cached_result
+
+    estimated_tokens = estimate_tokens(system_prompt, prompt) + max_tokens
+    if provider == "openai":
+        api_key = api_settings.get("openai_api_key", "")
+        if not api_key:
+            raise ValueError("OpenAI APIキーが設定されていません")
+        client = get_openai_client(api_key)
+        response = get_ai_scheduler(api_settings).run(
+            "openai",
+            lambda: client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            ),
+            estimated_tokens=estimated_tokens
+        )
+        result = response.choices[0].message.content
+    else:
+        api_key = api_settings.get("google_api_key", "")
+        if not api_key:
+            raise ValueError("Google APIキーが設定されていません")
+        model = get_gemini_model(api_key, model_name)
+        response = get_ai_scheduler(api_settings).run(
+            "gemini",
+            lambda: model.generate_content(
+                prompt, generation_config={"response_mime_type": "application/json"}
+            ),
+            estimated_tokens=estimated_tokens
+        )
+        result = response.text
+
+    # JSONとして解釈できる応答だけキャッシュ
+    json.loads(result)
+    if cache:
+        cache.put(cache_key, f"{provider}:{model_name}", result)
+    return result
+
+
 # === 追加: プロンプト構築ヘルパー ===
 def build_analysis_prompt(user_data, config, prompt_template: str) -> str:
     """分析用の最終プロンプトを構築（変数埋め込み＋日本語HTML改行）"""
-    # 放送情報
+    # コメント整形（トークン予算を超える場合は重複をまとめ時間帯ごとに抽出）
+    user_data_text = build_comment_content(user_data, config, prompt_template or "")
+
+    user_label = user_data.get('user_name') or f"ユーザー{user_data.get('user_id','')}"
+    return fill_prompt_template(
+        prompt_template, config,
+        user=user_label,
+        user_name=user_label,
+        user_id=user_data.get('user_id', ''),
+        comment_content=user_data_text,
+        comment_count=len(user_data.get('comments', []))
+    )
+
+
+def fill_prompt_template(prompt_template: str, config, **user_variables) -> str:
+    """プロンプトテンプレートに放送情報・日時とユーザーごとの変数を埋め込む（失敗しても素通し）"""
     broadcast_info = config.get('broadcast_info', {}) if isinstance(config, dict) else {}
     live_title = broadcast_info.get('live_title', '配信タイトル不明')
 
-    # コメント整形
-    comment_texts = []
-    for i, c in enumerate(user_data.get('comments', []), 1):
-        text = c.get('text', '')
-        comment_texts.append(f"{i} {text}")
-    user_data_text = "\n".join(comment_texts)
-
-    # 変数置換（失敗しても素通し）
     analysis_prompt = prompt_template or ""
     try:
-        from datetime import datetime
         now = datetime.now()
-        current_time = now.strftime("%H:%M:%S")
-        current_date = now.strftime("%Y-%m-%d")
-        current_datetime = now.strftime("%Y-%m-%d %H:%M:%S")
-
         analysis_prompt = analysis_prompt.format(
-            user=user_data.get('user_name') or f"ユーザー{user_data.get('user_id','')}",
-            user_name=user_data.get('user_name') or f"ユーザー{user_data.get('user_id','')}",
-            user_id=user_data.get('user_id', ''),
             lv_title=live_title,
-            comment_content=user_data_text,
-            comment_count=len(user_data.get('comments', [])),
-            time=current_time,
-            date=current_date,
-            datetime=current_datetime
+            time=now.strftime("%H:%M:%S"),
+            date=now.strftime("%Y-%m-%d"),
+            datetime=now.strftime("%Y-%m-%d %H:%M:%S"),
+            **user_variables
         )
     except Exception as e:
         print(f"プロンプト変数置換エラー: {e}")
-
-    # 最終プロンプト
-    full_prompt = analysis_prompt
-    return full_prompt
+    return analysis_prompt
 
 
 
 def clean_ai_response(ai_response):
-    """AI分析結果からコードブロック記法やMarkdown記法を除去"""
-    if not ai_response:
-        return ""
-    
-    # コードブロック記法を除去
-    ai_response = re.sub(r'```[\w]*\n?', '', ai_response)  # ```html, ```css, ``` など
-    ai_response = re.sub(r'```', '', ai_response)  # 残った```も除去
-    
-    # インラインコード記法を除去
-    ai_response = re.sub(r'`([^`]+)`', r'\1', ai_response)  # `code` → code
-    
-    # Markdown太字記法をHTMLに変換
-    ai_response = re.sub(r'\*\*([^*]+)\*\*', r'<strong>\1</strong>', ai_response)
-    
-    # Markdown見出し記法をHTMLに変換
-    ai_response = re.sub(r'^### (.+)$', r'<h3>\1</h3>', ai_response, flags=re.MULTILINE)
-    ai_response = re.sub(r'^## (.+)$', r'<h2>\1</h2>', ai_response, flags=re.MULTILINE)
-    ai_response = re.sub(r'^# (.+)$', r'<h1>\1</h1>', ai_response, flags=re.MULTILINE)
-    
-    # 改行をHTMLに変換
-    ai_response = ai_response.replace('\n\n', '<br><br>')
-    ai_response = ai_response.replace('\n', '<br>')
-    
-    return ai_response.strip()
-
-def generate_openai_analysis(user_data, config):
-    """OpenAI APIを使用してユーザー分析を生成"""
-    try:
-        import openai
-        
-        # API設定を取得
-        api_settings = config.get("api_settings", {})
-        openai_api_key = api_settings.get("openai_api_key", "")
-        
-        if not openai_api_key:
-            print("OpenAI APIキーが設定されていません")
-            return generate_basic_analysis(user_data['comments']), "no_api_key"
-        
-        # 放送情報を取得
-        broadcast_info = config.get('broadcast_info', {})
-        live_title = broadcast_info.get('live_title', '配信タイトル不明')
-        
-        # コメントデータを整理
-        comment_texts = []
-        for comment in user_data['comments']:
-            timestamp = format_unix_time(comment.get('date', ''))
-            text = comment.get('text', '')
-            comment_texts.append(f"[{timestamp}] {text}")
-        
-        user_data_text = "\n".join(comment_texts)
-        
-        # ユーザー個別のプロンプトを取得
-        special_users_config = config.get("special_users_config", {})
-        users_config = special_users_config.get("users", {})
-        user_id = user_data['user_id']
-        
-        # 個別ユーザー設定があるかチェック
-        if user_id in users_config and users_config[user_id].get("analysis_prompt"):
-            analysis_prompt = users_config[user_id]["analysis_prompt"]
-            print(f"個別プロンプト使用: {user_id}")
-        else:
-            analysis_prompt = special_users_config.get("default_analysis_prompt", "")
-            print(f"デフォルトプロンプト使用: {user_id}")
-        
-        # ★★★ 重要：変数置換を実行 ★★★
-        try:
-            from datetime import datetime
-            now = datetime.now()
-            current_time = now.strftime("%H:%M:%S")
-            current_date = now.strftime("%Y-%m-%d")
-            current_datetime = now.strftime("%Y-%m-%d %H:%M:%S")
-
-            analysis_prompt = analysis_prompt.format(
-                user=user_data['user_name'],
-                user_name=user_data['user_name'],
-                user_id=user_data['user_id'],
-                lv_title=live_title,
-                time=current_time,
-                date=current_date,
-                datetime=current_datetime
-            )
-        except KeyError as e:
-            print(f"プロンプト変数置換エラー: {e}")
-            # 変数置換に失敗してもプロンプトはそのまま使用
-        
-        # グローバル設定からシステムプロンプトを取得
-        api_settings = config.get("api_settings", {}) if isinstance(config, dict) else {}
-        system_prompt = api_settings.get("analysis_system_prompt", "あなたは配信コメントの分析専門家です。ユーザーの行動パターンや特徴を詳しく分析してください。")
-        print(f"[DEBUG] Using system prompt (generate_openai_analysis): {system_prompt}")
-        
-        full_prompt = f"""
-{analysis_prompt}
-
-ユーザーID: {user_data['user_id']}
-表示名: {user_data['user_name']}
-総コメント数: {len(user_data['comments'])}件
-
-コメント履歴:
-{user_data_text}
-
-上記のデータを基に、このユーザーの詳細な分析を行ってください。
-分析結果はHTML形式で出力し、<br>タグで改行してください。
-"""
-
-        # OpenAI APIを呼び出し
-        client = openai.OpenAI(api_key=openai_api_key)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": full_prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        
-        ai_result = response.choices[0].message.content.strip()
-        
-        # ★★★ 追加：AI結果をクリーニング ★★★
-        ai_result = clean_ai_response(ai_result)
-        
-        # プロンプトと結果をファイルに保存
-        save_prompt_to_file("openai", user_data, system_prompt, full_prompt, ai_result)
-        
-        return ai_result, full_prompt  # ★ プロンプトも返す
-        
-    except Exception as e:
-        print(f"OpenAI分析エラー: {str(e)}")
-        return generate_basic_analysis(user_data['comments']), f"error: {str(e)}"
-
-def generate_gemini_analysis(user_data, config):
-    """Google Gemini APIを使用してユーザー分析を生成"""
-    try:
-        import google.generativeai as genai
-        
-        # API設定を取得
-        api_settings = config.get("api_settings", {})
-        google_api_key = api_settings.get("google_api_key", "")
-        
-        if not google_api_key:
-            print("Google APIキーが設定されていません")
-            return generate_basic_analysis(user_data['comments']), "no_api_key"
-        
-        # Gemini APIを設定
-        genai.configure(api_key=google_api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # 放送情報を取得
-        broadcast_info = config.get('broadcast_info', {})
-        live_title = broadcast_info.get('live_title', '配信タイトル不明')
-        
-        # コメントデータを整理
-        comment_texts = []
-        for comment in user_data['comments']:
-            timestamp = format_unix_time(comment.get('date', ''))
-            text = comment.get('text', '')
-            comment_texts.append(f"[{timestamp}] {text}")
-        
-        user_data_text = "\n".join(comment_texts)
-        
-        # ユーザー個別のプロンプトを取得
-        special_users_config = config.get("special_users_config", {})
-        users_config = special_users_config.get("users", {})
-        user_id = user_data['user_id']
-        
-        # 個別ユーザー設定があるかチェック
-        if user_id in users_config and users_config[user_id].get("analysis_prompt"):
-            analysis_prompt = users_config[user_id]["analysis_prompt"]
-            print(f"個別プロンプト使用: {user_id}")
-        else:
-            analysis_prompt = special_users_config.get("default_analysis_prompt", "")
-            print(f"デフォルトプロンプト使用: {user_id}")
-        
-        # ★★★ 重要：変数置換を実行 ★★★
-        try:
-            from datetime import datetime
-            now = datetime.now()
-            current_time = now.strftime("%H:%M:%S")
-            current_date = now.strftime("%Y-%m-%d")
-            current_datetime = now.strftime("%Y-%m-%d %H:%M:%S")
-
-            analysis_prompt = analysis_prompt.format(
-                user=user_data['user_name'],
-                user_name=user_data['user_name'],
-                user_id=user_data['user_id'],
-                lv_title=live_title,
-                time=current_time,
-                date=current_date,
-                datetime=current_datetime
-            )
-        except KeyError as e:
-            print(f"プロンプト変数置換エラー: {e}")
-            # 変数置換に失敗してもプロンプトはそのまま使用
-        
-        full_prompt = f"""
-{analysis_prompt}
-
-ユーザーID: {user_data['user_id']}
-表示名: {user_data['user_name']}
-総コメント数: {len(user_data['comments'])}件
-
-コメント履歴:
-{user_data_text}
-
-上記のデータを基に、このユーザーの詳細な分析を日本語で行ってください。
-分析結果はHTML形式で出力し、<br>タグで改行してください。
-"""
-
-        response = model.generate_content(full_prompt)
-        
-        # ★★★ 追加：AI結果をクリーニング ★★★
-        ai_result = clean_ai_response(response.text)
-        
-        # プロンプトと結果をファイルに保存
-        save_prompt_to_file("gemini", user_data, "", full_prompt, ai_result)
-        
-        return ai_result, full_prompt  # ★ プロンプトも返す
-        
-    except Exception as e:
-        print(f"Gemini分析エラー: {str(e)}")
-        return generate_basic_analysis(user_data['comments']), f"error: {str(e)}"
+    """AI分析結果からコードブロック記法やMarkdown記法を除去（processors/ai_response_normalizer.py）"""
+    return normalize_ai_response(ai_response)
 
 def save_prompt_to_file(ai_model, user_data, system_prompt, user_prompt, ai_response):
-    """プロンプト内容と分析結果をファイルに保存"""
+    """プロンプト内容と分析結果をログに保存（書き込みはバックグラウンドスレッドで行う）"""
     try:
-        import os
-        
-        # ログディレクトリ作成
-        log_dir = os.path.join("logs", "ai_prompts")
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # ファイル名生成
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        user_id = user_data['user_id']
-        filename = f"{timestamp}_{ai_model}_{user_id}.txt"
-        filepath = os.path.join(log_dir, filename)
-        
-        # プロンプト詳細をファイルに保存
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f"AI分析プロンプト詳細ログ\n")
-            f.write(f"{'=' * 60}\n")
-            f.write(f"実行日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"AIモデル: {ai_model.upper()}\n")
-            f.write(f"ユーザーID: {user_data['user_id']}\n")
-            f.write(f"ユーザー名: {user_data['user_name']}\n")
-            f.write(f"コメント数: {len(user_data['comments'])}件\n")
-            f.write(f"{'=' * 60}\n\n")
-            
-            if system_prompt:
-                f.write(f"システムプロンプト:\n")
-                f.write(f"{'-' * 30}\n")
-                f.write(f"{system_prompt}\n\n")
-            
-            f.write(f"ユーザープロンプト:\n")
-            f.write(f"{'-' * 30}\n")
-            f.write(f"{user_prompt}\n\n")
-            
-            f.write(f"AI分析結果:\n")
-            f.write(f"{'-' * 30}\n")
-            f.write(f"{ai_response}\n\n")
-            
-            f.write(f"コメント詳細:\n")
-            f.write(f"{'-' * 30}\n")
-            for i, comment in enumerate(user_data['comments'], 1):
-                timestamp = format_unix_time(comment.get('date', ''))
-                text = comment.get('text', '')
-                f.write(f"{i:3d}. [{timestamp}] {text}\n")
-        
-        print(f"プロンプトログ保存: {filepath}")
-        
+        get_prompt_log_writer().write({
+            "timestamp": datetime.now().isoformat(),
+            "ai_model": ai_model,
+            "user_id": user_data['user_id'],
+            "user_name": user_data.get('user_name', ''),
+            "lv_value": user_data.get('lv_value', ''),
+            "comment_count": len(user_data.get('comments', [])),
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "ai_response": ai_response,
+            "comments": [
+                {"no": comment.get('no', ''), "date": comment.get('date', ''), "text": comment.get('text', '')}
+                for comment in user_data.get('comments', [])
+            ]
+        })
     except Exception as e:
-        print(f"プロンプトファイル保存エラー: {str(e)}")
+        print(f"プロンプトログ保存エラー: {str(e)}")
 
 def generate_basic_analysis(comments):
     """基本分析を生成"""
@@ -1,7 +1,27 @@
 import os
+import sys
 import json
-import shutil
+import threading
+import concurrent.futures
 from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact_io import dump_json_artifact
+from processors.template_renderer import SafeHTML, escape_html, render_template
+from processors.broadcast_index import update_broadcast_index
+from processors.static_assets import sync_static_files
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+
+# 一覧ページのコメント表の遅延読み込み（templates/js/comment-loader.js）
+COMMENT_FRAGMENT_DIR = "comments"
+COMMENT_LOADER_SCRIPT = '<script src="js/comment-loader.js"></script>'
+
+# list.html の放送アイテムの位置（ページをアイテムの前後に分けるためのプレースホルダ）
+LIST_ITEMS_PLACEHOLDER = '<!--ncv-broadcast-items-->'
+
+# ユーザーディレクトリ → list.html 更新用のロック（並列生成時に同じユーザーの一覧ページを同時に書き換えない）
+_user_locks = {}
+_user_locks_lock = threading.Lock()
 
 def process(pipeline_data):
     """Step03: HTML生成"""
@@ -26,16 +46,21 @@ def process(pipeline_data):
             }
         
         generated_files = []
+        streamed = pipeline_data.get('streamed_users', {}).get('step03_html_generator', {})
+        
+        # 各スペシャルユーザーのHTMLとJSONを生成（AI分析完了時に生成済みのユーザーは結果を引き継ぐ）
+        pending_users = [user_data for user_data in found_users if user_data['user_id'] not in streamed]
+        max_workers = get_render_workers(config, len(pending_users))
+        user_files = render_users(pending_users, broadcast_info, lv_value, subfolder_name, config, max_workers)
         
-        # 各スペシャルユーザーのHTMLとJSONを生成
+        # 生成ファイルの並びは並列数によらず found_users の順
         for user_data in found_users:
-            files = create_special_user_pages(user_data, broadcast_info, lv_value, subfolder_name, config)
-            generated_files.extend(files)
-            
-            # JSONファイルを2箇所に保存
-            save_json_files(user_data, broadcast_info, lv_value, subfolder_name)
+            if user_data['user_id'] in streamed:
+                generated_files.extend(streamed[user_data['user_id']])
+            else:
+                generated_files.extend(user_files[user_data['user_id']])
         
-        print(f"Step03 完了: 生成ファイル数 {len(generated_files)}")
+        print(f"Step03 完了: 生成ファイル数 {len(generated_files)} (AI分析完了時に生成: {len(streamed)}人, 並列数: {max_workers})")
         
         return {
             "html_generated": True,
@@ -46,6 +71,51 @@ def process(pipeline_data):
     except Exception as e:
         print(f"Step03 エラー: {str(e)}")
         raise
+
+def get_render_workers(config, user_count):
+    """ユーザーごとのHTML生成の並列数（html_generation_settings.max_workers、0はCPU数、1は逐次）"""
+    settings = config.get('html_generation_settings', {}) if isinstance(config, dict) else {}
+    try:
+        max_workers = int(settings.get('max_workers', 0)) or os.cpu_count() or 1
+    except (TypeError, ValueError):
+        max_workers = 1
+    return max(1, min(max_workers, user_count))
+
+def render_users(users, broadcast_info, lv_value, subfolder_name, config, max_workers=1):
+    """複数ユーザーのHTMLとJSONを生成し、{user_id: 生成ファイル} を返す（ユーザーごとに独立なので並列可）"""
+    if max_workers <= 1:
+        return {user_data['user_id']: generate_user_outputs(user_data, broadcast_info, lv_value, subfolder_name, config)
+                for user_data in users}
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step03-render") as executor:
+        futures = [
+            (user_data['user_id'], executor.submit(generate_user_outputs, user_data, broadcast_info, lv_value, subfolder_name, config))
+            for user_data in users
+        ]
+        # 失敗したユーザーがいれば逐次実行と同じく例外を送出
+        return {user_id: future.result() for user_id, future in futures}
+
+def get_user_lock(user_dir):
+    """ユーザーディレクトリごとのロックを取得"""
+    with _user_locks_lock:
+        lock = _user_locks.get(user_dir)
+        if lock is None:
+            lock = _user_locks[user_dir] = threading.Lock()
+        return lock
+
+def process_user(pipeline_data, user_data):
+    """Step03: AI分析が完了したユーザー1人分のHTMLとJSONを生成（Step02から逐次呼ばれる）"""
+    broadcast_info = pipeline_data['results']['step01_xml_parser']['broadcast_info']
+    return generate_user_outputs(user_data, broadcast_info, pipeline_data['lv_value'],
+                                 pipeline_data['subfolder_name'], pipeline_data['config'])
+
+def generate_user_outputs(user_data, broadcast_info, lv_value, subfolder_name, config):
+    """ユーザー1人分のHTMLページとJSONファイルを生成し、生成したHTMLのパスを返す"""
+    files = create_special_user_pages(user_data, broadcast_info, lv_value, subfolder_name, config)
+    
+    # JSONファイルを2箇所に保存
+    save_json_files(user_data, broadcast_info, lv_value, subfolder_name)
+    return files
 def save_json_files(user_data, broadcast_info, lv_value, subfolder_name):
     """JSONファイルを放送ディレクトリに保存"""
     try:
@@ -101,11 +171,8 @@ def save_json_files(user_data, broadcast_info, lv_value, subfolder_name):
         )
         os.makedirs(broadcast_dir, exist_ok=True)
         
-        with open(os.path.join(broadcast_dir, "data.json"), 'w', encoding='utf-8') as f:
-            json.dump(data_json, f, ensure_ascii=False, indent=2)
-        
-        with open(os.path.join(broadcast_dir, "comments.json"), 'w', encoding='utf-8') as f:
-            json.dump(comments_json, f, ensure_ascii=False, indent=2)
+        dump_json_artifact(data_json, os.path.join(broadcast_dir, "data.json"))
+        dump_json_artifact(comments_json, os.path.join(broadcast_dir, "comments.json"))
         
         print(f"JSON保存: {broadcast_dir}")
             
@@ -128,7 +195,7 @@ def create_special_user_pages(user_data, broadcast_info, lv_value, subfolder_nam
         os.makedirs(user_dir, exist_ok=True)
         
         # テンプレートディレクトリ
-        template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+        template_dir = TEMPLATE_DIR
         
         # CSS/JSファイルをユーザーディレクトリ直下にコピー
         copy_static_files(template_dir, user_dir)
@@ -140,7 +207,7 @@ def create_special_user_pages(user_data, broadcast_info, lv_value, subfolder_nam
         generated_files.append(detail_file)
         
         # 2. 一覧ページ更新（ユーザーディレクトリ直下に）
-        list_file = update_user_list_page(user_data, broadcast_info, template_dir, user_dir, lv_value, subfolder_name)
+        list_file = update_user_list_page(user_data, broadcast_info, template_dir, user_dir, lv_value, subfolder_name, config)
         generated_files.append(list_file)
         
         print(f"HTMLページ生成完了: {user_id}")
@@ -159,10 +226,6 @@ def create_user_detail_page(user_data, broadcast_info, template_dir, output_dir,
     if not os.path.exists(template_path):
         raise Exception(f"テンプレートファイルが見つかりません: {template_path}")
     
-    # テンプレート読み込み
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template = f.read()
-    
     # コメント行を生成
     comment_rows = generate_comment_rows(user_data['comments'], broadcast_info.get('start_time', ''))
     
@@ -172,16 +235,20 @@ def create_user_detail_page(user_data, broadcast_info, template_dir, output_dir,
     # テンプレート変数を置換
     title_text = broadcast_info.get('live_title', 'タイトル不明')
     broadcast_url = f"https://live.nicovideo.jp/watch/{lv_value}"
-    title_link = f'<a href="{broadcast_url}" target="_blank" style="color:#007bff; text-decoration:none;">{title_text}</a>'
+    title_link = f'<a href="{broadcast_url}" target="_blank" style="color:#007bff; text-decoration:none;">{escape_html(title_text)}</a>'
 
-    html_content = template.replace('{{broadcast_title}}', title_link)
-    html_content = html_content.replace('{{start_time}}', format_start_time(broadcast_info.get('start_time', '')))
-    html_content = html_content.replace('{{user_avatar}}', get_user_icon_path(user_data['user_id']))
-    html_content = html_content.replace('{{user_name}}', user_data['user_name'])
-    html_content = html_content.replace('{{user_profile_url}}', f"https://www.nicovideo.jp/user/{user_data['user_id']}")
-    html_content = html_content.replace('{{user_id}}', user_data['user_id'])
-    html_content = html_content.replace('{{comment_rows}}', comment_rows)
-    html_content = html_content.replace('{{analysis_text}}', analysis_text)
+    # キャッシュ済みのテンプレートで描画（生成済みのHTML片以外は自動エスケープ）
+    html_content = render_template(
+        template_dir, 'user_detail.html',
+        broadcast_title=SafeHTML(title_link),
+        start_time=format_start_time(broadcast_info.get('start_time', '')),
+        user_avatar=get_user_icon_path(user_data['user_id']),
+        user_name=user_data['user_name'],
+        user_profile_url=f"https://www.nicovideo.jp/user/{user_data['user_id']}",
+        user_id=user_data['user_id'],
+        comment_rows=SafeHTML(comment_rows),
+        analysis_text=SafeHTML(analysis_text)
+    )
 
     # ファイル保存
     output_filename = f"{subfolder_name}_{lv_value}_detail.html"
@@ -193,43 +260,103 @@ def create_user_detail_page(user_data, broadcast_info, template_dir, output_dir,
     print(f"個別ページ生成: {output_path}")
     return output_path
 
-def update_user_list_page(user_data, broadcast_info, template_dir, output_dir, lv_value, subfolder_name):
+def update_user_list_page(user_data, broadcast_info, template_dir, output_dir, lv_value, subfolder_name, config=None):
     """一覧ページを更新"""
     template_path = os.path.join(template_dir, 'user_list.html')
     list_file_path = os.path.join(output_dir, "list.html")
+    lazy_comments = is_lazy_comment_tables_enabled(config)
     
-    # 既存の一覧ページがある場合は読み込み
-    existing_items = []
-    if os.path.exists(list_file_path):
-        existing_items = load_existing_broadcast_items(list_file_path)
-    
-    # 新しい放送アイテムを追加
-    new_item = generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name)
-    existing_items.append(new_item)
-    
-    # テンプレートを読み込み
-    if not os.path.exists(template_path):
-        print(f"一覧テンプレートが見つかりません: {template_path}")
-        return list_file_path
-    
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template = f.read()
-    
-    # 全ての放送アイテムを結合
-    all_items = '\n'.join(existing_items)
+    # コメント表は comments/{lv}.js に分けて「コメントを表示」で読み込む（list_page_settings.lazy_comment_tables）
+    if lazy_comments and user_data['comments']:
+        write_comment_fragment(user_data, broadcast_info, output_dir, lv_value)
     
-    # テンプレート変数を置換
-    html_content = template.replace('{{broadcaster_name}}', user_data['user_name'])
-    html_content = html_content.replace('{{thumbnail_url}}', get_user_icon_path(user_data['user_id']))
-    html_content = html_content.replace('{{broadcast_items}}', all_items)
+    new_item = generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name, lazy_comments)
     
-    # ファイル保存
-    with open(list_file_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # 索引への追記から list.html の書き込みまでは同じユーザーで同時に行わない（古い索引で上書きしない）
+    with get_user_lock(output_dir):
+        # 新しい放送アイテムを索引（broadcast_index.jsonl）に追記（同じ放送の再処理は差し替え）
+        entries, appended = update_broadcast_index(output_dir, {
+            "lv_value": lv_value,
+            "subfolder_name": subfolder_name,
+            "live_title": broadcast_info.get('live_title', ''),
+            "start_time": broadcast_info.get('start_time', ''),
+            "comment_count": len(user_data['comments']),
+            "item_html": new_item
+        })
+        
+        # テンプレートを読み込み
+        if not os.path.exists(template_path):
+            print(f"一覧テンプレートが見つかりません: {template_path}")
+            return list_file_path
+        
+        # キャッシュ済みのテンプレートで、アイテムより前（ヘッダー）と後（フッター）を描画
+        # 遅延読み込みで生成済みのアイテムもあるため、読み込みスクリプトは設定によらず常に含める
+        page_parts = render_list_page_parts(template_dir, user_data)
+        
+        # 新しい放送は既存の list.html のフッターの前に差し込むだけ（書き込み量はページ全体によらない）
+        if appended and len(entries) > 1 and page_parts and append_list_item(list_file_path, *page_parts, new_item):
+            print(f"一覧ページ更新（追記）: {list_file_path}")
+            return list_file_path
+        
+        # 初回・同じ放送の差し替え・ヘッダーが変わった場合は索引の全放送アイテムから描画し直す
+        all_items = '\n'.join(entry['item_html'] for entry in entries)
+        if page_parts:
+            html_content = page_parts[0] + all_items + page_parts[1]
+        else:
+            html_content = render_template(
+                template_dir, 'user_list.html',
+                broadcaster_name=user_data['user_name'],
+                thumbnail_url=get_user_icon_path(user_data['user_id']),
+                broadcast_items=SafeHTML(COMMENT_LOADER_SCRIPT + '\n' + all_items)
+            )
+        
+        # ファイル保存（追記時にバイト単位で照合するため改行は変換しない）
+        with open(list_file_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(html_content)
     
     print(f"一覧ページ更新: {list_file_path}")
     return list_file_path
 
+def render_list_page_parts(template_dir, user_data):
+    """一覧ページを放送アイテムの前後で分けて描画し (ヘッダー, フッター) を返す（分けられなければNone）"""
+    html_content = render_template(
+        template_dir, 'user_list.html',
+        broadcaster_name=user_data['user_name'],
+        thumbnail_url=get_user_icon_path(user_data['user_id']),
+        broadcast_items=SafeHTML(COMMENT_LOADER_SCRIPT + '\n' + LIST_ITEMS_PLACEHOLDER)
+    )
+    if html_content.count(LIST_ITEMS_PLACEHOLDER) != 1:
+        return None
+    header, footer = html_content.split(LIST_ITEMS_PLACEHOLDER)
+    return header, footer
+
+def append_list_item(list_file_path, header, footer, item_html):
+    """既存の list.html のフッターの前に放送アイテムを差し込む
+
+    ヘッダーとフッターが現在の描画結果と一致する場合だけ書き込み、Trueを返す。
+    一致しない（ファイルがない・テンプレートやユーザー名が変わった・前回の書き込みが途中で終わった）
+    場合はFalseを返し、呼び出し側で全体を描画し直す。
+    """
+    header_bytes = header.encode('utf-8')
+    footer_bytes = footer.encode('utf-8')
+    try:
+        with open(list_file_path, 'r+b') as f:
+            file_size = f.seek(0, os.SEEK_END)
+            if file_size < len(header_bytes) + len(footer_bytes):
+                return False
+            f.seek(0)
+            if f.read(len(header_bytes)) != header_bytes:
+                return False
+            footer_start = f.seek(file_size - len(footer_bytes))
+            if f.read() != footer_bytes:
+                return False
+            f.seek(footer_start)
+            f.write(('\n' + item_html).encode('utf-8') + footer_bytes)
+            f.truncate()
+        return True
+    except OSError:
+        return False
+
 def generate_comment_rows(comments, start_time_str):
     """コメントテーブルの行を生成（配信内時間計算付き）"""
     rows = []
@@ -265,19 +392,53 @@ def generate_comment_rows(comments, start_time_str):
     
     return '\n'.join(rows)
 
-def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name):
-    """放送アイテムを生成（コメント表示ボタン付き）"""
+def is_lazy_comment_tables_enabled(config):
+    """一覧ページのコメント表を遅延読み込みにするか（デフォルト有効）"""
+    if not isinstance(config, dict):
+        return True
+    return config.get('list_page_settings', {}).get('lazy_comment_tables', True)
+
+def get_comment_unique_id(user_data, lv_value):
+    """一覧ページのコメント表の要素ID"""
+    return f"chat-data-{lv_value}-{user_data['user_id']}"
+
+def write_comment_fragment(user_data, broadcast_info, output_dir, lv_value):
+    """一覧ページ用のコメント表データを comments/{lv}.js に保存（file:// でも <script> で読み込める形式）"""
+    fragment_dir = os.path.join(output_dir, COMMENT_FRAGMENT_DIR)
+    os.makedirs(fragment_dir, exist_ok=True)
+    
+    rows = comment_row_values(user_data['comments'], broadcast_info.get('start_time', ''))
+    unique_id = get_comment_unique_id(user_data, lv_value)
+    script = (f"ncvCommentTables.register({json.dumps(unique_id)}, "
+              f"{json.dumps(rows, ensure_ascii=False, separators=(',', ':'))});\n")
+    
+    fragment_path = os.path.join(fragment_dir, f"{lv_value}.js")
+    temp_path = fragment_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(script)
+    os.replace(temp_path, fragment_path)
+    return fragment_path
+
+def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name, lazy_comments=False):
+    """放送アイテムを生成（コメント表示ボタン付き、lazy_commentsならコメント表は表示時に読み込む）"""
     if not user_data['comments']:
         return "<p>コメントがありません</p>"
     
     # 一意のIDを生成
-    unique_id = f"chat-data-{lv_value}-{user_data['user_id']}"
+    unique_id = get_comment_unique_id(user_data, lv_value)
     
     first_comment = user_data['comments'][0].get('text', '') if user_data['comments'] else ''
     last_comment = user_data['comments'][-1].get('text', '') if user_data['comments'] else ''
     
-    # コメントテーブルを生成
-    comment_rows = generate_comment_rows_for_list(user_data['comments'], broadcast_info.get('start_time', ''))
+    # コメントテーブルを生成（遅延読み込みの場合は空の表だけ置く）
+    if lazy_comments:
+        comment_rows = ""
+        toggle_call = f"ncvToggleComments('{unique_id}')"
+        comments_src = f' data-comments-src="{COMMENT_FRAGMENT_DIR}/{lv_value}.js"'
+    else:
+        comment_rows = generate_comment_rows_for_list(user_data['comments'], broadcast_info.get('start_time', ''))
+        toggle_call = f"toggleDiv('{unique_id}')"
+        comments_src = ""
     
     # ★★★ 修正：エレガントな中央から薄くなる区切り線 ★★★
     item = f'''
@@ -296,7 +457,7 @@ def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name)
             </div>
             
             <div style="display: flex; justify-content: center; gap: 20px; margin: 10px 0;">
-                <button class="toggle-button" onclick="toggleDiv('{unique_id}')" 
+                <button class="toggle-button" onclick="{toggle_call}" 
                         style="font-size: 18px; padding: 8px 16px; background-color: #555; color: white; border: none; border-radius: 4px; cursor: pointer;">
                     コメントを表示
                 </button>
@@ -308,7 +469,7 @@ def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name)
                 </div>
             </div>
             
-            <div id="{unique_id}" class="chat-data" style="display: none; margin-top: 20px;">
+            <div id="{unique_id}" class="chat-data"{comments_src} style="display: none; margin-top: 20px;">
                 <table border="1" style="margin: 0 auto; color: red; text-shadow: 2px 2px 2px rgba(110, 110, 110, 0.5);">
                     <thead>
                         <tr>
@@ -324,7 +485,7 @@ def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name)
                 </table>
                 
                 <div style="display: flex; justify-content: center; margin: 15px 0;">
-                    <button class="toggle-button" onclick="toggleDiv('{unique_id}')" 
+                    <button class="toggle-button" onclick="{toggle_call}" 
                             style="font-size: 16px; padding: 6px 12px; background-color: #666; color: white; border: none; border-radius: 4px; cursor: pointer;">
                         コメントを非表示
                     </button>
@@ -333,18 +494,18 @@ def generate_broadcast_item(user_data, broadcast_info, lv_value, subfolder_name)
             
             <p style="text-align: center; margin-top: 15px;">
                 <a href="https://live.nicovideo.jp/watch/{lv_value}" target="_blank" style="text-decoration: none; color: #007bff;">
-                    <strong>{broadcast_info.get('live_title', 'タイトル不明')}</strong>
+                    <strong>{escape_html(broadcast_info.get('live_title', 'タイトル不明'))}</strong>
                 </a><br>
                 <a href="{subfolder_name}_{lv_value}_detail.html" style="text-decoration: none; color: #28a745;">
-                    {user_data['user_name']}のコメント分析
+                    {escape_html(user_data['user_name'])}のコメント分析
                 </a>
             </p>
         </div>
     '''
     
     return item
-def generate_comment_rows_for_list(comments, start_time_str):
-    """一覧ページ用のコメント行生成"""
+def comment_row_values(comments, start_time_str):
+    """一覧ページ用のコメント行の値 [番号, 配信内時間, 日時, コメント] のリスト"""
     rows = []
     
     # 放送開始時刻を取得
@@ -367,53 +528,32 @@ def generate_comment_rows_for_list(comments, start_time_str):
         else:
             elapsed_time = "00:00:00"
         
+        rows.append([i, elapsed_time, date_str, comment.get('text', '')])
+    
+    return rows
+
+def generate_comment_rows_for_list(comments, start_time_str):
+    """一覧ページ用のコメント行生成"""
+    rows = []
+    for i, elapsed_time, date_str, text in comment_row_values(comments, start_time_str):
         row = f'''
                         <tr>
                             <td style="padding: 5px;">{i}</td>
                             <td style="padding: 5px;">{elapsed_time}</td>
                             <td style="padding: 5px;">{date_str}</td>
-                            <td style="padding: 5px;"><b style="font-size: 20px;">{escape_html(comment.get('text', ''))}</b></td>
+                            <td style="padding: 5px;"><b style="font-size: 20px;">{escape_html(text)}</b></td>
                         </tr>'''
         rows.append(row)
     
     return '\n'.join(rows)
 
-def load_existing_broadcast_items(list_file_path):
-    """既存の一覧ページから放送アイテムを抽出"""
-    try:
-        with open(list_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 簡単な方法：既存のlink-itemを抽出
-        import re
-        pattern = r'<div class="link-item">.*?</div>(?=\s*<div class="link-item">|\s*</div>\s*<canvas|\s*$)'
-        matches = re.findall(pattern, content, re.DOTALL)
-        return matches
-        
-    except Exception as e:
-        print(f"既存アイテム読み込みエラー: {str(e)}")
-        return []
-
 def copy_static_files(template_dir, output_dir):
-    """CSS/JSファイルを出力ディレクトリにコピー"""
+    """CSS/JSファイルを出力ディレクトリに配置（共有ファイルへのハードリンク、変更のないファイルはスキップ）"""
     try:
-        # cssディレクトリをコピー
-        css_src = os.path.join(template_dir, 'css')
-        css_dst = os.path.join(output_dir, 'css')
-        if os.path.exists(css_src):
-            shutil.copytree(css_src, css_dst, dirs_exist_ok=True)
-        
-        # jsディレクトリをコピー
-        js_src = os.path.join(template_dir, 'js')
-        js_dst = os.path.join(output_dir, 'js')
-        if os.path.exists(js_src):
-            shutil.copytree(js_src, js_dst, dirs_exist_ok=True)
-        
-        # assetsディレクトリをコピー
-        assets_src = os.path.join(template_dir, 'assets')
-        assets_dst = os.path.join(output_dir, 'assets')
-        if os.path.exists(assets_src):
-            shutil.copytree(assets_src, assets_dst, dirs_exist_ok=True)
+        stats = sync_static_files(template_dir, output_dir)
+        if stats["linked"] or stats["copied"]:
+            print(f"[DEBUG] 静的ファイル配置: {output_dir} "
+                  f"(リンク{stats['linked']}件, コピー{stats['copied']}件, 変更なし{stats['skipped']}件)")
             
     except Exception as e:
         print(f"静的ファイルコピーエラー: {str(e)}")
@@ -453,13 +593,3 @@ def format_elapsed_time(seconds):
         return f"{hours:02d}:{minutes:02d}:{secs:02d}"
     except:
         return "00:00:00"
-
-def escape_html(text):
-    """HTMLエスケープ"""
-    if not text:
-        return ""
-    return (text.replace('&', '&amp;')
-                .replace('<', '&lt;')
-                .replace('>', '&gt;')
-                .replace('"', '&quot;')
-                .replace("'", '&#x27;'))
\ No newline at end of file
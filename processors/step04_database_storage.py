@@ -4,6 +4,9 @@ import json
 import os
 from datetime import datetime
 from typing import Dict, List, Any
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from processors.comment_batch import CommentBatch
 
 class DatabaseManager:
     def __init__(self, db_path="data/ncv_monitor.db"):
@@ -43,6 +46,7 @@ class DatabaseManager:
                     user_name TEXT,
                     comment_text TEXT,
                     comment_no INTEGER,
+                    comment_thread TEXT,
                     timestamp INTEGER,
                     elapsed_time TEXT,
                     is_special_user BOOLEAN DEFAULT FALSE,
@@ -110,6 +114,8 @@ class DatabaseManager:
                 -- 検索用インデックス
                 CREATE INDEX IF NOT EXISTS idx_comments_broadcast_user 
                     ON comments(broadcast_id, user_id);
+                CREATE INDEX IF NOT EXISTS idx_comments_broadcast_no 
+                    ON comments(broadcast_id, comment_no);
                 CREATE INDEX IF NOT EXISTS idx_comments_timestamp 
                     ON comments(timestamp);
                 CREATE INDEX IF NOT EXISTS idx_comments_special_user 
@@ -141,6 +147,8 @@ class DatabaseManager:
                 cursor.execute('ALTER TABLE comments ADD COLUMN broadcast_start_time TEXT')
             if 'broadcast_lv_id' not in existing_columns:
                 cursor.execute('ALTER TABLE comments ADD COLUMN broadcast_lv_id TEXT')
+            if 'comment_thread' not in existing_columns:
+                cursor.execute('ALTER TABLE comments ADD COLUMN comment_thread TEXT')
 
 
 def process(pipeline_data):
@@ -163,8 +171,8 @@ def process(pipeline_data):
         # データベースマネージャーを初期化
         db_manager = DatabaseManager()
         
-        # 1. 放送情報を保存
-        broadcast_id = save_broadcast_info(db_manager, lv_value, broadcast_info, pipeline_data)
+        # 1. 放送情報を保存（AI分析完了時に保存済みならそのIDを使う）
+        broadcast_id = ensure_broadcast_id(pipeline_data, db_manager)
         
         # 2. スペシャルユーザー設定を保存/更新
         save_special_users_config(db_manager, config)
@@ -172,8 +180,10 @@ def process(pipeline_data):
         # 3. 全コメントを保存（コンテキスト用） ★broadcast_info追加
         comments_saved = save_all_comments(db_manager, broadcast_id, all_comments, special_users_found, broadcast_info)
         
-        # 4. AI分析結果を保存
-        analyses_saved = save_ai_analyses(db_manager, broadcast_id, special_users_found)
+        # 4. AI分析結果を保存（AI分析完了時に保存済みのユーザーは除く）
+        streamed = pipeline_data.get('streamed_users', {}).get('step04_database_storage', {})
+        remaining_users = [user for user in special_users_found if user['user_id'] not in streamed]
+        analyses_saved = sum(streamed.values()) + save_ai_analyses(db_manager, broadcast_id, remaining_users)
         
         # 5. システム統計を更新
         update_system_stats(db_manager)
@@ -196,6 +206,21 @@ def process(pipeline_data):
         traceback.print_exc()
         raise
 
+def process_user(pipeline_data, user_data):
+    """Step04: AI分析が完了したユーザー1人分の分析結果を保存（Step02から逐次呼ばれる）"""
+    db_manager = DatabaseManager()
+    broadcast_id = ensure_broadcast_id(pipeline_data, db_manager)
+    return save_ai_analyses(db_manager, broadcast_id, [user_data])
+
+def ensure_broadcast_id(pipeline_data: Dict, db_manager: DatabaseManager) -> int:
+    """放送情報を1回だけ保存し、放送IDを pipeline_data['broadcast_id'] に保持"""
+    if pipeline_data.get('broadcast_id') is None:
+        broadcast_info = pipeline_data['results']['step01_xml_parser']['broadcast_info']
+        pipeline_data['broadcast_id'] = save_broadcast_info(
+            db_manager, pipeline_data['lv_value'], broadcast_info, pipeline_data
+        )
+    return pipeline_data['broadcast_id']
+
 def save_broadcast_info(db_manager: DatabaseManager, lv_value: str, 
                        broadcast_info: Dict, pipeline_data: Dict) -> int:
     """放送情報をデータベースに保存"""
@@ -348,23 +373,34 @@ def save_special_users_config(db_manager: DatabaseManager, config: Dict):
                 print(f"新規スペシャルユーザー登録: {user_id} ({current_name})")
 
 def save_all_comments(db_manager: DatabaseManager, broadcast_id: int, 
-                     all_comments: List[Dict], special_users_found: List[Dict], 
+                     all_comments: CommentBatch, special_users_found: List[Dict], 
                      broadcast_info: Dict) -> int:  # ★broadcast_info引数追加
-    """全コメントを保存（コンテキスト用）"""
+    """全コメントを保存（コンテキスト用）
+
+    保存済みのコメント番号（comment_no）は挿入せず、新しい行だけを追加して件数を返す。
+    既存行はスペシャルユーザーのフラグだけ現在の設定に合わせて更新する。
+    """
+    all_comments = CommentBatch.from_comments(all_comments)
     special_user_ids = {user['user_id'] for user in special_users_found}
     
     with sqlite3.connect(db_manager.db_path) as conn:
         cursor = conn.cursor()
         
-        # 既存コメントを削除（重複回避）
-        cursor.execute("DELETE FROM comments WHERE broadcast_id = ?", (broadcast_id,))
+        # 保存済みのコメント（重複回避）: (thread, no) で判定し、番号のない行（noが0/NULL）は対象外
+        # threadを記録する前に保存された行（comment_threadがNULL）は番号だけで判定する
+        cursor.execute("SELECT comment_thread, comment_no FROM comments WHERE broadcast_id = ?", (broadcast_id,))
+        saved_rows = cursor.fetchall()
+        saved_keys = {(thread, no) for thread, no in saved_rows if no and thread is not None}
+        legacy_nos = {no for thread, no in saved_rows if no and thread is None}
+        if saved_rows:
+            update_special_user_flags(cursor, broadcast_id, special_user_ids)
         
         if not all_comments:
             print("保存するコメントがありません")
             return 0
         
         # 配信開始時刻を取得（経過時間計算用）
-        start_timestamp = all_comments[0].get('date', 0) if all_comments else 0
+        start_timestamp = all_comments.date[0]
         
         # ★broadcast_infoから開始時間を文字列形式に変換
         start_time_str = ""
@@ -376,48 +412,71 @@ def save_all_comments(db_manager: DatabaseManager, broadcast_id: int,
             except:
                 start_time_str = ""
         
-        # 全コメントを一括挿入
-        comment_data = []
-        for comment in all_comments:
-            user_id = comment.get('user_id', '')
-            is_special = user_id in special_user_ids
-            
-            # 配信開始からの経過時間を計算
-            elapsed_time = calculate_elapsed_time(
-                comment.get('date', 0), 
-                start_timestamp
-            )
-            
-            comment_data.append((
-                broadcast_id,
-                user_id,
-                comment.get('user_name', ''),
-                comment.get('text', ''),
-                safe_int(comment.get('no', 0)),
-                safe_int(comment.get('date', 0)),
-                elapsed_time,
-                is_special,
-                safe_int(comment.get('premium', 0)),
-                bool(comment.get('anonymity', False)),
-                broadcast_info.get('live_title', ''),  # ★broadcast_title
-                start_time_str,  # ★broadcast_start_time
-                broadcast_info.get('lv_value', '')  # ★broadcast_lv_id
-            ))
+        live_title = broadcast_info.get('live_title', '')
+        lv_id = broadcast_info.get('lv_value', '')
+        
+        # 未保存のコメントだけを一括挿入（列から直接タプルを生成）
+        special_comments = 0
+        skipped_comments = 0
+        
+        special_codes = all_comments.user_codes_for(special_user_ids)
+        user_table = all_comments.user_table
+        name_table = all_comments.name_table
+        thread_table = all_comments.thread_table
+        
+        def comment_rows():
+            nonlocal special_comments, skipped_comments
+            for no, user_code, name_code, text, date, premium, anonymity, thread_code in zip(
+                    all_comments.no, all_comments.user_codes, all_comments.name_codes, all_comments.text,
+                    all_comments.date, all_comments.premium, all_comments.anonymity, all_comments.thread_codes):
+                thread = thread_table[thread_code]
+                if no and (no in legacy_nos or (thread, no) in saved_keys):
+                    skipped_comments += 1
+                    continue
+                is_special = user_code in special_codes
+                if is_special:
+                    special_comments += 1
+                yield (
+                    broadcast_id,
+                    user_table[user_code],
+                    name_table[name_code],
+                    text,
+                    no,
+                    thread,
+                    date,
+                    calculate_elapsed_time(date, start_timestamp),  # 配信開始からの経過時間
+                    is_special,
+                    premium,
+                    bool(anonymity),
+                    live_title,  # ★broadcast_title
+                    start_time_str,  # ★broadcast_start_time
+                    lv_id  # ★broadcast_lv_id
+                )
         
         cursor.executemany('''
             INSERT INTO comments 
-            (broadcast_id, user_id, user_name, comment_text, comment_no, 
+            (broadcast_id, user_id, user_name, comment_text, comment_no, comment_thread,
              timestamp, elapsed_time, is_special_user, premium, anonymity,
              broadcast_title, broadcast_start_time, broadcast_lv_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', comment_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', comment_rows())
         
-        comments_saved = len(comment_data)
-        special_comments = sum(1 for _, user_id, *_ in comment_data if user_id in special_user_ids)
+        comments_saved = len(all_comments) - skipped_comments
         
-        print(f"全コメント保存完了: {comments_saved}件 (特別ユーザー: {special_comments}件)")
+        print(f"全コメント保存完了: {comments_saved}件 (特別ユーザー: {special_comments}件, 保存済みでスキップ: {skipped_comments}件)")
         return comments_saved
 
+def update_special_user_flags(cursor, broadcast_id: int, special_user_ids) -> None:
+    """保存済みコメントのスペシャルユーザーフラグを現在の監視対象に合わせる"""
+    cursor.execute(
+        "UPDATE comments SET is_special_user = 0 WHERE broadcast_id = ? AND is_special_user",
+        (broadcast_id,)
+    )
+    cursor.executemany(
+        "UPDATE comments SET is_special_user = 1 WHERE broadcast_id = ? AND user_id = ?",
+        ((broadcast_id, user_id) for user_id in special_user_ids)
+    )
+
 def save_ai_analyses(db_manager: DatabaseManager, broadcast_id: int, 
                     special_users_found: List[Dict]) -> int:
     """AI分析結果を保存"""
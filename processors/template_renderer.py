@@ -0,0 +1,143 @@
+# processors/template_renderer.py
+"""
+Step03のHTMLテンプレート描画
+
+テンプレート（templates/user_detail.html など）はプロセスごとに1回だけ読み込んで
+コンパイルし、以降はキャッシュしたものを使う。
+
+jinja2があれば Environment（自動エスケープ有効）でコンパイルして描画する。
+jinja2がない環境やテンプレートがjinja2の構文として解釈できない場合は、
+生のテンプレートを {{変数名}} の位置で分割してキャッシュし、1回の join で描画する
+（変数の値は escape_html でエスケープ）。
+
+どちらの方法でも、渡されなかった変数は {{変数名}} のまま残し、None は空文字列にする
+（jinja2の有無で出力が変わらないようにするため。旧方式の str.replace と同じく未知の変数は残る）。
+
+生成済みのHTML片（コメント行、AI分析結果など）は SafeHTML で包むとエスケープされない。
+"""
+import os
+import re
+import threading
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+_PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+_MISSING = object()
+
+_environments = {}
+_templates = {}
+_cache_lock = threading.Lock()
+
+
+class SafeHTML(str):
+    """エスケープせずにそのまま埋め込むHTML片（markupsafeの __html__ プロトコルに対応）"""
+
+    def __html__(self):
+        return self
+
+
+def escape_html(text):
+    """HTMLエスケープ"""
+    if not text:
+        return ""
+    text = str(text)
+    return (text.replace('&', '&amp;')
+                .replace('<', '&lt;')
+                .replace('>', '&gt;')
+                .replace('"', '&quot;')
+                .replace("'", '&#x27;'))
+
+
+class RawTemplate:
+    """jinja2を使わない場合のテンプレート（{{変数名}} の位置で分割済み）"""
+
+    def __init__(self, source):
+        self.parts = _PLACEHOLDER_PATTERN.split(source)
+
+    def render(self, **context):
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            value = context.get(parts[i], _MISSING)
+            if value is _MISSING:
+                parts[i] = _placeholder(parts[i])
+            elif value is None:
+                parts[i] = ""
+            elif isinstance(value, SafeHTML):
+                parts[i] = str(value)
+            else:
+                parts[i] = escape_html(value)
+        return "".join(parts)
+
+
+def _placeholder(name):
+    return "{{" + name + "}}"
+
+
+def _finalize(value):
+    return "" if value is None else value
+
+
+if jinja2 is not None:
+    class PlaceholderUndefined(jinja2.Undefined):
+        """渡されなかった変数を {{変数名}} のまま出力する（RawTemplate と同じ）"""
+        __slots__ = ()
+
+        def __str__(self):
+            if self._undefined_obj is jinja2.utils.missing and self._undefined_name:
+                return _placeholder(self._undefined_name)
+            return ""
+
+
+def get_template_environment(template_dir):
+    """template_dirごとに共有のjinja2 Environmentを取得（jinja2がなければNone）"""
+    if jinja2 is None:
+        return None
+    with _cache_lock:
+        environment = _environments.get(template_dir)
+        if environment is None:
+            environment = _environments[template_dir] = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(template_dir),
+                autoescape=jinja2.select_autoescape(['html']),
+                auto_reload=False,
+                keep_trailing_newline=True,
+                undefined=PlaceholderUndefined,
+                finalize=_finalize
+            )
+        return environment
+
+
+def get_template(template_dir, template_name):
+    """コンパイル済みテンプレートを取得（初回のみファイルを読み込む）"""
+    key = (template_dir, template_name)
+    template = _templates.get(key)
+    if template is not None:
+        return template
+
+    environment = get_template_environment(template_dir)
+    template = None
+    if environment is not None:
+        try:
+            template = environment.get_template(template_name)
+        except jinja2.TemplateSyntaxError as e:
+            print(f"[DEBUG] テンプレートをjinja2で解釈できないため単純置換で描画: {template_name} - {str(e)}")
+    if template is None:
+        with open(os.path.join(template_dir, template_name), 'r', encoding='utf-8') as f:
+            template = RawTemplate(f.read())
+
+    with _cache_lock:
+        return _templates.setdefault(key, template)
+
+
+def render_template(template_dir, template_name, **context):
+    """テンプレートを描画した文字列を返す"""
+    return get_template(template_dir, template_name).render(**context)
+
+
+def clear_template_cache():
+    """キャッシュを破棄（テンプレートを編集した場合に次回の描画で読み直す）"""
+    with _cache_lock:
+        _environments.clear()
+        _templates.clear()
@@ -0,0 +1,142 @@
+# processors/xml_tail_reader.py
+"""
+書き込み中のNCVコメントログを追記分だけ逐次解析するリーダー
+
+NCVは放送中ずっと同じXMLに<chat>を追記し続け、ルート要素は放送終了まで閉じられない。
+そのため通常のXMLパーサーでは途中状態を読めないので、前回読み終えたバイト位置から
+完結した<chat>要素とヘッダー要素（LiveInfo/PlayerStatus）だけを切り出して解析する。
+"""
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+from processors.comment_batch import CommentBatch
+from processors.step01_xml_parser import (
+    HEADER_TAGS, build_broadcast_info, chat_element_to_row, strip_namespace
+)
+
+# 完結した<chat>要素（自己終了タグを含む）またはヘッダー要素
+ELEMENT_PATTERN = re.compile(
+    rb'<(?:[\w.-]+:)?chat\b[^>]*?(?:/>|>.*?</(?:[\w.-]+:)?chat\s*>)'
+    rb'|<(?:[\w.-]+:)?(' + b'|'.join(tag.encode() for tag in HEADER_TAGS) + rb')\b.*?</(?:[\w.-]+:)?\1\s*>',
+    re.DOTALL
+)
+
+# 1回に読み込むバイト数（監視開始時に既に大きなログでもメモリ使用量を抑える）
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+# ファイルの作り直しを検出するために保持する先頭のバイト数
+SIGNATURE_BYTES = 256
+
+# 名前空間プレフィックス（単体の要素として解析するときは未定義になるため外す）
+PREFIX_PATTERN = re.compile(rb'(</?)[\w.-]+:')
+
+
+class IncrementalNCVReader:
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.offset = 0  # 解析済みのバイト位置
+        self.comments = CommentBatch()
+        self.header = {}
+        self.error_count = 0
+        self.finished = False  # finish()後はバッチをパイプラインに渡すので追記しない
+        # 読み込み中のファイルの識別（作り直されたことの検出用）: (st_dev, st_ino) と先頭バイト
+        self.file_id = None
+        self.signature = b''
+        self.lock = threading.Lock()
+
+    def read_new(self):
+        """前回位置以降に追記された要素を解析し、新規コメント数を返す（finish()後は何もしない）"""
+        with self.lock:
+            if self.finished or not os.path.exists(self.xml_path):
+                return 0
+
+            with open(self.xml_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if self.offset and self._is_replaced(f, stat):
+                    # ファイルが作り直された場合は最初から読み直す
+                    print(f"[DEBUG] XMLが作り直されたため再解析: {self.xml_path}")
+                    self._reset()
+
+                file_size = stat.st_size
+                if file_size == self.offset:
+                    return 0
+                if not self.offset:
+                    self.file_id = (stat.st_dev, stat.st_ino)
+                    f.seek(0)
+                    self.signature = f.read(SIGNATURE_BYTES)
+
+                # 一定サイズずつ読み、完結した要素を解析して残り（途中の要素）を次のチャンクに持ち越す
+                f.seek(self.offset)
+                remaining = file_size - self.offset
+                pending = b''
+                new_count = 0
+                while remaining > 0:
+                    chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    data = pending + chunk
+                    consumed, count = self._parse_elements(data)
+                    new_count += count
+                    self.offset += consumed
+                    pending = data[consumed:]
+
+            # 完結していない末尾の要素は次回に持ち越す
+            return new_count
+
+    def _parse_elements(self, data):
+        """data中の完結した要素を解析し、(最後の要素の終端位置, 新規コメント数) を返す"""
+        new_count = 0
+        consumed = 0
+        for match in ELEMENT_PATTERN.finditer(data):
+            consumed = match.end()
+            header_tag = match.group(1)
+            try:
+                elem = ET.fromstring(PREFIX_PATTERN.sub(rb'\1', match.group(0)))
+                if header_tag:
+                    self.header[header_tag.decode()] = strip_namespace(elem)
+                    continue
+                row = chat_element_to_row(elem)
+                if row is not None:
+                    self.comments.append(*row)
+                    new_count += 1
+            except (ET.ParseError, ValueError, TypeError) as e:
+                self.error_count += 1
+                print(f"コメント解析エラー: {e}")
+        return consumed, new_count
+
+    def _is_replaced(self, f, stat):
+        """前回読んだファイルから縮小・別ファイルへの置き換え・先頭の書き換えがあったか"""
+        if stat.st_size < self.offset:
+            return True
+        if self.file_id is not None and stat.st_ino and self.file_id != (stat.st_dev, stat.st_ino):
+            return True
+        f.seek(0)
+        head = f.read(SIGNATURE_BYTES)
+        if not head.startswith(self.signature):
+            return True
+        # 小さいうちに読み始めたファイルは、書き足された分も先頭の識別に含める
+        self.signature = head
+        return False
+
+    def _reset(self):
+        self.offset = 0
+        self.comments = CommentBatch()
+        self.header = {}
+        self.file_id = None
+        self.signature = b''
+
+    def finish(self):
+        """残りの追記分を読み込み、(日時順のCommentBatch, 放送情報) を返す
+
+        返したバッチは呼び出し側（Step01〜04）が所有する。監視スレッドのread_new()が
+        処理中のバッチに追記しないよう、以後このリーダーは読み込みを止める。
+        """
+        new_count = self.read_new()
+        with self.lock:
+            self.finished = True
+            comments = self.comments.sort_by_date()
+            broadcast_info = build_broadcast_info(self.header.get('LiveInfo'), self.header.get('PlayerStatus'))
+        print(f"逐次解析完了: 最終読み込み{new_count}件, 合計{len(comments)}件")
+        return comments, broadcast_info
@@ -0,0 +1,257 @@
+# reprocess.py - NCVコメントログの一括再解析（バックフィル）
+"""
+ncv_folder_path 配下の全 ncvLog_lv*.xml を並列に解析し、データベースへ保存し直す。
+
+XML解析は ProcessPoolExecutor で全コアに分散し、解析結果は上限付きキューを通して
+1本のDB書き込みスレッドに渡す（SQLiteへの書き込みは直列、解析は並列）。
+キューが満杯のときは新しい解析の投入を待つため、メモリ上の解析済みデータは一定量に抑えられる。
+ワーカーからは CommentBatch を comments.bin と同じ形式の1つのバイト列にして返す（コメントごとのpickleを避ける）。
+DB書き込みスレッドが異常終了した場合は、キューへの投入を待ち続けずに中断する。
+
+使い方:
+    python reprocess.py
+    python reprocess.py --ncv-path "C:\\...\\CommentLog" --workers 8
+    python reprocess.py --skip-processed --mark-processed
+
+同じフォルダにある同一lvのXML（再接続で分割されたログ）は、xml_merge_settings が有効なら
+1件の放送としてまとめて解析し、スレッドとコメント番号（thread, no）で重複排除してから保存する。
+"""
+import argparse
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config_manager import HierarchicalConfigManager
+from processors.comment_batch import CommentBatch
+from processors.step01_xml_parser import is_xml_merge_enabled, merge_ncv_logs, parse_ncv_log
+from processors.step04_database_storage import (
+    DatabaseManager, save_all_comments, save_broadcast_info, update_system_stats
+)
+
+# file_monitor.NCVFolderMonitor._is_ncv_xml_file と同じ判定
+NCV_XML_PATTERN = re.compile(r'^ncvLog_lv\d+.*\.xml$')
+LV_PATTERN = re.compile(r'lv\d+')
+
+# 進捗を表示する間隔（秒）
+REPORT_INTERVAL = 5.0
+# キューが満杯のときにDB書き込みスレッドの生存を確認する間隔（秒）
+QUEUE_PUT_TIMEOUT = 1.0
+
+_QUEUE_END = None
+
+
+def find_ncv_xmls(ncv_path):
+    """ncv_folder_path 配下のXMLを (xml_path, subfolder_name, lv_value) で列挙"""
+    for dirpath, dirnames, filenames in os.walk(ncv_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not NCV_XML_PATTERN.match(filename):
+                continue
+            match = LV_PATTERN.search(filename)
+            if not match:
+                continue
+            xml_path = os.path.join(dirpath, filename)
+            subfolder_name = os.path.basename(os.path.dirname(xml_path))
+            yield xml_path, subfolder_name, match.group()
+
+
+def group_by_broadcast(targets, merge):
+    """同じフォルダ・同じlvのXMLを1件にまとめ (xml_paths, subfolder_name, lv_value) を返す"""
+    if not merge:
+        return [([xml_path], subfolder_name, lv_value) for xml_path, subfolder_name, lv_value in targets]
+
+    groups = {}
+    for xml_path, subfolder_name, lv_value in targets:
+        key = (os.path.dirname(xml_path), lv_value)
+        if key not in groups:
+            groups[key] = ([], subfolder_name, lv_value)
+        groups[key][0].append(xml_path)
+    return list(groups.values())
+
+
+def parse_worker(xml_paths):
+    """ワーカープロセス側: XMLを解析し、DB保存に使う列だけのバイト列（CommentBatch.to_bytes）と放送情報を返す
+
+    CommentBatch をそのまま返すとコメント本文などの文字列が1件ずつpickleされ、記号表の逆引き辞書も
+    送られるため、列と記号表をまとめた1つのバイト列にする（逆引き辞書は受け取った側で作り直す）。
+    """
+    comments_data, broadcast_info = parse_ncv_log(xml_paths[0])
+    if len(xml_paths) > 1:
+        merge_ncv_logs(comments_data, broadcast_info, xml_paths[1:])
+    return comments_data.to_bytes(), broadcast_info
+
+
+class WriterStoppedError(RuntimeError):
+    """DB書き込みスレッドが終了していてキューを消費できない"""
+
+
+def put_result(result_queue, item, writer):
+    """キューに投入（満杯の間はDB書き込みスレッドの生存を確認しながら待つ）"""
+    while True:
+        if not writer.is_alive():
+            raise WriterStoppedError("DB書き込みスレッドが停止したため中断します")
+        try:
+            result_queue.put(item, timeout=QUEUE_PUT_TIMEOUT)
+            return
+        except queue.Full:
+            continue
+
+
+class ReprocessStats:
+    """スループット計測（DB書き込みスレッドとメインスレッドで共有）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.files_total = 0
+        self.files_parsed = 0
+        self.files_saved = 0
+        self.files_failed = 0
+        self.comments_saved = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self, label="進捗"):
+        with self.lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            print(f"[{label}] 解析 {self.files_parsed}/{self.files_total} 保存 {self.files_saved} "
+                  f"失敗 {self.files_failed} コメント {self.comments_saved}件 | "
+                  f"{self.files_saved / elapsed:.2f} files/sec, "
+                  f"{self.comments_saved / elapsed:.0f} comments/sec ({elapsed:.1f}秒)")
+
+
+def db_writer(result_queue, stats, special_users_found, config_manager, mark_processed):
+    """DB書き込みスレッド: キューから解析結果を取り出して順にStep04の保存処理を行う"""
+    db_manager = DatabaseManager()
+    while True:
+        item = result_queue.get()
+        try:
+            if item is _QUEUE_END:
+                break
+            xml_paths, subfolder_name, lv_value, comments_bytes, broadcast_info = item
+            xml_path = xml_paths[0]
+            try:
+                comments_data, _ = CommentBatch.from_bytes(comments_bytes)
+                pipeline_data = {'xml_path': xml_path, 'subfolder_name': subfolder_name}
+                broadcast_id = save_broadcast_info(db_manager, lv_value, broadcast_info, pipeline_data)
+                saved = save_all_comments(db_manager, broadcast_id, comments_data,
+                                          special_users_found, broadcast_info)
+                if mark_processed:
+                    for path in xml_paths:
+                        config_manager.add_processed_xml(path)
+                stats.add(files_saved=1, comments_saved=saved)
+            except Exception as e:
+                print(f"DB保存エラー: {xml_path} - {str(e)}")
+                stats.add(files_failed=1)
+        finally:
+            result_queue.task_done()
+
+    update_system_stats(db_manager)
+
+
+def reprocess(ncv_path, workers=None, queue_size=None, skip_processed=False, mark_processed=False):
+    """ncv_path 配下を一括再解析してDBに保存"""
+    config_manager = HierarchicalConfigManager()
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or workers * 2
+
+    merge = is_xml_merge_enabled(config_manager.load_global_config())
+    targets = group_by_broadcast(list(find_ncv_xmls(ncv_path)), merge)
+    if skip_processed:
+        # 統合グループは1つでも未処理のXMLがあれば再解析（DBには新しいコメントだけ追加される）
+        processed = set(config_manager.load_processed_xmls())
+        targets = [target for target in targets if not all(path in processed for path in target[0])]
+
+    # is_special_user 列のため、有効なスペシャルユーザーを保存対象として渡す
+    special_users_found = [
+        {'user_id': user_id}
+        for user_id, user in config_manager.get_all_special_users().items()
+        if user.get('enabled', True)
+    ]
+
+    stats = ReprocessStats()
+    stats.files_total = len(targets)
+    print(f"再解析開始: {ncv_path} ({len(targets)}件, ワーカー{workers}, キュー上限{queue_size})")
+    if not targets:
+        return stats
+
+    result_queue = queue.Queue(maxsize=queue_size)
+    writer = threading.Thread(
+        target=db_writer,
+        args=(result_queue, stats, special_users_found, config_manager, mark_processed),
+        daemon=True
+    )
+    writer.start()
+
+    last_report = time.perf_counter()
+    pending = {}
+    remaining = iter(targets)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # 実行中の解析が常に workers + queue_size 件程度になるよう投入
+            while len(pending) < workers + queue_size:
+                target = next(remaining, None)
+                if target is None:
+                    break
+                pending[executor.submit(parse_worker, target[0])] = target
+            if not pending:
+                break
+
+            done, _ = wait(pending, timeout=REPORT_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                xml_paths, subfolder_name, lv_value = pending.pop(future)
+                try:
+                    comments_bytes, broadcast_info = future.result()
+                except Exception as e:
+                    print(f"XML解析エラー: {xml_paths[0]} - {str(e)}")
+                    stats.add(files_failed=1)
+                    continue
+                stats.add(files_parsed=1)
+                # キューが満杯ならDB書き込みが追いつくまで待つ
+                put_result(result_queue, (xml_paths, subfolder_name, lv_value, comments_bytes, broadcast_info), writer)
+
+            if time.perf_counter() - last_report >= REPORT_INTERVAL:
+                stats.report()
+                last_report = time.perf_counter()
+    finally:
+        # DB書き込みスレッドの停止などで中断した場合は未着手の解析を取り消す
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    put_result(result_queue, _QUEUE_END, writer)
+    writer.join()
+    stats.report("完了")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NCVコメントログの一括再解析")
+    parser.add_argument("--ncv-path", help="CommentLogフォルダ（省略時はglobal_configのncv_folder_path）")
+    parser.add_argument("--workers", type=int, default=None, help="解析プロセス数（既定: CPUコア数）")
+    parser.add_argument("--queue-size", type=int, default=None, help="解析済み結果キューの上限（既定: ワーカー数×2）")
+    parser.add_argument("--skip-processed", action="store_true", help="処理済みXMLをスキップ")
+    parser.add_argument("--mark-processed", action="store_true", help="保存したXMLを処理済みに登録")
+    args = parser.parse_args()
+
+    ncv_path = args.ncv_path or HierarchicalConfigManager().load_global_config().get("ncv_folder_path", "")
+    if not os.path.isdir(ncv_path):
+        print(f"NCVフォルダが見つかりません: {ncv_path}")
+        sys.exit(1)
+
+    try:
+        reprocess(ncv_path, args.workers, args.queue_size, args.skip_processed, args.mark_processed)
+    except WriterStoppedError as e:
+        print(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+// 一覧ページ（list.html）のコメント表の遅延読み込み
+// 「コメントを表示」を押したときに comments/{lv}.js を読み込んで表を組み立てる。
+// file:// で開いても動くよう fetch ではなく <script> タグで読み込む。
+(function () {
+  var loaded = {};
+  var pending = {};
+
+  function setMessage(tbody, message) {
+    var row = document.createElement('tr');
+    var cell = document.createElement('td');
+    cell.colSpan = 4;
+    cell.style.padding = '5px';
+    cell.textContent = message;
+    row.appendChild(cell);
+    tbody.textContent = '';
+    tbody.appendChild(row);
+  }
+
+  window.ncvCommentTables = {
+    // comments/{lv}.js から呼ばれる: rows は [番号, 配信内時間, 日時, コメント] の配列
+    register: function (id, rows) {
+      loaded[id] = true;
+      pending[id] = false;
+      var container = document.getElementById(id);
+      if (!container) return;
+      var tbody = container.querySelector('tbody');
+      var fragment = document.createDocumentFragment();
+      rows.forEach(function (row) {
+        var tr = document.createElement('tr');
+        row.forEach(function (value, column) {
+          var td = document.createElement('td');
+          td.style.padding = '5px';
+          if (column === 3) {
+            var text = document.createElement('b');
+            text.style.fontSize = '20px';
+            text.textContent = value;
+            td.appendChild(text);
+          } else {
+            td.textContent = value;
+          }
+          tr.appendChild(td);
+        });
+        fragment.appendChild(tr);
+      });
+      tbody.textContent = '';
+      tbody.appendChild(fragment);
+    }
+  };
+
+  window.ncvToggleComments = function (id) {
+    var container = document.getElementById(id);
+    if (!container) return;
+    var show = container.style.display === 'none';
+    container.style.display = show ? 'block' : 'none';
+    if (!show || loaded[id] || pending[id]) return;
+
+    pending[id] = true;
+    var tbody = container.querySelector('tbody');
+    setMessage(tbody, '読み込み中...');
+    var script = document.createElement('script');
+    script.src = container.getAttribute('data-comments-src');
+    script.onerror = function () {
+      pending[id] = false;
+      setMessage(tbody, 'コメントを読み込めませんでした');
+    };
+    document.body.appendChild(script);
+  };
+})();
@@ -37,6 +37,13 @@ except ImportError:
     # `requests` may not be installed in the environment; provide a fallback
     requests = None  # type: ignore
 
+# data.json may be written compact or gzip-compressed (see artifact_io.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from artifact_io import load_json_artifact
+# AI output post-processing shared with Step02 (precompiled patterns)
+from processors.ai_response_normalizer import strip_code_fences
+from processors.ai_response_normalizer import strip_html_tags as normalizer_strip_html_tags
+
 
 def load_global_config(config_path: str) -> Tuple[str, str, str, int]:
     """Load API settings from the global configuration file.
@@ -126,8 +133,7 @@ def extract_analysis_and_title(data_path: str) -> Tuple[str, str]:
     """
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"data.json not found: {data_path}")
-    with open(data_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load_json_artifact(data_path)
     user_data = data.get('user_data', {})
     broadcast_info = data.get('broadcast_info', {})
     ai_analysis = user_data.get('ai_analysis')
@@ -148,9 +154,7 @@ def strip_html_tags(text: str) -> str:
     Returns:
         The text with HTML tags removed.
     """
-    # Replace line breaks with spaces before stripping tags to preserve spacing
-    cleaned = re.sub(r'<[^>]+>', '', text)
-    return cleaned.strip()
+    return normalizer_strip_html_tags(text)
 
 
 def call_claude(api_key: str, model: str, prompt: str, analysis: str, max_tokens: int) -> str:
@@ -271,13 +275,7 @@ def strip_wrapping(text: str) -> str:
     Returns:
         The unwrapped text.
     """
-    # Trim whitespace
-    cleaned = text.strip()
-    # Remove leading code fence if present
-    cleaned = re.sub(r'^```[\w\s]*\n', '', cleaned)
-    # Remove trailing code fence if present
-    cleaned = re.sub(r'\n```$', '', cleaned)
-    return cleaned.strip()
+    return strip_code_fences(text)
 
 
 def sanitize_filename(name: str) -> str:
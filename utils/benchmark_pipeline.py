@@ -0,0 +1,867 @@
+# benchmark_pipeline.py
+"""
+パイプライン各ステップの性能計測スクリプト
+
+使用方法:
+    python utils/benchmark_pipeline.py step01 --comments 200000
+    python utils/benchmark_pipeline.py step01-fastpath --comments 500000
+    python utils/benchmark_pipeline.py ai-scheduler --requests 200 --rate-limit-ratio 0.05
+    python utils/benchmark_pipeline.py ai-clients --requests 200
+    python utils/benchmark_pipeline.py ai-normalizer --responses 2000
+    python utils/benchmark_pipeline.py special-match --comments 1000000 --special 1000
+    python utils/benchmark_pipeline.py step03-templates --users 100 --comments 1000
+    python utils/benchmark_pipeline.py step03-list --broadcasts 200 --comments 100
+    python utils/benchmark_pipeline.py step03-assets --users 200
+    python utils/benchmark_pipeline.py step03-parallel --users 50 --broadcasts 3 --workers 4
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from processors import step01_xml_parser
+from processors.comment_batch import CommentBatch
+from processors import special_user_matcher
+from processors import broadcast_index, static_assets, step03_html_generator, template_renderer
+
+
+def generate_synthetic_ncv_log(xml_path, comment_count, user_count=3000, seed=1, malformed_ratio=0.0):
+    """NCV形式の合成コメントログを生成（malformed_ratioの割合で数値属性が不正な行を混ぜる）"""
+    rng = random.Random(seed)
+    namespace = "http://posite-c.jp/niconamacommentviewer/commentlog/"
+    start_time = 1700000000
+
+    with open(xml_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write(f'<NicoLiveCommentLog xmlns="{namespace}">\n')
+        f.write('  <LiveInfo><LiveTitle>ベンチマーク配信</LiveTitle><Broadcaster>配信者</Broadcaster>'
+                f'<CommunityName>co0</CommunityName><StartTime>{start_time}</StartTime>'
+                f'<EndTime>{start_time + comment_count // 10}</EndTime></LiveInfo>\n')
+        f.write('  <PlayerStatus><Stream><WatchCount>1000</WatchCount>'
+                f'<CommentCount>{comment_count}</CommentCount><OwnerId>1</OwnerId>'
+                '<OwnerName>配信者</OwnerName></Stream></PlayerStatus>\n')
+        f.write('  <Comments>\n')
+        for no in range(1, comment_count + 1):
+            if rng.random() < 0.7:
+                user_id = str(rng.randint(1, user_count))
+                anonymity = ''
+            else:
+                user_id = f"a:{rng.getrandbits(40):x}"
+                anonymity = ' anonymity="1"'
+            premium = str(rng.randint(0, 1))
+            if malformed_ratio and rng.random() < malformed_ratio:
+                premium = "?"
+            f.write(f'    <chat thread="1" no="{no}" vpos="{no * 10}" date="{start_time + no // 10}" '
+                    f'date_usec="0" user_id="{user_id}" name="ユーザー{user_id}" premium="{premium}"'
+                    f'{anonymity}>コメント{no} わこつ</chat>\n')
+        f.write('  </Comments>\n')
+        f.write('</NicoLiveCommentLog>\n')
+
+
+def measure(label, func, *args):
+    """実行時間とPythonヒープのピーク使用量を計測"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed:8.3f}秒  ピーク {peak / (1024 * 1024):8.1f}MB")
+    return elapsed, peak, result
+
+
+def legacy_two_pass_parse(xml_path):
+    """旧実装: ET.parse + strip_namespaceを2回（コメント用・放送情報用）"""
+    root = step01_xml_parser.strip_namespace(ET.parse(xml_path).getroot())
+    comments = []
+    for chat in root.findall('.//chat'):
+        try:
+            comment_date = int(chat.get('date', 0))
+            if comment_date == 0:
+                continue
+            comments.append({
+                "no": int(chat.get('no', 0)),
+                "user_id": chat.get('user_id', ''),
+                "user_name": chat.get('name', ''),
+                "text": chat.text or '',
+                "date": comment_date,
+                "premium": int(chat.get('premium', 0)),
+                "anonymity": 'anonymity' in chat.attrib,
+                "thread": chat.get('thread', '')
+            })
+        except (ValueError, TypeError):
+            continue
+    comments.sort(key=lambda x: x['date'])
+    del root
+
+    root = step01_xml_parser.strip_namespace(ET.parse(xml_path).getroot())
+    broadcast_info = step01_xml_parser.build_broadcast_info(root.find('LiveInfo'), root.find('PlayerStatus'))
+    return comments, broadcast_info
+
+
+def bench_step01(args):
+    """Step01: 2パス解析と1パスストリーミング解析の比較"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = os.path.join(tmp_dir, "ncvLog_lv0-bench.xml")
+        generate_synthetic_ncv_log(xml_path, args.comments)
+        size_mb = os.path.getsize(xml_path) / (1024 * 1024)
+        print(f"Step01 XML解析: コメント{args.comments}件 ({size_mb:.1f}MB)")
+
+        legacy_time, legacy_peak, legacy_result = measure("旧: 2パス (ET.parse x2)", legacy_two_pass_parse, xml_path)
+        stream_time, stream_peak, stream_result = measure("新: 1パス (iterparse)", step01_xml_parser.parse_ncv_log, xml_path)
+
+        if legacy_result != (stream_result[0].to_dicts(), stream_result[1]):
+            print("  ⚠ 解析結果が一致しません")
+        print(f"  時間比: {stream_time / legacy_time:.2f}  ピークメモリ比: {stream_peak / legacy_peak:.2f}")
+
+
+def decimal_fast_path_parse(xml_path):
+    """比較用: 数値属性を isdecimal() で検査し、行ごとのtry/exceptを使わない変換"""
+    comments = CommentBatch()
+    for chat in step01_xml_parser.iter_chat_elements(xml_path):
+        get = chat.get
+        no = get('no', '0')
+        date = get('date', '0')
+        premium = get('premium', '0')
+        if no.isdecimal() and date.isdecimal() and premium.isdecimal():
+            date = int(date)
+            if date:
+                comments.append(int(no), get('user_id', ''), get('name', ''), chat.text or '',
+                                date, int(premium), 'anonymity' in chat.attrib, get('thread', ''))
+            continue
+        try:
+            row = step01_xml_parser.chat_element_to_row(chat)
+        except (ValueError, TypeError):
+            continue
+        if row is not None:
+            comments.append(*row)
+    return comments.sort_by_date()
+
+
+def parse_ncv_log_with_stats(xml_path):
+    """現行のStep01解析（計測の繰り返しごとに新しい stats で不正行を数える）"""
+    stats = {}
+    comments, broadcast_info = step01_xml_parser.parse_ncv_log(xml_path, stats)
+    return comments, broadcast_info, stats
+
+
+class LxmlChatTarget:
+    """比較用: lxmlのパーサーターゲット（要素を作らず属性辞書と本文だけ受け取る）"""
+
+    def __init__(self):
+        self.comments = CommentBatch()
+        self.attrib = None
+        self.text = []
+
+    def start(self, tag, attrib):
+        if tag == 'chat' or tag.endswith('}chat'):
+            self.attrib = attrib
+            self.text = []
+
+    def data(self, data):
+        if self.attrib is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        attrib = self.attrib
+        if attrib is None:
+            return
+        self.attrib = None
+        try:
+            date = int(attrib.get('date', 0))
+            if date:
+                self.comments.append(int(attrib.get('no', 0)), attrib.get('user_id', ''), attrib.get('name', ''),
+                                     ''.join(self.text), date, int(attrib.get('premium', 0)), 'anonymity' in attrib,
+                                     attrib.get('thread', ''))
+        except (ValueError, TypeError):
+            pass
+
+    def close(self):
+        return self.comments.sort_by_date()
+
+
+def lxml_target_parse(xml_path):
+    from lxml import etree
+    return etree.parse(xml_path, etree.XMLParser(target=LxmlChatTarget(), huge_tree=True))
+
+
+def measure_time(func, *args, repeat=3):
+    """実行時間のみ計測（最小値、tracemallocのオーバーヘッドなし）"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_step01_fastpath(args):
+    """Step01: <chat>属性の変換方式の比較（現行 / 例外処理なしの高速パス / lxmlパーサーターゲット）"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = os.path.join(tmp_dir, "ncvLog_lv0-bench.xml")
+        generate_synthetic_ncv_log(xml_path, args.comments, malformed_ratio=args.malformed)
+        size_mb = os.path.getsize(xml_path) / (1024 * 1024)
+        print(f"Step01 属性変換: コメント{args.comments}件 ({size_mb:.1f}MB, 不正行の割合{args.malformed})")
+
+        base_time, base_result = measure_time(parse_ncv_log_with_stats, xml_path, repeat=args.repeat)
+        expected = base_result[0].to_dicts()
+        print(f"  現行 (iterparse + try/except): {base_time:.3f}秒 "
+              f"({args.comments / base_time:,.0f} comments/sec, 不正行{base_result[2]['error_rows']}件)")
+
+        variants = [("isdecimal高速パス (iterparse)", decimal_fast_path_parse)]
+        try:
+            import lxml  # noqa: F401
+            variants.append(("lxmlパーサーターゲット", lxml_target_parse))
+        except ImportError:
+            print("  lxml未インストールのためlxml版は省略")
+
+        for label, func in variants:
+            elapsed, result = measure_time(func, xml_path, repeat=args.repeat)
+            if result.to_dicts() != expected:
+                print(f"  ⚠ {label}: 解析結果が一致しません")
+            print(f"  {label}: {elapsed:.3f}秒 (現行比 {base_time / elapsed:.2f}倍)")
+
+
+class SimulatedAPIError(Exception):
+    """擬似APIエラー（SDKの例外と同じく status_code を持つ）"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+def bench_ai_scheduler(args):
+    """AIスケジューラ: 擬似API（一定のレイテンシ・429混入）に対するスループットとメトリクス"""
+    from processors.ai_scheduler import get_ai_scheduler
+
+    rng = random.Random(1)
+    rng_lock = threading.Lock()
+
+    def fake_request():
+        time.sleep(args.latency)
+        with rng_lock:
+            rate_limited = rng.random() < args.rate_limit_ratio
+        if rate_limited:
+            raise SimulatedAPIError(429)
+        return "ok"
+
+    scheduler = get_ai_scheduler({"ai_rate_limits": {
+        "openai": {"max_concurrency": args.concurrency, "requests_per_minute": args.rpm, "tokens_per_minute": 0},
+        "max_retries": 6, "backoff_base_seconds": args.backoff, "backoff_max_seconds": 2.0
+    }})
+    print(f"AIスケジューラ: {args.requests}件 (レイテンシ{args.latency}秒, 同時実行{args.concurrency}, "
+          f"RPM {args.rpm or '無制限'}, 429の割合{args.rate_limit_ratio})")
+
+    started = time.perf_counter()
+    futures = [scheduler.submit("openai", fake_request, estimated_tokens=1000) for _ in range(args.requests)]
+    failed = 0
+    for future in futures:
+        try:
+            future.result()
+        except SimulatedAPIError:
+            failed += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"  {elapsed:.2f}秒 ({args.requests / elapsed:.1f} req/sec, 再試行しても失敗{failed}件)")
+    print(f"  {scheduler.format_metrics()}")
+
+
+class MockChatCompletionHandler(BaseHTTPRequestHandler):
+    """OpenAI互換の /chat/completions を返すだけの擬似エンドポイント（keep-alive対応）"""
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        # ヘッダーと本文を分けて送るとNagle/遅延ACKで約40ms待つため無効化
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        type(self).connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "分析結果"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_ai_clients(args):
+    """Step02: OpenAIクライアントを毎回作成する場合と共有プールを使う場合の1リクエストあたりのレイテンシ"""
+    try:
+        import openai
+    except ImportError:
+        print("openai未インストールのため計測できません")
+        return
+    from processors.step02_special_user_filter import get_openai_client
+
+    # SDK・HTTPクライアントのDEBUGログは計測から除外
+    logging.disable(logging.INFO)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockChatCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    messages = [{"role": "user", "content": "bench"}]
+    print(f"OpenAIクライアント: {args.requests}件 (擬似エンドポイント {base_url})")
+
+    def per_call_client():
+        client = openai.OpenAI(api_key="bench", base_url=base_url, max_retries=0)
+        return client.chat.completions.create(model="gpt-4o", messages=messages)
+
+    def pooled_client():
+        return get_openai_client("bench", base_url).chat.completions.create(model="gpt-4o", messages=messages)
+
+    try:
+        for label, func in [("毎回作成 (変更前)", per_call_client), ("共有プール", pooled_client)]:
+            func()  # 初回のimport・接続を除外
+            MockChatCompletionHandler.connections = 0
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                func()
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            average = sum(latencies) / len(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"  {label}: 平均 {average * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms, "
+                  f"新規TCP接続 {MockChatCompletionHandler.connections}回")
+    finally:
+        server.shutdown()
+
+
+def legacy_clean_ai_response(ai_response):
+    """旧実装: re.sub ×7 + str.replace ×2"""
+    if not ai_response:
+        return ""
+    ai_response = re.sub(r'```[\w]*\n?', '', ai_response)
+    ai_response = re.sub(r'```', '', ai_response)
+    ai_response = re.sub(r'`([^`]+)`', r'\1', ai_response)
+    ai_response = re.sub(r'\*\*([^*]+)\*\*', r'<strong>\1</strong>', ai_response)
+    ai_response = re.sub(r'^### (.+)$', r'<h3>\1</h3>', ai_response, flags=re.MULTILINE)
+    ai_response = re.sub(r'^## (.+)$', r'<h2>\1</h2>', ai_response, flags=re.MULTILINE)
+    ai_response = re.sub(r'^# (.+)$', r'<h1>\1</h1>', ai_response, flags=re.MULTILINE)
+    ai_response = ai_response.replace('\n\n', '<br><br>')
+    ai_response = ai_response.replace('\n', '<br>')
+    return ai_response.strip()
+
+
+def generate_synthetic_ai_response(rng, line_count):
+    """AI分析結果に近いMarkdown（見出し・太字・インラインコード・コードブロック）"""
+    words = ["視聴者", "コメント", "傾向", "配信者", "盛り上がり", "質問", "analysis", "user"]
+    lines = ["```html"] if rng.random() < 0.3 else []
+    for _ in range(line_count):
+        prefix = rng.choice(["", "", "", "# ", "## ", "### ", "- "])
+        tokens = []
+        for _ in range(rng.randint(3, 12)):
+            word = rng.choice(words)
+            roll = rng.random()
+            if roll < 0.1:
+                word = f"**{word}**"
+            elif roll < 0.15:
+                word = f"`{word}`"
+            tokens.append(word)
+        lines.append(prefix + " ".join(tokens))
+        if rng.random() < 0.2:
+            lines.append("")
+    if lines and lines[0] == "```html":
+        lines.append("```")
+    return "\n".join(lines)
+
+
+def bench_ai_normalizer(args):
+    """AI応答の後処理: 文字列パターンのre.sub多段（旧）と事前コンパイル・統合パターン（normalize_ai_response）の比較"""
+    from processors.ai_response_normalizer import normalize_ai_response
+
+    rng = random.Random(1)
+    responses = [generate_synthetic_ai_response(rng, args.lines) for _ in range(args.responses)]
+    size_kb = sum(len(response) for response in responses) / 1024
+    print(f"AI応答の後処理: {args.responses}件 (1件{args.lines}行, 計{size_kb:,.0f}KB)")
+
+    def run(func):
+        return [func(response) for response in responses]
+
+    legacy_time, legacy_result = measure_time(run, legacy_clean_ai_response, repeat=args.repeat)
+    single_time, single_result = measure_time(run, normalize_ai_response, repeat=args.repeat)
+    mismatches = sum(1 for old, new in zip(legacy_result, single_result) if old != new)
+    if mismatches:
+        print(f"  ⚠ 変換結果が一致しません: {mismatches}件")
+    print(f"  旧: re.sub x7 + replace x2   {legacy_time * 1000:8.1f}ms "
+          f"({legacy_time / args.responses * 1e6:.1f}μs/件)")
+    print(f"  新: 事前コンパイル・統合    {single_time * 1000:8.1f}ms "
+          f"({single_time / args.responses * 1e6:.1f}μs/件, 旧比 {legacy_time / single_time:.2f}倍)")
+
+
+def generate_synthetic_batch(comment_count, user_count, seed=1):
+    """列を直接組み立てた合成CommentBatch（コメントの多いユーザーほど出現しやすい分布）"""
+    rng = random.Random(seed)
+    batch = CommentBatch()
+    batch.user_table = [str(10000000 + i) for i in range(user_count)]
+    batch.user_lookup = {user_id: code for code, user_id in enumerate(batch.user_table)}
+    batch.name_table = [f"ユーザー{i}" for i in range(user_count)]
+    batch.name_lookup = {name: code for code, name in enumerate(batch.name_table)}
+    weights = [1.0 / (rank + 1) for rank in range(user_count)]
+    codes = rng.choices(range(user_count), weights=weights, k=comment_count)
+    batch.user_codes = array('i', codes)
+    batch.name_codes = array('i', codes)
+    batch.no = array('q', range(1, comment_count + 1))
+    batch.date = array('q', range(1700000000, 1700000000 + comment_count))
+    batch.premium = array('i', [0]) * comment_count
+    batch.anonymity = array('b', [0]) * comment_count
+    batch.thread_table = ['']
+    batch.thread_lookup = {'': 0}
+    batch.thread_codes = array('i', [0]) * comment_count
+    batch.text = [f"コメント{i}" for i in range(comment_count)]
+    return batch
+
+
+def legacy_find_special_users(comments_data, special_users):
+    """旧実装: 1行ずつコード照合し、スペシャルユーザーのコメントごとに辞書作成とprint"""
+    found_users = {}
+    special_codes = comments_data.user_codes_for(special_users)
+    user_table = comments_data.user_table
+    name_table = comments_data.name_table
+    for index, user_code in enumerate(comments_data.user_codes):
+        if user_code in special_codes:
+            user_id = user_table[user_code]
+            user_name = name_table[comments_data.name_codes[index]]
+            if user_id not in found_users:
+                found_users[user_id] = {'user_id': user_id, 'user_name': user_name, 'comments': []}
+            comment_data = {
+                'no': comments_data.no[index],
+                'date': comments_data.date[index],
+                'text': comments_data.text[index],
+                'premium': comments_data.premium[index],
+                'name': user_name
+            }
+            found_users[user_id]['comments'].append(comment_data)
+            print(f"スペシャルユーザーコメント検出: {user_id} - {comment_data['text'][:50]}")
+    return {user_id: [comment['no'] - 1 for comment in user['comments']] for user_id, user in found_users.items()}
+
+
+def bench_special_match(args):
+    """Step02 スペシャルユーザー照合: 旧ループ（行ごとのprint）と照合ステージ（NumPy / 純Python）の比較"""
+    batch = generate_synthetic_batch(args.comments, args.users)
+    rng = random.Random(2)
+    # 放送に出現するユーザーと出現しないユーザーを半分ずつ監視対象にする
+    special_users = set(rng.sample(batch.user_table, args.special // 2))
+    special_users.update(str(90000000 + i) for i in range(args.special - len(special_users)))
+    print(f"スペシャルユーザー照合: コメント{args.comments}件, 出現ユーザー{args.users}人, 監視対象{args.special}人")
+
+    def legacy():
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            return legacy_find_special_users(batch, special_users)
+
+    variants = [("純Python (compress)", False)]
+    if special_user_matcher.np is not None:
+        variants.insert(0, ("NumPy (frombuffer)", True))
+    else:
+        print("  NumPy未インストールのためNumPy版は省略")
+
+    legacy_time, expected = measure_time(legacy, repeat=1)
+    matched_comments = sum(len(rows) for rows in expected.values())
+    print(f"  旧: 行ごとの照合 + print        {legacy_time:8.3f}秒 (一致{len(expected)}人/{matched_comments}件)")
+    for label, use_numpy in variants:
+        elapsed, result = measure_time(special_user_matcher.match_special_users, batch, special_users, use_numpy,
+                                       repeat=args.repeat)
+        if result != expected or list(result) != list(expected):
+            print(f"  ⚠ {label}: 照合結果が一致しません")
+        print(f"  新: {label:<26} {elapsed:8.3f}秒 (旧比 {legacy_time / elapsed:.1f}倍)")
+
+
+SYNTHETIC_DETAIL_TEMPLATE_HEAD = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="UTF-8">
+<title>{{user_name}} - コメント分析</title>
+<link rel="stylesheet" href="css/main.css">
+<style>
+"""
+
+SYNTHETIC_DETAIL_TEMPLATE_BODY = """</style>
+</head>
+<body>
+<h1>{{broadcast_title}}</h1>
+<p class="start-time">{{start_time}}</p>
+<div class="user-info">
+  <img src="{{user_avatar}}" alt="{{user_name}}">
+  <a href="{{user_profile_url}}" target="_blank">{{user_name}} ({{user_id}})</a>
+</div>
+<table class="comment-table">
+<thead><tr><th>番号</th><th>配信内時間</th><th>日時</th><th>コメント</th></tr></thead>
+<tbody>
+{{comment_rows}}
+</tbody>
+</table>
+<div class="analysis">{{analysis_text}}</div>
+<script src="js/ui-controls.js"></script>
+</body>
+</html>
+"""
+
+
+def write_synthetic_detail_template(template_dir, css_rules=400):
+    """user_detail.html と同じ変数を使う合成テンプレート（CSSで実物程度の大きさにする）"""
+    css = "\n".join(f".rule-{i} {{ margin: {i % 20}px; color: #{i:06x}; }}" for i in range(css_rules))
+    with open(os.path.join(template_dir, 'user_detail.html'), 'w', encoding='utf-8') as f:
+        f.write(SYNTHETIC_DETAIL_TEMPLATE_HEAD + css + "\n" + SYNTHETIC_DETAIL_TEMPLATE_BODY)
+
+
+def legacy_render_detail(template_dir, context):
+    """旧実装: ユーザーごとにテンプレートを読み込み、str.replace を変数の数だけ繰り返す"""
+    with open(os.path.join(template_dir, 'user_detail.html'), 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    for name, value in context.items():
+        html_content = html_content.replace('{{' + name + '}}', value)
+    return html_content
+
+
+def bench_step03_templates(args):
+    """Step03 テンプレート描画: 毎回読み込み + str.replace（旧）とキャッシュ済みテンプレート（jinja2 / 単純置換）の比較"""
+    with tempfile.TemporaryDirectory() as template_dir:
+        write_synthetic_detail_template(template_dir)
+        template_kb = os.path.getsize(os.path.join(template_dir, 'user_detail.html')) / 1024
+
+        start_time = 1700000000
+        rng = random.Random(1)
+        contexts = []
+        for user_index in range(args.users):
+            user_id = str(10000000 + user_index)
+            comments = [{'date': start_time + i * 7, 'text': f"コメント{i} " + "w" * rng.randint(1, 30)}
+                        for i in range(args.comments)]
+            contexts.append({
+                'broadcast_title': f'<a href="https://live.nicovideo.jp/watch/lv1">放送タイトル{user_index}</a>',
+                'start_time': step03_html_generator.format_start_time(start_time),
+                'user_avatar': step03_html_generator.get_user_icon_path(user_id),
+                'user_name': f"ユーザー{user_index}",
+                'user_profile_url': f"https://www.nicovideo.jp/user/{user_id}",
+                'user_id': user_id,
+                'comment_rows': step03_html_generator.generate_comment_rows(comments, str(start_time)),
+                'analysis_text': "<h2>分析</h2><br>" + "傾向の説明。" * 200
+            })
+        page_kb = sum(len(context['comment_rows']) for context in contexts) / args.users / 1024
+        print(f"Step03 テンプレート描画: {args.users}ユーザー x コメント{args.comments}件 "
+              f"(テンプレート{template_kb:.0f}KB, コメント行{page_kb:.0f}KB/ユーザー)")
+
+        html_keys = ('broadcast_title', 'comment_rows', 'analysis_text')
+
+        def legacy():
+            return [legacy_render_detail(template_dir, context) for context in contexts]
+
+        def cached():
+            template_renderer.clear_template_cache()
+            return [template_renderer.render_template(
+                template_dir, 'user_detail.html',
+                **{key: template_renderer.SafeHTML(value) if key in html_keys else value
+                   for key, value in context.items()}
+            ) for context in contexts]
+
+        legacy_time, expected = measure_time(legacy, repeat=args.repeat)
+        print(f"  旧: 毎回読み込み + str.replace x8   {legacy_time * 1000:8.1f}ms "
+              f"({legacy_time / args.users * 1000:.2f}ms/ユーザー)")
+
+        variants = [("単純置換（分割済みテンプレート）", None)]
+        if template_renderer.jinja2 is not None:
+            variants.insert(0, ("jinja2（自動エスケープ）", template_renderer.jinja2))
+        else:
+            print("  jinja2未インストールのためjinja2版は省略")
+        for label, engine in variants:
+            saved_engine = template_renderer.jinja2
+            template_renderer.jinja2 = engine
+            try:
+                elapsed, result = measure_time(cached, repeat=args.repeat)
+            finally:
+                template_renderer.jinja2 = saved_engine
+                template_renderer.clear_template_cache()
+            if result != expected:
+                print(f"  ⚠ {label}: 描画結果が一致しません")
+            print(f"  新: {label}  {elapsed * 1000:8.1f}ms "
+                  f"({elapsed / args.users * 1000:.2f}ms/ユーザー, 旧比 {legacy_time / elapsed:.2f}倍)")
+
+
+SYNTHETIC_LIST_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="UTF-8"><title>{{broadcaster_name}} - 配信一覧</title></head>
+<body>
+<img src="{{thumbnail_url}}">
+<section class="broadcast-list">
+{{broadcast_items}}
+</section>
+</body>
+</html>
+"""
+
+
+def bench_step03_list(args):
+    """Step03 一覧ページ: コメント表を埋め込む（旧）と遅延読み込み（comments/{lv}.js）で、履歴の増加に伴う更新時間とページサイズを比較"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_dir = os.path.join(tmp_dir, "templates")
+        os.makedirs(template_dir)
+        with open(os.path.join(template_dir, 'user_list.html'), 'w', encoding='utf-8') as f:
+            f.write(SYNTHETIC_LIST_TEMPLATE)
+
+        start_time = 1700000000
+        user_data = {
+            'user_id': '10000000',
+            'user_name': 'ユーザー',
+            'comments': [{'date': start_time + i * 7, 'text': f"コメント{i} " + "w" * (i % 30)}
+                         for i in range(args.comments)]
+        }
+        broadcast_info = {'live_title': '放送タイトル', 'start_time': str(start_time)}
+        print(f"Step03 一覧ページ: 放送{args.broadcasts}件 x コメント{args.comments}件")
+
+        for label, lazy in (("旧: コメント表を埋め込み", False), ("新: 遅延読み込み", True)):
+            output_dir = os.path.join(tmp_dir, "lazy" if lazy else "inline")
+            os.makedirs(output_dir)
+            config = {'list_page_settings': {'lazy_comment_tables': lazy}}
+            elapsed = []
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                for i in range(args.broadcasts):
+                    started = time.perf_counter()
+                    step03_html_generator.update_user_list_page(
+                        user_data, broadcast_info, template_dir, output_dir, f"lv{i}", "sub", config
+                    )
+                    elapsed.append(time.perf_counter() - started)
+
+            sample = max(1, min(10, args.broadcasts // 4))
+            page_kb = os.path.getsize(os.path.join(output_dir, "list.html")) / 1024
+            print(f"  {label}: 更新 最初{sample}件 {sum(elapsed[:sample]) / sample * 1000:.2f}ms → "
+                  f"最後{sample}件 {sum(elapsed[-sample:]) / sample * 1000:.2f}ms, list.html {page_kb:,.0f}KB")
+
+
+def legacy_copy_static_files(template_dir, output_dir):
+    """旧実装: css / js / assets を毎回 shutil.copytree でコピー"""
+    for static_dir in static_assets.STATIC_DIRS:
+        source = os.path.join(template_dir, static_dir)
+        if os.path.exists(source):
+            shutil.copytree(source, os.path.join(output_dir, static_dir), dirs_exist_ok=True)
+
+
+def disk_usage(root):
+    """root以下のファイルの実サイズ合計（ハードリンクは1回だけ数える）"""
+    seen = set()
+    total = 0
+    for current_dir, _, filenames in os.walk(root):
+        for filename in filenames:
+            stat = os.stat(os.path.join(current_dir, filename))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def bench_step03_assets(args):
+    """Step03 静的ファイル: 毎回copytree（旧）と共有ファイル + ハードリンク + マニフェスト（新）の比較"""
+    template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_kb = disk_usage(os.path.join(template_dir, 'css')) + disk_usage(os.path.join(template_dir, 'js'))
+        print(f"Step03 静的ファイル: {args.users}ユーザー (テンプレートの静的ファイル{source_kb / 1024:.0f}KB)")
+
+        legacy_root = os.path.join(tmp_dir, "legacy")
+        user_dirs = [os.path.join(legacy_root, f"{10000000 + i}_user") for i in range(args.users)]
+        for run in ("1回目", "2回目"):
+            started = time.perf_counter()
+            for user_dir in user_dirs:
+                legacy_copy_static_files(template_dir, user_dir)
+            print(f"  旧: copytree {run}                 {time.perf_counter() - started:7.3f}秒")
+        print(f"      ディスク使用量 {disk_usage(legacy_root) / 1024:,.0f}KB")
+
+        new_root = os.path.join(tmp_dir, "new")
+        store_dir = os.path.join(new_root, "AssetStore")
+        user_dirs = [os.path.join(new_root, f"{10000000 + i}_user") for i in range(args.users)]
+        for run in ("1回目", "2回目（別プロセス相当）", "3回目（同一プロセス）"):
+            if run.startswith("2回目"):
+                static_assets._synced_dirs.clear()
+            started = time.perf_counter()
+            totals = {"linked": 0, "copied": 0, "skipped": 0}
+            for user_dir in user_dirs:
+                for key, count in static_assets.sync_static_files(template_dir, user_dir, store_dir).items():
+                    totals[key] += count
+            print(f"  新: {run:<24} {time.perf_counter() - started:7.3f}秒 "
+                  f"(リンク{totals['linked']}, コピー{totals['copied']}, スキップ{totals['skipped']})")
+        print(f"      ディスク使用量 {disk_usage(new_root) / 1024:,.0f}KB")
+
+
+def read_step03_outputs(root):
+    """出力ディレクトリ以下の全ファイル {相対パス: 内容}（実行時刻の created_at / updated_at は除く）"""
+    outputs = {}
+    for current_dir, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(current_dir, filename)
+            with open(path, 'rb') as f:
+                content = f.read()
+            if filename == "data.json":
+                data = json.loads(content)
+                data['metadata'].pop('created_at', None)
+                content = json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            elif filename == broadcast_index.INDEX_FILENAME:
+                lines = []
+                for line in content.decode('utf-8').splitlines():
+                    entry = json.loads(line)
+                    entry.pop('updated_at', None)
+                    lines.append(json.dumps(entry, ensure_ascii=False, sort_keys=True))
+                content = "\n".join(lines).encode('utf-8')
+            outputs[os.path.relpath(path, root)] = content
+    return outputs
+
+
+def bench_step03_parallel(args):
+    """Step03 ユーザーごとのHTML・JSON生成: 逐次と並列（スレッドプール）の時間比較と、出力がバイト単位で一致するかの確認"""
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start_time = 1700000000
+    rng = random.Random(1)
+    users = []
+    for user_index in range(args.users):
+        comments = [{'no': str(i + 1), 'date': str(start_time + i * 7), 'text': f"コメント{i} <b>" + "w" * rng.randint(1, 30)}
+                    for i in range(rng.randint(1, args.comments))]
+        users.append({
+            'user_id': str(10000000 + user_index),
+            'user_name': f"ユーザー{user_index}",
+            'comments': comments,
+            'ai_analysis': "<h2>分析</h2><br>" + "傾向の説明。" * 100
+        })
+    print(f"Step03 並列生成: {args.users}ユーザー x 放送{args.broadcasts}件 (コメント最大{args.comments}件/ユーザー, CPU {os.cpu_count()})")
+
+    saved_cwd = os.getcwd()
+    saved_template_dir = step03_html_generator.TEMPLATE_DIR
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_dir = os.path.join(tmp_dir, "templates")
+        os.makedirs(template_dir)
+        write_synthetic_detail_template(template_dir)
+        with open(os.path.join(template_dir, 'user_list.html'), 'w', encoding='utf-8') as f:
+            f.write(SYNTHETIC_LIST_TEMPLATE)
+        for static_dir in static_assets.STATIC_DIRS:
+            source = os.path.join(repo_dir, 'templates', static_dir)
+            if os.path.exists(source):
+                shutil.copytree(source, os.path.join(template_dir, static_dir))
+
+        results = {}
+        try:
+            step03_html_generator.TEMPLATE_DIR = template_dir
+            for label, workers in (("逐次", 1), (f"並列{args.workers}スレッド", args.workers)):
+                run_dir = os.path.join(tmp_dir, f"workers{workers}")
+                os.makedirs(run_dir)
+                os.chdir(run_dir)
+                template_renderer.clear_template_cache()
+                static_assets._synced_dirs.clear()
+                config = {'list_page_settings': {'lazy_comment_tables': True}}
+                elapsed = 0.0
+                generated = []
+                with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                    for i in range(args.broadcasts):
+                        broadcast_info = {'live_title': f'放送タイトル{i} & <テスト>', 'start_time': str(start_time)}
+                        started = time.perf_counter()
+                        user_files = step03_html_generator.render_users(
+                            users, broadcast_info, f"lv{i}", f"sub{i}", config, max_workers=workers
+                        )
+                        elapsed += time.perf_counter() - started
+                        generated.append([user_files[user_data['user_id']] for user_data in users])
+                os.chdir(saved_cwd)
+                results[label] = (generated, read_step03_outputs(run_dir))
+                print(f"  {label:<12} {elapsed:7.3f}秒 ({elapsed / args.broadcasts / args.users * 1000:.2f}ms/ユーザー/放送)")
+        finally:
+            os.chdir(saved_cwd)
+            step03_html_generator.TEMPLATE_DIR = saved_template_dir
+            template_renderer.clear_template_cache()
+
+        (serial_files, serial_outputs), (parallel_files, parallel_outputs) = results.values()
+        mismatched = sorted(path for path in serial_outputs.keys() | parallel_outputs.keys()
+                            if serial_outputs.get(path) != parallel_outputs.get(path))
+        if mismatched or serial_files != parallel_files:
+            print(f"  ⚠ 逐次と並列の出力が一致しません: {len(mismatched)}ファイル (例: {mismatched[:3]})")
+            return 1
+        print(f"  出力一致: {len(serial_outputs)}ファイル（data.json の created_at、索引の updated_at を除きバイト単位で比較）")
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NCVパイプライン ベンチマーク")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    step01_parser = subparsers.add_parser("step01", help="Step01 XML解析")
+    step01_parser.add_argument("--comments", type=int, default=200000)
+    step01_parser.set_defaults(func=bench_step01)
+
+    fastpath_parser = subparsers.add_parser("step01-fastpath", help="Step01 <chat>属性変換方式の比較")
+    fastpath_parser.add_argument("--comments", type=int, default=500000)
+    fastpath_parser.add_argument("--malformed", type=float, default=0.001, help="数値属性が不正な行の割合")
+    fastpath_parser.add_argument("--repeat", type=int, default=3)
+    fastpath_parser.set_defaults(func=bench_step01_fastpath)
+
+    scheduler_parser = subparsers.add_parser("ai-scheduler", help="AIスケジューラ（擬似API）")
+    scheduler_parser.add_argument("--requests", type=int, default=200)
+    scheduler_parser.add_argument("--latency", type=float, default=0.05, help="擬似APIの応答時間（秒）")
+    scheduler_parser.add_argument("--concurrency", type=int, default=4)
+    scheduler_parser.add_argument("--rpm", type=int, default=0, help="分間リクエスト上限（0は無制限）")
+    scheduler_parser.add_argument("--rate-limit-ratio", type=float, default=0.05, help="429を返す割合")
+    scheduler_parser.add_argument("--backoff", type=float, default=0.05, help="バックオフの基準秒数")
+    scheduler_parser.set_defaults(func=bench_ai_scheduler)
+
+    clients_parser = subparsers.add_parser("ai-clients", help="Step02 OpenAIクライアントの再利用（擬似エンドポイント）")
+    clients_parser.add_argument("--requests", type=int, default=200)
+    clients_parser.set_defaults(func=bench_ai_clients)
+
+    normalizer_parser = subparsers.add_parser("ai-normalizer", help="AI応答の後処理（Markdown → HTML）")
+    normalizer_parser.add_argument("--responses", type=int, default=2000)
+    normalizer_parser.add_argument("--lines", type=int, default=20, help="1件あたりの行数")
+    normalizer_parser.add_argument("--repeat", type=int, default=5)
+    normalizer_parser.set_defaults(func=bench_ai_normalizer)
+
+    match_parser = subparsers.add_parser("special-match", help="Step02 スペシャルユーザー照合")
+    match_parser.add_argument("--comments", type=int, default=1000000)
+    match_parser.add_argument("--users", type=int, default=20000, help="放送に出現するユーザー数")
+    match_parser.add_argument("--special", type=int, default=1000, help="監視対象のユーザー数")
+    match_parser.add_argument("--repeat", type=int, default=3)
+    match_parser.set_defaults(func=bench_special_match)
+
+    templates_parser = subparsers.add_parser("step03-templates", help="Step03 テンプレート描画")
+    templates_parser.add_argument("--users", type=int, default=100)
+    templates_parser.add_argument("--comments", type=int, default=1000, help="1ユーザーあたりのコメント数")
+    templates_parser.add_argument("--repeat", type=int, default=3)
+    templates_parser.set_defaults(func=bench_step03_templates)
+
+    list_parser = subparsers.add_parser("step03-list", help="Step03 一覧ページ（コメント表の遅延読み込み）")
+    list_parser.add_argument("--broadcasts", type=int, default=200)
+    list_parser.add_argument("--comments", type=int, default=100, help="1放送あたりのコメント数")
+    list_parser.set_defaults(func=bench_step03_list)
+
+    assets_parser = subparsers.add_parser("step03-assets", help="Step03 静的ファイルの配置")
+    assets_parser.add_argument("--users", type=int, default=200)
+    assets_parser.set_defaults(func=bench_step03_assets)
+
+    parallel_parser = subparsers.add_parser("step03-parallel", help="Step03 ユーザーごとの並列生成")
+    parallel_parser.add_argument("--users", type=int, default=50)
+    parallel_parser.add_argument("--broadcasts", type=int, default=3)
+    parallel_parser.add_argument("--comments", type=int, default=200)
+    parallel_parser.add_argument("--workers", type=int, default=4)
+    parallel_parser.set_defaults(func=bench_step03_parallel)
+
+    args = parser.parse_args()
+    # 出力の一致を確認する計測（step03-parallel）は不一致なら終了コード1
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()